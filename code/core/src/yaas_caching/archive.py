@@ -0,0 +1,439 @@
+# vim: ai:sw=4:ts=4:sta:et:fo=croql
+"""Cold archive tier: archived requests are kept apart from the store holding current requests, the *hot* store,
+one compressed segment per month, either in `Google Cloud Storage`_ or in a local directory::
+    <archive location>/<YYYY-MM>.bin.gz
+
+Usage::
+    store = ColdArchiveStoreContextManager(
+        hot=gcs.GcsObjectStoreContextManager(bucket_name="my-bucket", db_object_path="cache/event_cache.db"),
+        archive_location="gs://my-bucket/cache/event_cache_archive",
+    )
+    async with store:
+        # only the segments overlapping the range are read
+        archived = await store.read(start_ts_utc=0, end_ts_utc=now, is_archive=True)
+
+.. _Google Cloud Storage: https://cloud.google.com/storage
+"""
+import abc
+import gzip
+import os
+import pathlib
+import re
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, List, Optional, Set, Tuple
+
+import aiofiles
+
+from yaas_caching import base, event
+from yaas_common import codec, logger, request
+from yaas_gcp import gcs
+
+_LOGGER = logger.get(__name__)
+
+_SEGMENT_KEY_FORMAT: str = "%Y-%m"
+_SEGMENT_SUFFIX: str = ".bin.gz"
+"""
+Segments are :py:func:`codec.encode_requests` content, gzip compressed.
+"""
+_DEFAULT_MAX_CONFLICT_RETRIES: int = 5
+
+
+class _SegmentChangedError(base.StoreError):
+    """The segment changed between being read and written."""
+
+
+def _segment_key(value: int) -> str:
+    return datetime.fromtimestamp(value, tz=timezone.utc).strftime(_SEGMENT_KEY_FORMAT)
+
+
+def _segment_range(key: str) -> Tuple[int, int]:
+    """Returns the inclusive range of timestamps, in seconds, covered by the segment."""
+    start = datetime.strptime(key, _SEGMENT_KEY_FORMAT).replace(tzinfo=timezone.utc)
+    end = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return int(start.timestamp()), int(end.timestamp()) - 1
+
+
+def _encode_segment(value: List[request.ScaleRequest]) -> bytes:
+    return gzip.compress(codec.encode_requests(sorted(value, key=lambda req: req.timestamp_utc)))
+
+
+def _decode_segment(value: bytes) -> List[request.ScaleRequest]:
+    result, _ = codec.decode_requests(gzip.decompress(value))
+    return result
+
+
+class _Segments(abc.ABC):
+    """Where the segments are kept, content is read and written as stored, see :py:data:`_SEGMENT_SUFFIX`."""
+
+    @property
+    @abc.abstractmethod
+    def location(self) -> str:
+        """Human readable location."""
+
+    @abc.abstractmethod
+    async def names(self) -> List[str]:
+        """Names, without any prefix, of all existing objects or files."""
+
+    @abc.abstractmethod
+    async def read(self, name: str) -> Tuple[Optional[bytes], Optional[int]]:
+        """Returns the content, :py:obj:`None` if it does not exist, and its version, if supported."""
+
+    @abc.abstractmethod
+    async def write(self, name: str, content: Optional[bytes], *, version: Optional[int] = None) -> None:
+        """Writes the content, or deletes it if :py:obj:`None`,
+        raising :py:class:`_SegmentChangedError` if it is no longer at ``version``."""
+
+
+class _LocalSegments(_Segments):
+    """Files in a local directory, each one replaced atomically."""
+
+    def __init__(self, directory: pathlib.Path):
+        self._directory = directory
+
+    @property
+    def location(self) -> str:
+        return str(self._directory)
+
+    async def names(self) -> List[str]:
+        result = []
+        if self._directory.exists():
+            result = [path.name for path in self._directory.iterdir() if path.is_file()]
+        return result
+
+    async def read(self, name: str) -> Tuple[Optional[bytes], Optional[int]]:
+        path = self._directory / name
+        content = None
+        if path.exists():
+            async with aiofiles.open(path, "rb") as in_file:
+                content = await in_file.read()
+        return content, None
+
+    async def write(self, name: str, content: Optional[bytes], *, version: Optional[int] = None) -> None:
+        path = self._directory / name
+        if content is None:
+            path.unlink(missing_ok=True)
+            return
+        self._directory.mkdir(parents=True, exist_ok=True)
+        # pylint: disable=consider-using-with
+        tmp_file = pathlib.Path(tempfile.NamedTemporaryFile(dir=self._directory, delete=False).name)
+        # pylint: enable=consider-using-with
+        try:
+            async with aiofiles.open(tmp_file, "wb") as out_file:
+                await out_file.write(content)
+            os.replace(tmp_file, path)
+        except Exception as err:
+            tmp_file.unlink(missing_ok=True)
+            raise RuntimeError(
+                f"Could not write archive segment {path}, its content is unchanged. Error: {err}"
+            ) from err
+
+
+class _GcsSegments(_Segments):
+    """Objects under a prefix in a bucket, versioned by their `generation`_.
+
+    .. _generation: https://cloud.google.com/storage/docs/metadata#generation-number
+    """
+
+    def __init__(self, *, bucket_name: str, object_prefix: str, project: Optional[str] = None):
+        self._bucket_name = gcs.validate_and_clean_bucket_name(bucket_name)
+        self._object_prefix = gcs.validate_and_clean_object_path(object_prefix)
+        self._project = project
+
+    @property
+    def location(self) -> str:
+        return f"gs://{self._bucket_name}/{self._object_prefix}"
+
+    def _object_path(self, name: str) -> str:
+        return f"{self._object_prefix}{gcs.GCS_PATH_SEP}{name}"
+
+    async def names(self) -> List[str]:
+        prefix = f"{self._object_prefix}{gcs.GCS_PATH_SEP}"
+        return [
+            blob.name[len(prefix) :]
+            for blob in gcs.list_objects(bucket_name=self._bucket_name, prefix=prefix, project=self._project)
+            if blob.name.startswith(prefix)
+        ]
+
+    async def read(self, name: str) -> Tuple[Optional[bytes], Optional[int]]:
+        object_path = self._object_path(name)
+        metadata = gcs.read_object_metadata(
+            bucket_name=self._bucket_name, object_path=object_path, project=self._project
+        )
+        if metadata is None:
+            return None, 0
+        content = gcs.read_object(
+            bucket_name=self._bucket_name,
+            object_path=object_path,
+            project=self._project,
+            warn_read_failure=False,
+            generation=metadata.generation,
+        )
+        if content is None:
+            raise _SegmentChangedError(f"Generation {metadata.generation} of '{object_path}' is no longer available")
+        return content, metadata.generation
+
+    async def write(self, name: str, content: Optional[bytes], *, version: Optional[int] = None) -> None:
+        object_path = self._object_path(name)
+        try:
+            if content is None:
+                if version:
+                    gcs.delete_object(
+                        bucket_name=self._bucket_name,
+                        object_path=object_path,
+                        project=self._project,
+                        if_generation_match=version,
+                    )
+            else:
+                gcs.write_object(
+                    bucket_name=self._bucket_name,
+                    object_path=object_path,
+                    content_source=content,
+                    project=self._project,
+                    if_generation_match=version,
+                )
+        except gcs.PreconditionFailedError as err:
+            raise _SegmentChangedError(f"Object '{object_path}' changed concurrently. Error: {err}") from err
+
+
+class ColdArchiveStoreContextManager(base.StoreContextManager):
+    """Keeps current requests in a ``hot`` store and archived requests in monthly segments,
+    so the hot store, e.g., the object downloaded on every request, only holds upcoming and recent requests.
+
+    Archiving reads the range from ``hot``, merges it into the segments, and only then removes it from ``hot``,
+    so requests are never lost, at worst they are merged again, which is a no-op.
+    Requests archived, by previous versions, inside ``hot`` are moved into the segments in the same way.
+    Reading the archive, or removing from it, only touches the segments overlapping the range,
+    and the segments are only listed the first time the archive is used.
+
+    Segments are encoded with :py:mod:`yaas_common.codec`, each distinct string is stored once,
+    and gzip compressed. In Cloud Storage, each segment is rewritten only if its `generation`_ is still
+    the one read (``if_generation_match``), otherwise it is read and merged again.
+
+    .. _generation: https://cloud.google.com/storage/docs/metadata#generation-number
+    """
+
+    def __init__(
+        self,
+        *,
+        hot: base.StoreContextManager,
+        archive_location: str,
+        project: Optional[str] = None,
+        max_conflict_retries: Optional[int] = None,
+        source: Optional[str] = None,
+        **kwargs,
+    ):
+        if not isinstance(hot, base.StoreContextManager):
+            raise TypeError(f"Hot store must be a {base.StoreContextManager.__name__}. Got: '{hot}'({type(hot)})")
+        if not isinstance(archive_location, str) or not archive_location.strip():
+            raise ValueError(
+                f"Archive location must be a non-empty string. Got: '{archive_location}'({type(archive_location)})"
+            )
+        if max_conflict_retries is None:
+            max_conflict_retries = _DEFAULT_MAX_CONFLICT_RETRIES
+        if not isinstance(max_conflict_retries, int) or max_conflict_retries < 0:
+            raise ValueError(
+                "Maximum conflict retries must be an integer >= 0. "
+                f"Got: '{max_conflict_retries}'({type(max_conflict_retries)})"
+            )
+        if source is None:
+            source = hot.source
+        super().__init__(source=source, **kwargs)
+        self._hot = hot
+        self._segments = _segments_from_location(archive_location.strip(), project=project)
+        self._max_conflict_retries = max_conflict_retries
+        self._segment_keys: Optional[Set[str]] = None
+
+    @property
+    def hot(self) -> base.StoreContextManager:
+        """Where current requests are kept."""
+        return self._hot
+
+    @property
+    def archive_location(self) -> str:
+        """Where the archive segments are kept."""
+        return self._segments.location
+
+    async def archive_segment_keys(
+        self, *, start_ts_utc: Optional[int] = None, end_ts_utc: Optional[int] = None
+    ) -> List[str]:
+        """Sorted keys, in the format ``YYYY-MM``, of all archive segments overlapping the range."""
+        if self._segment_keys is None:
+            self._segment_keys = await self._list_segment_keys()
+        result = []
+        for key in sorted(self._segment_keys):
+            segment_start, segment_end = _segment_range(key)
+            if (start_ts_utc is None or segment_end >= start_ts_utc) and (
+                end_ts_utc is None or segment_start <= end_ts_utc
+            ):
+                result.append(key)
+        return result
+
+    async def _list_segment_keys(self) -> Set[str]:
+        name_regex = re.compile(rf"^(?P<key>\d{{4}}-\d{{2}}){re.escape(_SEGMENT_SUFFIX)}$")
+        result = set()
+        for name in await self._segments.names():
+            match = name_regex.match(name)
+            if match:
+                try:
+                    _segment_range(match.group("key"))
+                    result.add(match.group("key"))
+                except ValueError as err:
+                    _LOGGER.warning("Ignoring '%s', it is not a valid archive segment. Error: %s", name, err)
+        _LOGGER.debug("Found %d archive segments in '%s'", len(result), self.archive_location)
+        return result
+
+    async def _read_segment(self, key: str) -> List[request.ScaleRequest]:
+        content, _ = await self._segments.read(f"{key}{_SEGMENT_SUFFIX}")
+        return _decode_segment(content) if content else []
+
+    async def _update_segment(
+        self, key: str, func: Callable[[List[request.ScaleRequest]], List[request.ScaleRequest]]
+    ) -> None:
+        """Rewrites the segment with the result of ``func`` on its current content, retrying on concurrent changes.
+        An empty result deletes the segment."""
+        name = f"{key}{_SEGMENT_SUFFIX}"
+        for attempt in range(self._max_conflict_retries + 1):
+            try:
+                content, version = await self._segments.read(name)
+                existing = _decode_segment(content) if content else []
+                value = func(existing)
+                if value != existing:
+                    await self._segments.write(name, _encode_segment(value) if value else None, version=version)
+                break
+            except _SegmentChangedError as err:
+                if attempt >= self._max_conflict_retries:
+                    raise base.StoreError(
+                        f"Archive segment '{name}' in '{self.archive_location}' kept changing concurrently, "
+                        f"gave up after {attempt + 1} attempts. Error: {err}"
+                    ) from err
+                _LOGGER.info("Archive segment '%s' changed concurrently, retrying. Error: %s", name, err)
+        if self._segment_keys is not None:
+            if value:
+                self._segment_keys.add(key)
+            else:
+                self._segment_keys.discard(key)
+
+    async def _merge_into_segments(self, value: List[request.ScaleRequest]) -> None:
+        key_to_requests = {}
+        for req in value:
+            key_to_requests.setdefault(_segment_key(req.timestamp_utc), []).append(req)
+        for key, request_lst in sorted(key_to_requests.items()):
+
+            def merge(
+                existing: List[request.ScaleRequest], to_add: List[request.ScaleRequest] = request_lst
+            ) -> List[request.ScaleRequest]:
+                known = set(existing)
+                return existing + [req for req in dict.fromkeys(to_add) if req not in known]
+
+            await self._update_segment(key, merge)
+
+    async def _open(self) -> None:
+        await self._hot.__aenter__()  # pylint: disable=unnecessary-dunder-call
+
+    async def _close(self) -> None:
+        self._segment_keys = None
+        await self._hot.__aexit__(None, None, None)
+
+    async def _flush(self) -> None:
+        await self._hot.flush()
+
+    async def _refresh(self) -> bool:
+        self._segment_keys = None
+        return await self._hot.refresh()
+
+    async def _read(
+        self,
+        *,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+        is_archive: Optional[bool] = False,
+    ) -> event.EventSnapshot:
+        if not is_archive:
+            return await self._hot.read(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc)
+        result = (
+            await self._hot.read(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, is_archive=True)
+        ).all_requests()
+        for key in await self.archive_segment_keys(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc):
+            for req in await self._read_segment(key):
+                if (start_ts_utc is None or req.timestamp_utc >= start_ts_utc) and (
+                    end_ts_utc is None or req.timestamp_utc <= end_ts_utc
+                ):
+                    result.append(req)
+        return self._snapshot_from_request_lst(result)
+
+    async def _read_iter(
+        self,
+        *,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+        is_archive: Optional[bool] = False,
+        batch_size: int,
+    ) -> AsyncIterator[List[request.ScaleRequest]]:
+        if is_archive:
+            async for batch in super()._read_iter(
+                start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, is_archive=True, batch_size=batch_size
+            ):
+                yield batch
+        else:
+            async for batch in self._hot.read_iter(
+                start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, batch_size=batch_size
+            ):
+                yield batch
+
+    async def _write(
+        self,
+        value: event.EventSnapshot,
+    ) -> None:
+        await self._hot.write(value, overwrite_within_range=False)
+
+    async def _remove_requests(self, value: List[request.ScaleRequest]) -> None:
+        await self._hot.apply(event.EventSnapshotDiff(to_remove=self._snapshot_from_request_lst(value)))
+
+    async def _remove(
+        self,
+        *,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+        is_archive: Optional[bool] = False,
+    ) -> event.EventSnapshot:
+        result = await self._hot.remove(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, is_archive=is_archive)
+        if not is_archive:
+            return result
+        key_to_removed = {}
+        for key in await self.archive_segment_keys(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc):
+
+            def remove_in_range(existing: List[request.ScaleRequest], key=key) -> List[request.ScaleRequest]:
+                # it is called again if the segment changed concurrently
+                key_to_removed[key] = [req for req in existing if start_ts_utc <= req.timestamp_utc <= end_ts_utc]
+                return [req for req in existing if not start_ts_utc <= req.timestamp_utc <= end_ts_utc]
+
+            await self._update_segment(key, remove_in_range)
+        removed = result.all_requests() + [req for req_lst in key_to_removed.values() for req in req_lst]
+        return self._snapshot_from_request_lst(removed)
+
+    async def _archive(
+        self, *, start_ts_utc: Optional[int] = None, end_ts_utc: Optional[int] = None
+    ) -> event.EventSnapshot:
+        to_archive = (await self._hot.read(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc)).all_requests()
+        # archived inside hot, e.g., by previous versions
+        legacy = (await self._hot.read(start_ts_utc=1, end_ts_utc=end_ts_utc, is_archive=True)).all_requests()
+        await self._merge_into_segments(to_archive + legacy)
+        result = await self._hot.remove(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc)
+        if legacy:
+            await self._hot.remove(start_ts_utc=1, end_ts_utc=end_ts_utc, is_archive=True)
+            _LOGGER.info(
+                "Moved %d requests archived in '%s' into '%s'", len(legacy), self.source, self.archive_location
+            )
+        return result
+
+
+def _segments_from_location(value: str, *, project: Optional[str] = None) -> _Segments:
+    if value.startswith("gs://"):
+        bucket_name, object_prefix = gcs.get_bucket_and_prefix_from_uri(value)
+        if not object_prefix:
+            raise ValueError(f"Archive location '{value}' must have a prefix after the bucket name")
+        result = _GcsSegments(bucket_name=bucket_name, object_prefix=object_prefix, project=project)
+    else:
+        result = _LocalSegments(pathlib.Path(value).absolute())
+    return result
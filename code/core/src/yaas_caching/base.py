@@ -6,9 +6,10 @@ import contextlib
 import fcntl
 import pathlib
 import threading
+import time
 import types
 from datetime import datetime, timedelta
-from typing import Any, Callable, List, Optional, Tuple, Type, Union
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple, Type, Union
 
 from yaas_caching import event
 from yaas_common import const, logger, request
@@ -19,7 +20,16 @@ _LOGGER = logger.get(__name__)
 _DEFAULT_END_TS_FROM_NOW_IN_DAYS: int = 7
 _MAXIMUM_END_TS_FROM_NOW_IN_DAYS: int = 30
 _DEFAULT_LOCK_TIMEOUT_IN_SEC: int = 30
-_LOCK_SLEEP_STEP_IN_SEC: int = 1
+_FILE_LOCK_MIN_BACKOFF_IN_SEC: float = 0.01
+_FILE_LOCK_MAX_BACKOFF_IN_SEC: float = 0.1
+"""
+Bounds of the exponential backoff between non-blocking :py:func:`fcntl.flock` attempts,
+while another process holds the lock file.
+"""
+DEFAULT_READ_BATCH_SIZE: int = 1000
+"""
+How many requests, at most, are yielded at once by :py:meth:`StoreContextManager.read_iter`.
+"""
 
 
 def _default_start_ts_utc() -> int:
@@ -49,8 +59,24 @@ class StoreLockTimeoutError(StoreError):
     """Encodes timeouts when dealing with file locks."""
 
 
+class _LockAttempt:
+    """Shared between the waiting coroutine and the worker thread acquiring the lock,
+    guarded by :py:attr:`FileBasedLockContextManager._condition`."""
+
+    def __init__(self):
+        self.is_acquired = False
+        self.is_abandoned = False
+
+
 class FileBasedLockContextManager(contextlib.AbstractAsyncContextManager):
-    """Creates a local file based lock mechanism."""
+    """Creates a local file based lock mechanism.
+
+    Entering it, e.g. ``async with lock:``, is exclusive (writer),
+    while ``async with lock.shared():`` is shared (reader), i.e., it only excludes writers.
+    In-process waiters are woken up as soon as the lock is released,
+    while the lock file, held by other processes, is polled with a non-blocking :py:func:`fcntl.flock`,
+    so no worker thread outlives ``lock_timeout_in_sec``.
+    """
 
     def __init__(
         self,
@@ -71,14 +97,18 @@ class FileBasedLockContextManager(contextlib.AbstractAsyncContextManager):
         # pylint: disable=consider-using-with
         self._open_lock_file = open(self._lock_file, "w", encoding=const.ENCODING_UTF8)
         # pylint: enable=consider-using-with
-        self._thread_lock = threading.Lock()
+        # in-process state, the file lock is held while there is a writer or at least one reader
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._is_writer = False
+        self._waiting_writers = 0
+        self._is_acquiring = False
 
     def __del__(self):
         # This is for a clean delete in case the object hasn't been successfully created
-        if getattr(self, "_lock_file", None):
-            self._unlock()
-            if getattr(self, "_open_lock_file", None):
-                self._open_lock_file.close()
+        if getattr(self, "_open_lock_file", None):
+            # closing the file releases the lock, if held
+            self._open_lock_file.close()
 
     @property
     def lock_file(self) -> pathlib.Path:
@@ -92,81 +122,202 @@ class FileBasedLockContextManager(contextlib.AbstractAsyncContextManager):
         return self._lock_timeout_in_sec
 
     def is_locked(self) -> bool:
-        """Based on the internal thread lock."""
-        return self._thread_lock.locked()
+        """Based on the internal state, :py:obj:`True` if held either shared or exclusive."""
+        with self._condition:
+            return self._is_writer or self._readers > 0
+
+    def _can_acquire(self, is_shared: bool) -> bool:
+        if self._is_writer or self._is_acquiring:
+            return False
+        if is_shared:
+            # waiting writers go first, so a stream of readers does not starve them
+            return self._waiting_writers == 0
+        return self._readers == 0
 
-    def _lock(self) -> bool:
-        """Blocks all file operations globally, so that writes don't trump each other and corrupt the files.
+    def _acquire_blocking(self, is_shared: bool, end_ts_in_sec: float, attempt: _LockAttempt) -> bool:
+        """Runs in a worker thread: waits for in-process holders to leave and then for the file lock.
 
         Returns:
             :py:obj:`True` if lock has been acquired.
+        """
+        with self._condition:
+            if not is_shared:
+                self._waiting_writers += 1
+            try:
+                result = self._condition.wait_for(
+                    lambda: self._can_acquire(is_shared), timeout=max(0, end_ts_in_sec - time.monotonic())
+                )
+            finally:
+                if not is_shared:
+                    self._waiting_writers -= 1
+            if not result or attempt.is_abandoned:
+                return False
+            if is_shared and self._readers > 0:
+                # the file is already locked shared on behalf of this process
+                self._readers += 1
+                attempt.is_acquired = True
+                return True
+            self._is_acquiring = True
+        is_locked = False
+        try:
+            is_locked = self._flock_until(is_shared, end_ts_in_sec, attempt)
+        finally:
+            with self._condition:
+                self._is_acquiring = False
+                if is_locked and attempt.is_abandoned:
+                    # the waiter gave up in the meantime
+                    fcntl.flock(self._open_lock_file, fcntl.LOCK_UN)
+                    is_locked = False
+                elif is_locked and is_shared:
+                    self._readers = 1
+                elif is_locked:
+                    self._is_writer = True
+                attempt.is_acquired = is_locked
+                self._condition.notify_all()
+        return is_locked
+
+    def _flock_until(self, is_shared: bool, end_ts_in_sec: float, attempt: _LockAttempt) -> bool:
+        """Tries the file lock, without blocking, until it is acquired,
+        the deadline is reached, or the waiter gave up.
 
+        Returns:
+            :py:obj:`True` if the file lock has been acquired.
         """
-        # pylint: disable=consider-using-with
-        result = self._thread_lock.acquire(blocking=False)
-        # pylint: enable=consider-using-with
-        if result:
-            result = self._fcntl_flock(True)
-            if not result and self._thread_lock.locked():
-                self._thread_lock.release()
-        else:
-            _LOGGER.info("Could not acquire thread lock")
-        return result
+        operation = (fcntl.LOCK_SH if is_shared else fcntl.LOCK_EX) | fcntl.LOCK_NB
+        backoff_in_sec = _FILE_LOCK_MIN_BACKOFF_IN_SEC
+        while True:
+            try:
+                fcntl.flock(self._open_lock_file, operation)
+                return True
+            except BlockingIOError:
+                pass
+            remaining_in_sec = end_ts_in_sec - time.monotonic()
+            with self._condition:
+                is_abandoned = attempt.is_abandoned
+            if remaining_in_sec <= 0 or is_abandoned:
+                return False
+            time.sleep(min(backoff_in_sec, remaining_in_sec))
+            backoff_in_sec = min(backoff_in_sec * 2, _FILE_LOCK_MAX_BACKOFF_IN_SEC)
+
+    def _abandon(self, attempt: _LockAttempt) -> bool:
+        """Tells the worker thread to give up.
 
-    def _fcntl_flock(self, is_lock: bool) -> bool:
-        flag = fcntl.LOCK_EX if is_lock else fcntl.LOCK_UN
-        try:
-            fcntl.flock(self._open_lock_file, flag | fcntl.LOCK_NB)
-            result = True
-        except Exception as err:  # pylint: disable=broad-except
-            _LOGGER.info(
-                "Could not %s lock on file %s. Error: %s",
-                "acquire" if is_lock else "release",
-                self._lock_file,
-                err,
-            )
-            result = False
+        Returns:
+            :py:obj:`True` if it acquired the lock in the meantime.
+        """
+        with self._condition:
+            attempt.is_abandoned = not attempt.is_acquired
+            return attempt.is_acquired
+
+    def _unlock(self, *, is_shared: bool = False) -> bool:
+        """UN-Blocks all file operations globally, once the last holder leaves."""
+        result = True
+        with self._condition:
+            if is_shared:
+                self._readers = max(0, self._readers - 1)
+            else:
+                self._is_writer = False
+            if not self._is_writer and self._readers == 0:
+                try:
+                    fcntl.flock(self._open_lock_file, fcntl.LOCK_UN)
+                except Exception as err:  # pylint: disable=broad-except
+                    _LOGGER.info("Could not unlock file %s. Error: %s", self._lock_file, err)
+                    result = False
+            self._condition.notify_all()
         return result
 
-    def _unlock(self) -> bool:
-        """UN-Blocks all file operations globally."""
-        result = self._fcntl_flock(False)
-        if result:
-            if self._thread_lock.locked():
-                self._thread_lock.release()
-        else:
-            _LOGGER.info("Could not unlock file %s", self._lock_file)
-        return result
+    def _acquire_in_thread(self, is_shared: bool, end_ts_in_sec: float, attempt: _LockAttempt) -> asyncio.Future:
+        """Runs :py:meth:`_acquire_blocking` in its own thread, it ends by ``end_ts_in_sec`` at the latest.
+
+        The default executor is not used: a waiter would take one of its threads, which are shared with file I/O,
+        and its idle threads are not carried over into a forked process, losing the first task submitted there.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(result: Optional[bool], error: Optional[BaseException]) -> None:
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        def acquire() -> None:
+            result, error = None, None
+            try:
+                result = self._acquire_blocking(is_shared, end_ts_in_sec, attempt)
+            except Exception as err:  # pylint: disable=broad-except
+                error = err
+            try:
+                loop.call_soon_threadsafe(resolve, result, error)
+            except RuntimeError as err:
+                _LOGGER.warning("Could not report lock attempt on file %s. Error: %s", self._lock_file, err)
 
-    async def _wait_for_lock_release_and_lock(self) -> None:
+        threading.Thread(target=acquire, name=f"lock-{self._lock_file.name}", daemon=True).start()
+        return future
+
+    async def _wait_for_lock_release_and_lock(self, *, is_shared: bool = False) -> None:
         """Holds and waits for the lock to be released."""
-        end_ts_in_sec = datetime.utcnow().timestamp() + self._lock_timeout_in_sec
-        remaining_time_in_sec = self._lock_timeout_in_sec
-        while not self._lock():
-            _LOGGER.info(
-                "Waiting for lock. Sleeping %d sec, remaining wait time: %d sec",
-                _LOCK_SLEEP_STEP_IN_SEC,
-                remaining_time_in_sec,
+        end_ts_in_sec = time.monotonic() + self._lock_timeout_in_sec
+        attempt = _LockAttempt()
+        try:
+            # uncontended, the lock is taken without leaving the event loop
+            if self._acquire_blocking(is_shared, time.monotonic(), attempt):
+                return
+        except Exception as err:
+            raise StoreError(f"Could not acquire lock on file {self._lock_file}. Error: {err}") from err
+        attempt = _LockAttempt()
+        future = self._acquire_in_thread(is_shared, end_ts_in_sec, attempt)
+        try:
+            # shielded, the worker thread can not be interrupted, it is told to give up instead
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=self._lock_timeout_in_sec)
+        except asyncio.TimeoutError:
+            result = self._abandon(attempt)
+        except asyncio.CancelledError:
+            if self._abandon(attempt):
+                self._unlock(is_shared=is_shared)
+            raise
+        except Exception as err:
+            raise StoreError(f"Could not acquire lock on file {self._lock_file}. Error: {err}") from err
+        if not result:
+            raise StoreLockTimeoutError(
+                f"Could not acquire {'shared' if is_shared else 'exclusive'} lock "
+                f"in the past {self._lock_timeout_in_sec} seconds. "
+                f"Lock state: {self.lock_state()}"
             )
-            await asyncio.sleep(_LOCK_SLEEP_STEP_IN_SEC)
-            remaining_time_in_sec = int(end_ts_in_sec - datetime.utcnow().timestamp())
-            if remaining_time_in_sec <= 0:
-                raise StoreLockTimeoutError(
-                    f"Could not acquire lock in the past {self._lock_timeout_in_sec} seconds. "
-                    f"Lock state: {self.lock_state()}"
-                )
 
     def lock_state(self) -> Any:
         """Information that helps to inform why it timeout-ed, it is "string- able"."""
         stat = self._lock_file.stat()
+        with self._condition:
+            readers, is_writer, waiting_writers = self._readers, self._is_writer, self._waiting_writers
+            is_acquiring = self._is_acquiring
         return dict(
-            thread_lock=self._thread_lock.locked(),
+            readers=readers,
+            writer=is_writer,
+            waiting_writers=waiting_writers,
+            acquiring=is_acquiring,
             lock_file=self._lock_file,
             lock_created_time=f"{stat.st_ctime} / {datetime.fromtimestamp(stat.st_ctime)}",
             lock_modified_time=f"{stat.st_mtime} / {datetime.fromtimestamp(stat.st_mtime)}",
             lock_mode=oct(stat.st_mode),
         )
 
+    @contextlib.asynccontextmanager
+    async def shared(self) -> AsyncIterator["FileBasedLockContextManager"]:
+        """Shared (reader) lock, held concurrently by other readers, in and across processes.
+
+        Usage::
+            async with lock.shared():
+                content = file.read_text()
+        """
+        await self._wait_for_lock_release_and_lock(is_shared=True)
+        try:
+            yield self
+        finally:
+            self._unlock(is_shared=True)
+
     async def __aenter__(self) -> "StoreContextManager":
         await self._wait_for_lock_release_and_lock()
         return self
@@ -261,6 +412,46 @@ class StoreContextManager(contextlib.AbstractAsyncContextManager, abc.ABC):
     async def _close(self) -> None:
         """To be overwritten in case of resource disposal, like closing files or database connections."""
 
+    async def flush(self) -> None:
+        """Persists all changes made so far, without releasing any resource, i.e., the store remains usable.
+
+        Raises:
+            :py:class:`StoreError`
+
+        """
+        if not self._has_changed:
+            return
+        try:
+            await self._flush()
+        except Exception as err:
+            raise StoreError(f"Could not flush changes of '{self._source}'. Error: {err}") from err
+        self._has_changed = False
+
+    async def _flush(self) -> None:
+        """To be overwritten in case changes are only persisted when closing."""
+
+    async def refresh(self) -> bool:
+        """Re-synchronizes an opened store with its backing storage, in case it has been changed by someone else.
+        Any pending change is persisted first.
+
+        Returns:
+            :py:obj:`True` if the content was reloaded.
+
+        Raises:
+            :py:class:`StoreError`
+
+        """
+        await self.flush()
+        try:
+            result = await self._refresh()
+        except Exception as err:
+            raise StoreError(f"Could not refresh '{self._source}'. Error: {err}") from err
+        return bool(result)
+
+    async def _refresh(self) -> bool:
+        """To be overwritten in case the backing storage can be changed by others while the store is opened."""
+        return False
+
     def _snapshot_from_request_lst(
         self, request_lst: Optional[List[request.ScaleRequest]] = None
     ) -> event.EventSnapshot:
@@ -333,6 +524,85 @@ class StoreContextManager(contextlib.AbstractAsyncContextManager, abc.ABC):
     ) -> event.EventSnapshot:
         raise NotImplementedError
 
+    async def read_iter(
+        self,
+        *,
+        start_ts_utc: Optional[Union[int, float, datetime]] = None,
+        end_ts_utc: Optional[Union[int, float, datetime]] = None,
+        is_archive: Optional[bool] = False,
+        batch_size: Optional[int] = None,
+    ) -> AsyncIterator[List[request.ScaleRequest]]:
+        """Similar to :py:meth:`read` but, instead of building a :py:class:`event.EventSnapshot`,
+        yields the requests in batches, so large ranges can be processed in constant memory.
+
+        **NOTE**: the store must not be modified while iterating.
+
+        Args:
+            start_ts_utc: earliest event possible.
+                Default: :py:obj:`None`, meaning is given by implementation.
+            end_ts_utc: latest event possible.
+                Default: :py:obj:`None`, meaning is given by implementation.
+            is_archive: if :py:obj:`True` will retrieve from archive instead of current.
+            batch_size: maximum amount of requests per batch.
+                Default: :py:data:`DEFAULT_READ_BATCH_SIZE`.
+
+        Returns:
+            Non-empty lists of :py:class:`request.ScaleRequest`.
+
+        Raises:
+            :py:class:`StoreError`
+
+        """
+        _LOGGER.debug("Read iter with %s", locals())
+        if batch_size is None:
+            batch_size = DEFAULT_READ_BATCH_SIZE
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError(f"Batch size must be an integer >= 1. Got: '{batch_size}'({type(batch_size)})")
+        start_ts_utc = self._effective_start_ts_utc(start_ts_utc)
+        end_ts_utc = self._effective_end_ts_utc(end_ts_utc)
+        if start_ts_utc > end_ts_utc:
+            raise ValueError(
+                f"Start value '{start_ts_utc}' must be greater or equal end value '{end_ts_utc}'. "
+                f"Got start - end = {start_ts_utc - end_ts_utc}"
+            )
+        try:
+            async for batch in self._read_iter(
+                start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, is_archive=is_archive, batch_size=batch_size
+            ):
+                yield batch
+        except Exception as err:
+            raise StoreError(
+                f"Could not read requests for effective range [{start_ts_utc}, {end_ts_utc}]. Error: {err}"
+            ) from err
+
+    async def _read_iter(
+        self,
+        *,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+        is_archive: Optional[bool] = False,
+        batch_size: int,
+    ) -> AsyncIterator[List[request.ScaleRequest]]:
+        """To be overwritten by stores that can stream, by default the whole snapshot is read first."""
+        snapshot = await self._read(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, is_archive=is_archive)
+        request_lst = snapshot.all_requests()
+        for ndx in range(0, len(request_lst), batch_size):
+            yield request_lst[ndx : ndx + batch_size]
+
+    @staticmethod
+    async def _batched(
+        value: AsyncIterator[request.ScaleRequest], batch_size: int
+    ) -> AsyncIterator[List[request.ScaleRequest]]:
+        """Groups the requests in non-empty lists of at most ``batch_size``."""
+        batch = []
+        async for req in value:
+            batch.append(req)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
     async def write(
         self,
         value: event.EventSnapshot,
@@ -374,6 +644,41 @@ class StoreContextManager(contextlib.AbstractAsyncContextManager, abc.ABC):
     ) -> None:
         raise NotImplementedError
 
+    async def apply(self, value: event.EventSnapshotDiff) -> None:
+        """Removes the requests in ``to_remove`` and writes the ones in ``to_add``,
+        leaving all other requests untouched. It is meant to replace :py:meth:`write`,
+        with ``overwrite_within_range``, when the change is known, see :py:func:`version_control.diff`.
+
+        Args:
+            value: changes to apply.
+
+        Raises:
+            :py:class:`StoreError`
+
+        """
+        _LOGGER.debug("Apply with %s", locals())
+        if not isinstance(value, event.EventSnapshotDiff):
+            raise TypeError(
+                f"Value argument must be an instance of {event.EventSnapshotDiff.__name__}. "
+                f"Got: '{value}'({type(value)})"
+            )
+        if value.requests_to_remove():
+            try:
+                await self._remove_requests(value.requests_to_remove())
+                self._has_changed = True
+            except Exception as err:
+                raise StoreError(f"Could not remove {value.to_remove} from store. Error: {err}") from err
+        if value.requests_to_add():
+            try:
+                await self._write(value.to_add)
+                self._has_changed = True
+            except Exception as err:
+                raise StoreError(f"Could not write {value.to_add} to store. Error: {err}") from err
+
+    async def _remove_requests(self, value: List[request.ScaleRequest]) -> None:
+        """Removes exactly the given requests from current."""
+        raise NotImplementedError
+
     async def remove(
         self,
         *,
@@ -568,6 +873,9 @@ class ReadOnlyStoreContextManager(StoreContextManager, abc.ABC):
     ) -> event.EventSnapshot:
         raise StoreError(f"This is a {self.__class__.__name__} instance which is also read-only.")
 
+    async def _remove_requests(self, value: List[request.ScaleRequest]) -> None:
+        raise StoreError(f"This is a {self.__class__.__name__} instance which is also read-only.")
+
     async def _archive(
         self, *, start_ts_utc: Optional[int] = None, end_ts_utc: Optional[int] = None
     ) -> event.EventSnapshot:
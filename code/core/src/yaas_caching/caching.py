@@ -184,7 +184,7 @@ async def _update_cache(
         ) from err
     # merge
     try:
-        merged_snapshot = version_control.merge(
+        is_required, merged_snapshot = version_control.merge(
             snapshot_a=cached_snapshot,
             snapshot_b=source_snapshot,
             merge_strategy=merge_strategy,
@@ -196,9 +196,11 @@ async def _update_cache(
             f"and cached snapshot '{cached_snapshot}'. "
             f"Got: {err}"
         ) from err
-    # write cache
+    # write cache, only what changed
+    if not is_required:
+        return
     try:
-        await cache.write(merged_snapshot, overwrite_within_range=True)
+        await cache.apply(version_control.diff(current=cached_snapshot, target=merged_snapshot))
     except Exception as err:
         raise CachingError(
             f"Could not write snapshot '{merged_snapshot}' to cache using '{cache}'. Got: {err}"
@@ -0,0 +1,89 @@
+# vim: ai:sw=4:ts=4:sta:et:fo=croql
+"""Definition of store deltas, i.e., the data modifying operations applied to a store since a given base."""
+from typing import Any, Dict, List, Optional, Union
+
+import attrs
+
+from yaas_common import const, dto_defaults, request
+
+
+class DeltaOperationType(dto_defaults.EnumWithFromStrIgnoreCase):
+    """Supported data modifying operations."""
+
+    WRITE = "write"
+    REMOVE = "remove"
+    ARCHIVE = "archive"
+    REMOVE_REQUESTS = "remove_requests"
+
+
+def _dict_or_scale_request_lst_to_scale_request_lst(  # pylint: disable=invalid-name
+    value: Optional[List[Union[Dict[str, Any], request.ScaleRequest]]]
+) -> List[request.ScaleRequest]:
+    if value is None:
+        value = []
+    return [request.ScaleRequest.from_dict(item) if isinstance(item, dict) else item for item in value]
+
+
+@attrs.define(**const.ATTRS_DEFAULTS)
+class DeltaOperation(dto_defaults.HasFromJsonString):
+    """A single data modifying operation.
+
+    For :py:attr:`DeltaOperationType.WRITE` and :py:attr:`DeltaOperationType.REMOVE_REQUESTS`
+    only ``requests`` and ``is_archive`` are relevant,
+    for the other types only the timestamp range, and ``is_archive`` for removals, are relevant.
+    """
+
+    type: str = attrs.field(validator=attrs.validators.instance_of(str))
+    is_archive: bool = attrs.field(default=False, validator=attrs.validators.instance_of(bool))
+    start_ts_utc: Optional[int] = attrs.field(
+        default=None, validator=attrs.validators.optional(attrs.validators.instance_of(int))
+    )
+    end_ts_utc: Optional[int] = attrs.field(
+        default=None, validator=attrs.validators.optional(attrs.validators.instance_of(int))
+    )
+    requests: List[request.ScaleRequest] = attrs.field(
+        default=attrs.Factory(list),
+        converter=_dict_or_scale_request_lst_to_scale_request_lst,
+        validator=attrs.validators.deep_iterable(
+            member_validator=attrs.validators.instance_of(request.ScaleRequest),
+            iterable_validator=attrs.validators.instance_of(list),
+        ),
+    )
+
+    @type.validator
+    def _is_type_valid(self, attribute: attrs.Attribute, value: str) -> None:
+        if not DeltaOperationType.from_str(value):
+            raise ValueError(
+                f"Attribute {attribute.name} does not accept '{value}'. Valid values are: {list(DeltaOperationType)}"
+            )
+
+
+def _dict_or_operation_lst_to_operation_lst(  # pylint: disable=invalid-name
+    value: Optional[List[Union[Dict[str, Any], DeltaOperation]]]
+) -> List[DeltaOperation]:
+    if value is None:
+        value = []
+    return [DeltaOperation.from_dict(item) if isinstance(item, dict) else item for item in value]
+
+
+@attrs.define(**const.ATTRS_DEFAULTS)
+class StoreDelta(dto_defaults.HasFromJsonString):
+    """All operations, in order, applied on top of the base identified by ``base_generation``.
+
+    A delta with ``is_sealed`` is the last one for its base, the next change must be written as a new base.
+    """
+
+    base_generation: int = attrs.field(validator=attrs.validators.instance_of(int))
+    operations: List[DeltaOperation] = attrs.field(
+        default=attrs.Factory(list),
+        converter=_dict_or_operation_lst_to_operation_lst,
+        validator=attrs.validators.deep_iterable(
+            member_validator=attrs.validators.instance_of(DeltaOperation),
+            iterable_validator=attrs.validators.instance_of(list),
+        ),
+    )
+    is_sealed: bool = attrs.field(
+        default=False,
+        converter=attrs.converters.default_if_none(default=False),
+        validator=attrs.validators.instance_of(bool),
+    )
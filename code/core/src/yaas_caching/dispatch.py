@@ -0,0 +1,327 @@
+# vim: ai:sw=4:ts=4:sta:et:fo=croql
+"""Precomputed dispatch index: the requests of the next few hours bucketed by minute,
+stored as a single small object next to the cache.
+
+It is written after the cache is updated and allows sending requests without opening the cache store::
+    index = await read_index(cache_config)
+    version = await cache_version(cache_config)
+    is_stale = index is None or index.is_stale(
+        start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, cache_version=version
+    )
+    if not is_stale:
+        request_lst = index.requests(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc)
+
+The index keeps the :py:func:`cache_version` it was built from,
+so any write to the cache, through whichever path, makes it stale.
+"""
+import hashlib
+import os
+import pathlib
+from datetime import datetime
+from typing import List, Optional, Tuple, Union
+
+import attrs
+
+from yaas_caching import event
+from yaas_common import codec, const, dto_defaults, logger, request
+from yaas_config import config
+from yaas_gcp import gcs
+
+_LOGGER = logger.get(__name__)
+
+DISPATCH_BUCKET_IN_SEC: int = 60
+"""
+Width, in seconds, of each bucket.
+"""
+DEFAULT_DISPATCH_INDEX_PERIOD_IN_SEC: int = 12 * 60 * 60
+"""
+How far ahead, from its creation, the index goes.
+It should be longer than the interval between cache updates.
+"""
+_DISPATCH_INDEX_SUFFIX: str = ".dispatch"
+_SQLITE_WAL_SUFFIX: str = "-wal"
+
+
+def _now() -> int:
+    # same clock as the command ranges, see :py:class:`yaas_common.request.Range`
+    return int(datetime.utcnow().timestamp())
+
+
+def _bucket(value: int) -> int:
+    return value - value % DISPATCH_BUCKET_IN_SEC
+
+
+@attrs.define(**const.ATTRS_DEFAULTS)
+class DispatchIndex(dto_defaults.HasFromJsonString):
+    """All requests within ``[start_ts_utc, end_ts_utc]``, as of ``created_ts_utc``,
+    ``bucket_to_request`` is keyed by the start of each bucket, see :py:data:`DISPATCH_BUCKET_IN_SEC`.
+    ``cache_version`` is the :py:func:`cache_version` the requests were read from.
+    """
+
+    created_ts_utc: int = attrs.field(validator=attrs.validators.instance_of(int))
+    start_ts_utc: int = attrs.field(validator=attrs.validators.instance_of(int))
+    end_ts_utc: int = attrs.field(validator=attrs.validators.instance_of(int))
+    bucket_to_request: event.EventSnapshot = attrs.field(validator=attrs.validators.instance_of(event.EventSnapshot))
+    cache_version: Optional[str] = attrs.field(
+        default=None, validator=attrs.validators.optional(attrs.validators.instance_of(str))
+    )
+
+    @staticmethod
+    def from_snapshot(
+        value: event.EventSnapshot,
+        *,
+        start_ts_utc: int,
+        end_ts_utc: int,
+        created_ts_utc: Optional[int] = None,
+        cache_version: Optional[str] = None,
+    ) -> "DispatchIndex":
+        """Buckets the requests in ``value`` within ``[start_ts_utc, end_ts_utc]``.
+
+        Args:
+            value: cache content, at least for the range.
+            start_ts_utc: earliest request.
+            end_ts_utc: latest request.
+            created_ts_utc: when ``value`` was read, default is now.
+            cache_version: :py:func:`cache_version` read before ``value``.
+
+        Returns:
+        """
+        if not isinstance(value, event.EventSnapshot):
+            raise TypeError(
+                f"Value must be an instance of {event.EventSnapshot.__name__}. Got: '{value}'({type(value)})"
+            )
+        if created_ts_utc is None:
+            created_ts_utc = _now()
+        bucket_to_request = {}
+        for ts_utc, req_lst in value.slice(start_ts_utc, end_ts_utc).timestamp_to_request.items():
+            if req_lst:
+                bucket_to_request.setdefault(_bucket(ts_utc), []).extend(req_lst)
+        return DispatchIndex(
+            created_ts_utc=created_ts_utc,
+            start_ts_utc=start_ts_utc,
+            end_ts_utc=end_ts_utc,
+            bucket_to_request=event.EventSnapshot(source=value.source, timestamp_to_request=bucket_to_request),
+            cache_version=cache_version,
+        )
+
+    def is_stale(
+        self,
+        *,
+        start_ts_utc: Union[int, float],
+        end_ts_utc: Union[int, float],
+        max_age_in_sec: Optional[int] = None,
+        now: Optional[int] = None,
+        cache_version: Optional[str] = None,
+    ) -> bool:
+        """The index can only be used if it covers the range, is recent enough,
+        and the cache did not change since it was built.
+
+        Args:
+            start_ts_utc: range start.
+            end_ts_utc: range end.
+            max_age_in_sec: default is :py:data:`DEFAULT_DISPATCH_INDEX_PERIOD_IN_SEC`.
+            now: default is now.
+            cache_version: current :py:func:`cache_version`, if given it must be the one the index was built from.
+
+        Returns:
+            :py:obj:`True` if it can *NOT* be used.
+        """
+        if max_age_in_sec is None:
+            max_age_in_sec = DEFAULT_DISPATCH_INDEX_PERIOD_IN_SEC
+        if now is None:
+            now = _now()
+        is_covered = self.start_ts_utc <= int(start_ts_utc) and int(end_ts_utc) <= self.end_ts_utc
+        is_changed = cache_version is not None and cache_version != self.cache_version
+        return not is_covered or is_changed or now - self.created_ts_utc > max_age_in_sec
+
+    def requests(self, *, start_ts_utc: Union[int, float], end_ts_utc: Union[int, float]) -> List[request.ScaleRequest]:
+        """Requests within ``[start_ts_utc, end_ts_utc]``, only the buckets in the range are visited."""
+        start_ts_utc, end_ts_utc = int(start_ts_utc), int(end_ts_utc)
+        timestamp_to_request = self.bucket_to_request.timestamp_to_request
+        result = []
+        for bucket in range(_bucket(start_ts_utc), end_ts_utc + 1, DISPATCH_BUCKET_IN_SEC):
+            for req in timestamp_to_request.get(bucket, []):
+                if start_ts_utc <= req.timestamp_utc <= end_ts_utc:
+                    result.append(req)
+        return result
+
+    def as_bytes(self) -> bytes:
+        """Compact alternative to :py:meth:`as_json`, see :py:mod:`yaas_common.codec`."""
+        return codec.encode(
+            dict(self.bucket_to_request.timestamp_to_request),
+            self.bucket_to_request.source,
+            str(self.created_ts_utc),
+            str(self.start_ts_utc),
+            str(self.end_ts_utc),
+            self.cache_version or "",
+        )
+
+    @staticmethod
+    def from_bytes(value: bytes) -> "DispatchIndex":
+        """Reverses :py:meth:`as_bytes`."""
+        bucket_to_request, extra = codec.decode(value)
+        if len(extra) == 4:
+            # written before the cache version was kept, it is always stale against a known version
+            extra = [*extra, ""]
+        if len(extra) != 5:
+            raise codec.CodecError(
+                f"Expecting source, creation, start, end, and cache version as extra content. Got: {extra}"
+            )
+        source, created_ts_utc, start_ts_utc, end_ts_utc, cache_version = extra
+        return DispatchIndex(
+            created_ts_utc=int(created_ts_utc),
+            start_ts_utc=int(start_ts_utc),
+            end_ts_utc=int(end_ts_utc),
+            bucket_to_request=event.EventSnapshot(source=source, timestamp_to_request=bucket_to_request),
+            cache_version=cache_version or None,
+        )
+
+
+def index_location(value: config.CacheConfig) -> Optional[Union[pathlib.Path, Tuple[str, str]]]:
+    """Where the index for the cache in ``value`` is kept.
+
+    Args:
+        value: cache configuration.
+
+    Returns:
+        A local :py:class:`pathlib.Path`, a :py:class:`tuple` in the format ``<bucket name>,<object path>``,
+        or :py:obj:`None` if the cache does not support an index, e.g., it is in memory only.
+    """
+    if not isinstance(value, config.CacheConfig):
+        raise TypeError(f"Value must be an instance of {config.CacheConfig.__name__}. Got: '{value}'({type(value)})")
+    result = None
+    if value.type == config.CacheType.LOCAL_JSON_LINE.value:
+        result = pathlib.Path(value.json_line_file + _DISPATCH_INDEX_SUFFIX)
+    elif value.type == config.CacheType.LOCAL_SQLITE.value:
+        result = pathlib.Path(value.sqlite_file + _DISPATCH_INDEX_SUFFIX)
+    elif value.type == config.CacheType.GCS_SQLITE.value:
+        result = value.bucket_name, value.object_path + _DISPATCH_INDEX_SUFFIX
+    elif value.type == config.CacheType.GCS_SQLITE_SHARDED.value:
+        result = value.bucket_name, value.object_prefix + _DISPATCH_INDEX_SUFFIX
+    elif value.type == config.CacheType.TIERED.value:
+        result = index_location(value.durable_cache_config)
+    elif value.type == config.CacheType.COLD_ARCHIVE.value:
+        result = index_location(value.hot_cache_config)
+    return result
+
+
+async def cache_version(value: config.CacheConfig) -> Optional[str]:
+    """Fingerprint of the cache in ``value``, it changes whenever the cache is written.
+
+    For local files it is based on their inode, modification time, and size,
+    including the SQLite write-ahead log,
+    and for Cloud Storage on the generation of every object of the cache, excluding the index.
+
+    Args:
+        value: cache configuration.
+
+    Returns:
+        :py:obj:`None` if the cache does not support an index, see :py:func:`index_location`.
+    """
+    if not isinstance(value, config.CacheConfig):
+        raise TypeError(f"Value must be an instance of {config.CacheConfig.__name__}. Got: '{value}'({type(value)})")
+    if value.type == config.CacheType.TIERED.value:
+        return await cache_version(value.durable_cache_config)
+    if value.type == config.CacheType.COLD_ARCHIVE.value:
+        return await cache_version(value.hot_cache_config)
+    try:
+        if value.type == config.CacheType.LOCAL_JSON_LINE.value:
+            parts = [_file_version(pathlib.Path(value.json_line_file))]
+        elif value.type == config.CacheType.LOCAL_SQLITE.value:
+            sqlite_file = pathlib.Path(value.sqlite_file)
+            parts = [
+                _file_version(sqlite_file),
+                _file_version(sqlite_file.with_name(sqlite_file.name + _SQLITE_WAL_SUFFIX)),
+            ]
+        elif value.type == config.CacheType.GCS_SQLITE.value:
+            parts = _objects_version(value.bucket_name, value.object_path)
+        elif value.type == config.CacheType.GCS_SQLITE_SHARDED.value:
+            parts = _objects_version(value.bucket_name, value.object_prefix)
+        else:
+            return None
+    except Exception as err:
+        raise RuntimeError(f"Could not read cache version for '{value}'. Error: {err}") from err
+    return hashlib.sha256("\n".join(parts).encode(const.ENCODING_UTF8)).hexdigest()
+
+
+def _file_version(value: pathlib.Path) -> str:
+    if not value.exists():
+        return ""
+    stat = value.stat()
+    return f"{stat.st_ino}-{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def _objects_version(bucket_name: str, prefix: str) -> List[str]:
+    index_object_path = prefix + _DISPATCH_INDEX_SUFFIX
+    return sorted(
+        f"{blob.name}#{blob.generation}"
+        for blob in gcs.list_objects(bucket_name=bucket_name, prefix=prefix)
+        if blob.name != index_object_path
+    )
+
+
+async def read_index(value: config.CacheConfig) -> Optional[DispatchIndex]:
+    """Reads the index for the cache in ``value``, see :py:func:`write_index`.
+
+    Args:
+        value: cache configuration.
+
+    Returns:
+        :py:obj:`None` if there is no index.
+    """
+    location = index_location(value)
+    content = None
+    try:
+        if isinstance(location, pathlib.Path):
+            if location.exists():
+                content = location.read_bytes()
+        elif location is not None:
+            bucket_name, object_path = location
+            content = gcs.read_object(bucket_name=bucket_name, object_path=object_path, warn_read_failure=False)
+        result = DispatchIndex.from_bytes(content) if content else None
+    except Exception as err:
+        raise RuntimeError(f"Could not read dispatch index from '{location}'. Error: {err}") from err
+    return result
+
+
+async def write_index(value: DispatchIndex, *, cache_config: config.CacheConfig) -> bool:
+    """Writes the index for the cache in ``cache_config``.
+
+    Args:
+        value: index to write.
+        cache_config: cache configuration.
+
+    Returns:
+        :py:obj:`False` if the cache does not support an index.
+    """
+    if not isinstance(value, DispatchIndex):
+        raise TypeError(f"Value must be an instance of {DispatchIndex.__name__}. Got: '{value}'({type(value)})")
+    location = index_location(cache_config)
+    if location is None:
+        return False
+    try:
+        content = value.as_bytes()
+        if isinstance(location, pathlib.Path):
+            tmp_file = location.with_name(location.name + ".tmp")
+            tmp_file.write_bytes(content)
+            os.replace(tmp_file, location)
+        else:
+            bucket_name, object_path = location
+            gcs.write_object(bucket_name=bucket_name, object_path=object_path, content_source=content)
+    except Exception as err:
+        raise RuntimeError(f"Could not write dispatch index to '{location}'. Error: {err}") from err
+    _LOGGER.info("Wrote dispatch index with %d requests to '%s'", value.bucket_to_request.amount_requests(), location)
+    return True
+
+
+async def remove_index(value: config.CacheConfig) -> None:
+    """Removes the index, if any, for the cache in ``value``, so it is not used once outdated."""
+    location = index_location(value)
+    try:
+        if isinstance(location, pathlib.Path):
+            location.unlink(missing_ok=True)
+        elif location is not None:
+            bucket_name, object_path = location
+            gcs.delete_object(bucket_name=bucket_name, object_path=object_path)
+    except Exception as err:
+        raise RuntimeError(f"Could not remove dispatch index from '{location}'. Error: {err}") from err
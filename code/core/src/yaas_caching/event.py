@@ -1,22 +1,99 @@
 # vim: ai:sw=4:ts=4:sta:et:fo=croql
 """Basic definition of types and expected functionality for resource scaler."""
+import bisect
 from typing import Any, Dict, List, Optional, Tuple, Union
 
 import attrs
 
-from yaas_common import const, dto_defaults, logger, request
+from yaas_common import codec, const, dto_defaults, logger, request
 
 _LOGGER = logger.get(__name__)
 
 
+class _TimestampToRequest(dict):
+    """A plain :py:class:`dict` that keeps its timestamps sorted, its requests flattened, and their amount,
+    computed once, until a timestamp is added, removed, or assigned.
+
+    **NOTE**: the lists of requests must not be changed in place, assign a new list instead.
+    """
+
+    __slots__ = ("_timestamps", "_all_requests", "_amount_requests")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._changed()
+
+    def timestamps(self) -> List[int]:
+        """Sorted timestamps, do *NOT* change the result."""
+        if self._timestamps is None:
+            self._timestamps = sorted(self)
+        return self._timestamps
+
+    def all_requests(self) -> List[request.ScaleRequest]:
+        """All requests, in insertion order of their timestamps, do *NOT* change the result."""
+        if self._all_requests is None:
+            self._all_requests = [req for req_list in self.values() for req in req_list]
+        return self._all_requests
+
+    def amount_requests(self) -> int:
+        """How many requests, without flattening them."""
+        if self._amount_requests is None:
+            self._amount_requests = sum(len(req_list) for req_list in self.values())
+        return self._amount_requests
+
+    def _changed(self) -> None:
+        self._timestamps = None
+        self._all_requests = None
+        self._amount_requests = None
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    def __ior__(self, other):
+        result = super().__ior__(other)
+        self._changed()
+        return result
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+    def pop(self, *args):
+        result = super().pop(*args)
+        self._changed()
+        return result
+
+    def popitem(self):
+        result = super().popitem()
+        self._changed()
+        return result
+
+    def setdefault(self, *args):
+        result = super().setdefault(*args)
+        self._changed()
+        return result
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._changed()
+
+
 def _json_timestamp_to_request_converter(  # pylint: disable=invalid-name
     value: Union[Dict[str, List[Dict[str, Any]]], Dict[int, List[request.ScaleRequest]]]
 ) -> Dict[int, List[request.ScaleRequest]]:
     if isinstance(value, dict):
-        value = {
-            _str_or_int_to_int(key): [_dict_or_scale_request_to_scale_request(item) for item in val]
+        value = _TimestampToRequest(
+            (_str_or_int_to_int(key), [_dict_or_scale_request_to_scale_request(item) for item in val])
             for key, val in value.items()
-        }
+        )
     return value
 
 
@@ -56,17 +133,41 @@ class EventSnapshot(dto_defaults.HasFromJsonString):
         """Returns the range ot timestamps present here or :py:obj:`None` if ``timestamp_to_request`` is empty."""
         result = None, None
         if self.timestamp_to_request:
-            ts_lst = sorted(self.timestamp_to_request)
+            ts_lst = self.timestamp_to_request.timestamps()
             result = ts_lst[0], ts_lst[-1]
         return result
 
     def all_requests(self) -> List[request.ScaleRequest]:
-        """All requests it contains."""
-        return [req for req_list in self.timestamp_to_request.values() for req in req_list]
+        """All requests it contains, as a new list."""
+        return list(self.timestamp_to_request.all_requests())
 
     def amount_requests(self) -> int:
         """How many requests it contains."""
-        return len(self.all_requests())
+        return self.timestamp_to_request.amount_requests()
+
+    def slice(self, start_ts_utc: Optional[int] = None, end_ts_utc: Optional[int] = None) -> "EventSnapshot":
+        """Returns a snapshot, with the same source, only with the timestamps within ``[start_ts_utc, end_ts_utc]``.
+        A missing boundary means unbounded.
+        """
+        ts_lst = self.timestamp_to_request.timestamps()
+        start_ndx = 0 if start_ts_utc is None else bisect.bisect_left(ts_lst, start_ts_utc)
+        end_ndx = len(ts_lst) if end_ts_utc is None else bisect.bisect_right(ts_lst, end_ts_utc)
+        return EventSnapshot(
+            source=self.source,
+            timestamp_to_request={ts: self.timestamp_to_request[ts] for ts in ts_lst[start_ndx:end_ndx]},
+        )
+
+    def as_bytes(self) -> bytes:
+        """Compact alternative to :py:meth:`as_json`, see :py:mod:`yaas_common.codec`."""
+        return codec.encode(dict(self.timestamp_to_request), self.source)
+
+    @staticmethod
+    def from_bytes(value: bytes) -> "EventSnapshot":
+        """Reverses :py:meth:`as_bytes`."""
+        timestamp_to_request, extra = codec.decode(value)
+        if len(extra) != 1:
+            raise codec.CodecError(f"Expecting only the source as extra content. Got: {extra}")
+        return EventSnapshot(source=extra[0], timestamp_to_request=timestamp_to_request)
 
     @staticmethod
     def from_list_requests(
@@ -127,7 +228,7 @@ class EventSnapshotComparison(dto_defaults.HasFromJsonString):
         * snapshot A timeline goes from event 1 through 4.
         * snapshot B timeline goes from event 2 through 5.
     The resulting object should have:
-        * overlapping: [snapshot_a_event_2, snapshot_b_event_2].
+        * overlapping: [snapshot_a_event_2, snapshot_b_event_2], if their content differs.
         * only_in_a: [snapshot_a_event_1, snapshot_a_event_4].
         * only_in_b: [snapshot_b_event_3, snapshot_b_event_5].
 
@@ -145,7 +246,8 @@ class EventSnapshotComparison(dto_defaults.HasFromJsonString):
             )
         ),
     )
-    """All requests that share the same timestamp in both snapshots."""
+    """Requests at the timestamps present in both snapshots where their content differs, as ``(a, b)``,
+    timestamps with the same requests in both are left out."""
     only_in_a: EventSnapshot = attrs.field(
         default=None,
         validator=attrs.validators.optional(attrs.validators.instance_of(EventSnapshot)),
@@ -168,3 +270,33 @@ class EventSnapshotComparison(dto_defaults.HasFromJsonString):
     @staticmethod
     def _is_snapshot_empty(value: EventSnapshot) -> bool:
         return value is None or not value.all_requests()
+
+
+@attrs.define(**const.ATTRS_DEFAULTS)
+class EventSnapshotDiff(dto_defaults.HasFromJsonString):
+    """Per request changes that bring one snapshot into another.
+    Applying it is equivalent to removing ``to_remove`` and then writing ``to_add``.
+    """
+
+    to_add: EventSnapshot = attrs.field(
+        default=None,
+        validator=attrs.validators.optional(attrs.validators.instance_of(EventSnapshot)),
+    )
+    """Requests missing."""
+    to_remove: EventSnapshot = attrs.field(
+        default=None,
+        validator=attrs.validators.optional(attrs.validators.instance_of(EventSnapshot)),
+    )
+    """Requests no longer wanted."""
+
+    def requests_to_add(self) -> List[request.ScaleRequest]:
+        """All requests to add."""
+        return self.to_add.all_requests() if self.to_add is not None else []
+
+    def requests_to_remove(self) -> List[request.ScaleRequest]:
+        """All requests to remove."""
+        return self.to_remove.all_requests() if self.to_remove is not None else []
+
+    def is_empty(self) -> bool:
+        """If there is nothing to change."""
+        return not self.requests_to_add() and not self.requests_to_remove()
@@ -1,6 +1,8 @@
 # vim: ai:sw=4:ts=4:sta:et:fo=croql
 """Creates the proper py:class:`base.StoreContextManager` instance."""
-from yaas_caching import base, calendar, file, gcs
+import pathlib
+
+from yaas_caching import archive, base, calendar, file, gcs, memory
 from yaas_common import logger, preprocess
 from yaas_config import config
 
@@ -60,15 +62,40 @@ def store_from_cache_config(value: config.CacheConfig) -> base.StoreContextManag
     # logic
     if value.type == config.CacheType.LOCAL_JSON_LINE.value:
         result = file.JsonLineFileStoreContextManager(
-            json_line_file=value.json_line_file,
-            archive_json_line_file=value.archive_json_line_file,
+            json_line_file=pathlib.Path(value.json_line_file),
+            archive_json_line_file=pathlib.Path(value.archive_json_line_file),
         )
     elif value.type == config.CacheType.LOCAL_SQLITE.value:
-        result = file.SQLiteStoreContextManager(sqlite_file=value.sqlite_file)
+        result = file.SQLiteStoreContextManager(
+            sqlite_file=pathlib.Path(value.sqlite_file), performance_config=value.performance_config
+        )
     elif value.type == config.CacheType.GCS_SQLITE.value:
         result = gcs.GcsObjectStoreContextManager(
             bucket_name=value.bucket_name,
             db_object_path=value.object_path,
+            delta_compaction_threshold=value.delta_compaction_threshold,
+            performance_config=value.performance_config,
+            compression=value.compression,
+        )
+    elif value.type == config.CacheType.GCS_SQLITE_SHARDED.value:
+        result = gcs.ShardedGcsObjectStoreContextManager(
+            bucket_name=value.bucket_name,
+            object_prefix=value.object_prefix,
+            delta_compaction_threshold=value.delta_compaction_threshold,
+            performance_config=value.performance_config,
+            compression=value.compression,
+        )
+    elif value.type == config.CacheType.MEMORY.value:
+        result = memory.MemoryStoreContextManager(ttl_in_sec=value.ttl_in_sec)
+    elif value.type == config.CacheType.TIERED.value:
+        result = memory.TieredStoreContextManager(
+            durable=store_from_cache_config(value.durable_cache_config),
+            ttl_in_sec=value.ttl_in_sec,
+        )
+    elif value.type == config.CacheType.COLD_ARCHIVE.value:
+        result = archive.ColdArchiveStoreContextManager(
+            hot=store_from_cache_config(value.hot_cache_config),
+            archive_location=value.archive_location,
         )
     else:
         raise ValueError(
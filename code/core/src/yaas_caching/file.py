@@ -1,17 +1,27 @@
 # vim: ai:sw=4:ts=4:sta:et:fo=croql
 """Store interface for using local files."""
 import abc
+import asyncio
+import bisect
+import contextlib
+import functools
+import gzip
+import hashlib
+import os
 import pathlib
+import re
 import sqlite3
 import tempfile
-from datetime import datetime
-from typing import Generator, List, Optional, Tuple, Type
+from concurrent import futures
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, Dict, Generator, Iterator, List, Optional, Tuple, Type
 
 import aiofiles
 import attrs
 
 from yaas_caching import base, event
-from yaas_common import const, logger, request
+from yaas_common import const, dto_defaults, logger, request
+from yaas_config import config
 
 _LOGGER = logger.get(__name__)
 
@@ -56,6 +66,20 @@ class BaseFileStoreContextManager(base.StoreContextManager, abc.ABC):
                 request_lst.append(req)
         return self._snapshot_from_request_lst(request_lst)
 
+    async def _read_iter(
+        self,
+        *,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+        is_archive: Optional[bool] = False,
+        batch_size: int,
+    ) -> AsyncIterator[List[request.ScaleRequest]]:
+        async for batch in self._batched(
+            self._read_scale_requests_in_range(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, is_archive=is_archive),
+            batch_size,
+        ):
+            yield batch
+
     async def _read_scale_requests_in_range(
         self,
         *,
@@ -63,7 +87,7 @@ class BaseFileStoreContextManager(base.StoreContextManager, abc.ABC):
         end_ts_utc: Optional[int] = None,
         is_archive: Optional[bool] = False,
     ) -> Generator[request.ScaleRequest, None, None]:
-        async with self._lock:
+        async with self._lock.shared():
             async for result in self._read_scale_requests(
                 start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, is_archive=is_archive
             ):
@@ -167,6 +191,11 @@ class BaseFileStoreContextManager(base.StoreContextManager, abc.ABC):
         self._validate_all_requests_were_dealt_with(to_remove, removed, "removed")
         return removed
 
+    async def _remove_requests(self, value: List[request.ScaleRequest]) -> None:
+        async with self._lock:
+            removed = await self._remove_scale_requests(value, is_archive=False)
+        self._validate_all_requests_were_dealt_with(value, removed, "removed")
+
     @abc.abstractmethod
     async def _remove_scale_requests(
         self, value: List[request.ScaleRequest], *, is_archive: Optional[bool] = False
@@ -200,15 +229,73 @@ class BaseFileStoreContextManager(base.StoreContextManager, abc.ABC):
         return self._snapshot_from_request_lst(archived)
 
 
+_JSON_LINE_INDEX_FILE_SUFFIX: str = ".idx"
+_JSON_LINE_INDEX_STRIDE: int = 128
+"""
+Every how many lines the byte offset is kept in the index.
+"""
+_ARCHIVE_SEGMENT_KEY_FORMAT: str = "%Y%m"
+_ARCHIVE_SEGMENT_FILE_SUFFIX: str = ".jsonl.gz"
+
+
+@attrs.define(**const.ATTRS_DEFAULTS)
+class _JsonLineIndex(dto_defaults.HasFromJsonString):
+    """Sparse index of a sorted `JSON Lines`_ file, it is only valid while the file ``size`` and ``mtime_ns`` match.
+
+    .. _JSON Lines: https://jsonlines.org/
+    """
+
+    size: int = attrs.field(validator=attrs.validators.instance_of(int))
+    mtime_ns: int = attrs.field(validator=attrs.validators.instance_of(int))
+    timestamps: List[int] = attrs.field(
+        default=attrs.Factory(list),
+        validator=attrs.validators.deep_iterable(
+            member_validator=attrs.validators.instance_of(int),
+            iterable_validator=attrs.validators.instance_of(list),
+        ),
+    )
+    offsets: List[int] = attrs.field(
+        default=attrs.Factory(list),
+        validator=attrs.validators.deep_iterable(
+            member_validator=attrs.validators.instance_of(int),
+            iterable_validator=attrs.validators.instance_of(list),
+        ),
+    )
+
+    def offset(self, start_ts_utc: Optional[int] = None) -> int:
+        """Byte offset of a line at or before the first line with a timestamp greater or equal ``start_ts_utc``."""
+        result = 0
+        if start_ts_utc is not None:
+            ndx = bisect.bisect_left(self.timestamps, start_ts_utc)
+            if ndx > 0:
+                result = self.offsets[ndx - 1]
+        return result
+
+    def is_valid_for(self, value: os.stat_result) -> bool:
+        """If the index corresponds to the file with the given status."""
+        return self.size == value.st_size and self.mtime_ns == value.st_mtime_ns
+
+
 class JsonLineFileStoreContextManager(BaseFileStoreContextManager):
-    """A very inefficient version of a text file store, using the `JSON Lines`_
-    format, where each line is a JSON entry representing a scale request. `JSON
-    Lines`_ files.
+    """A text file store, using the `JSON Lines`_ format,
+    where each line is a JSON entry representing a scale request.
+
+    Lines are kept sorted by timestamp and a sparse index of byte offsets is kept next to each file::
+        <json_line_file>.idx
+    A range read seeks straight to the offset preceding its start and stops after its end.
+    Writes and removals rewrite the file, merging or filtering, and its index.
+
+    Files without a valid index, e.g., written by previous versions or changed by others, are read in full
+    and sorted at the next write or removal.
+
+    The archive is split into monthly, gzip compressed, segments next to the archive file::
+        <archive_json_line_file>.<YYYYMM>.jsonl.gz
+    Reads only decompress the segments overlapping the range
+    and removing a range drops the segments it fully covers without rewriting them.
+    An archive file written by previous versions is read as is and moved into segments at the next change.
 
     Ways it can be improved:
-    * Compress the files.
     * Use Pickle instead.
-    * Keep it sorted by timestamp and use binary search to find where to insert/find data.
 
     .. _JSON Lines: https://jsonlines.org/
     """
@@ -250,9 +337,68 @@ class JsonLineFileStoreContextManager(BaseFileStoreContextManager):
 
     @property
     def archive_json_line_file(self) -> pathlib.Path:
-        """Where to archive data."""
+        """Where to archive data, it is the prefix of all archive segments."""
         return self._archive_json_line_file
 
+    def archive_segment_keys(
+        self, *, start_ts_utc: Optional[int] = None, end_ts_utc: Optional[int] = None
+    ) -> List[str]:
+        """Sorted keys, in the format ``YYYYMM``, of all archive segments overlapping the range."""
+        name_regex = re.compile(
+            rf"^{re.escape(self._archive_json_line_file.name)}\."
+            rf"(?P<key>\d{{6}})"
+            rf"{re.escape(_ARCHIVE_SEGMENT_FILE_SUFFIX)}$"
+        )
+        result = []
+        if self._archive_json_line_file.parent.exists():
+            for path in self._archive_json_line_file.parent.iterdir():
+                match = name_regex.match(path.name)
+                if match:
+                    segment_start, segment_end = self._archive_segment_range(match.group("key"))
+                    if (start_ts_utc is None or segment_end >= start_ts_utc) and (
+                        end_ts_utc is None or segment_start <= end_ts_utc
+                    ):
+                        result.append(match.group("key"))
+        return sorted(result)
+
+    @staticmethod
+    def _archive_segment_key(value: int) -> str:
+        return datetime.fromtimestamp(value, tz=timezone.utc).strftime(_ARCHIVE_SEGMENT_KEY_FORMAT)
+
+    @staticmethod
+    def _archive_segment_range(key: str) -> Tuple[int, int]:
+        """Returns the inclusive range of timestamps, in seconds, covered by the segment."""
+        start = datetime.strptime(key, _ARCHIVE_SEGMENT_KEY_FORMAT).replace(tzinfo=timezone.utc)
+        end = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return int(start.timestamp()), int(end.timestamp()) - 1
+
+    def _archive_segment_path(self, key: str) -> pathlib.Path:
+        return self._archive_json_line_file.with_name(
+            f"{self._archive_json_line_file.name}.{key}{_ARCHIVE_SEGMENT_FILE_SUFFIX}"
+        )
+
+    def _path(self, is_archive: Optional[bool] = False) -> pathlib.Path:
+        return self._archive_json_line_file if is_archive else self._json_line_file
+
+    @staticmethod
+    def _index_path(path: pathlib.Path) -> pathlib.Path:
+        return path.with_name(f"{path.name}{_JSON_LINE_INDEX_FILE_SUFFIX}")
+
+    def _read_index(self, path: pathlib.Path) -> Optional[_JsonLineIndex]:
+        """Returns the index only if it is valid for the current file content."""
+        result = None
+        index_path = self._index_path(path)
+        if path.exists() and index_path.exists():
+            try:
+                result = _JsonLineIndex.from_json(index_path.read_text(encoding=const.ENCODING_UTF8))
+                if not result.is_valid_for(path.stat()):
+                    _LOGGER.info("Index '%s' is stale, ignoring it", index_path)
+                    result = None
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.warning("Could not read index '%s', ignoring it. Error: %s", index_path, err)
+                result = None
+        return result
+
     async def _read_scale_requests(
         self,
         *,
@@ -260,40 +406,191 @@ class JsonLineFileStoreContextManager(BaseFileStoreContextManager):
         end_ts_utc: Optional[int] = None,
         is_archive: Optional[bool] = False,
     ) -> Generator[request.ScaleRequest, None, None]:
-        path = self._json_line_file if not is_archive else self._archive_json_line_file
+        if is_archive:
+            async for req in self._read_lines(self._archive_json_line_file):
+                yield req
+            for key in self.archive_segment_keys(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc):
+                for req in await self._read_archive_segment(key):
+                    yield req
+            return
+        path = self._path(is_archive)
+        index = self._read_index(path)
+        if index is None:
+            async for req in self._read_lines(path):
+                yield req
+        else:
+            async for req in self._read_lines(path, offset=index.offset(start_ts_utc)):
+                if end_ts_utc is not None and req.timestamp_utc > end_ts_utc:
+                    break
+                yield req
+
+    @staticmethod
+    async def _read_lines(path: pathlib.Path, *, offset: int = 0) -> AsyncIterator[request.ScaleRequest]:
         if path.exists():
-            async with aiofiles.open(path, "r", encoding=const.ENCODING_UTF8) as in_file:
+            async with aiofiles.open(path, "rb") as in_file:
+                await in_file.seek(offset)
                 async for line in in_file:
                     line = line.strip()
                     if line:
-                        yield request.ScaleRequest.from_json(line)
+                        yield request.ScaleRequest.from_json(line.decode(const.ENCODING_UTF8))
+
+    async def _sorted_scale_requests(self, path: pathlib.Path) -> AsyncIterator[request.ScaleRequest]:
+        if self._read_index(path) is not None:
+            async for req in self._read_lines(path):
+                yield req
+        else:
+            # legacy, or changed by others, file: sort it once
+            request_lst = [req async for req in self._read_lines(path)]
+            for req in sorted(request_lst, key=lambda req: req.timestamp_utc):
+                yield req
 
     async def _write_scale_requests(
         self, value: List[request.ScaleRequest], *, is_archive: Optional[bool] = False
     ) -> List[request.ScaleRequest]:
-        path = self._json_line_file if not is_archive else self._archive_json_line_file
-        async with aiofiles.open(path, "a", encoding=const.ENCODING_UTF8) as out_file:
-            await out_file.writelines([f"\n{val.as_json()}" for val in value])
+        if value and is_archive:
+            await self._migrate_legacy_archive()
+            await self._merge_into_archive_segments(value)
+        elif value:
+            path = self._path(is_archive)
+            await self._rewrite(path, self._merge_sorted(self._sorted_scale_requests(path), value))
         return value
 
+    @staticmethod
+    async def _merge_sorted(
+        existing: AsyncIterator[request.ScaleRequest], value: List[request.ScaleRequest]
+    ) -> AsyncIterator[request.ScaleRequest]:
+        """Merges the new requests into the existing ones, already sorted, keeping existing ones first on ties."""
+        to_merge = sorted(value, key=lambda req: req.timestamp_utc)
+        ndx = 0
+        async for req in existing:
+            while ndx < len(to_merge) and to_merge[ndx].timestamp_utc < req.timestamp_utc:
+                yield to_merge[ndx]
+                ndx += 1
+            yield req
+        for req in to_merge[ndx:]:
+            yield req
+
     async def _remove_scale_requests(
         self, value: List[request.ScaleRequest], *, is_archive: Optional[bool] = False
     ) -> List[request.ScaleRequest]:
+        to_remove = set(value)
+        if not to_remove:
+            return value
+        if is_archive:
+            await self._migrate_legacy_archive()
+            for key in {self._archive_segment_key(req.timestamp_utc) for req in to_remove}:
+                content = await self._read_archive_segment(key)
+                await self._write_archive_segment(key, [req for req in content if req not in to_remove])
+            return value
+        path = self._path(is_archive)
+
+        async def remaining() -> AsyncIterator[request.ScaleRequest]:
+            async for req in self._sorted_scale_requests(path):
+                if req not in to_remove:
+                    yield req
+
+        await self._rewrite(path, remaining())
+        return value
+
+    async def _rewrite(self, path: pathlib.Path, value: AsyncIterator[request.ScaleRequest]) -> None:
+        """Writes the requests, already sorted, into a temporary file and its index,
+        then moves the file into place, the index is only valid once both are moved."""
+        # pylint: disable=consider-using-with
+        tmp_file = pathlib.Path(tempfile.NamedTemporaryFile(dir=path.parent, delete=False).name)
+        # pylint: enable=consider-using-with
+        timestamps, offsets = [], []
+        try:
+            offset = 0
+            async with aiofiles.open(tmp_file, "wb") as out_file:
+                ndx = 0
+                async for req in value:
+                    if ndx % _JSON_LINE_INDEX_STRIDE == 0:
+                        timestamps.append(req.timestamp_utc)
+                        offsets.append(offset)
+                    line = f"{req.as_json()}\n".encode(const.ENCODING_UTF8)
+                    await out_file.write(line)
+                    offset += len(line)
+                    ndx += 1
+            os.replace(tmp_file, path)
+        except Exception as err:
+            tmp_file.unlink(missing_ok=True)
+            raise RuntimeError(f"Could not rewrite {path}, its content is unchanged. Error: {err}") from err
+        stat = path.stat()
+        index = _JsonLineIndex(size=stat.st_size, mtime_ns=stat.st_mtime_ns, timestamps=timestamps, offsets=offsets)
+        self._index_path(path).write_text(index.as_json(), encoding=const.ENCODING_UTF8)
+
+    async def _remove_scale_requests_in_range(
+        self,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+        *,
+        is_archive: Optional[bool] = False,
+    ) -> List[request.ScaleRequest]:
+        if not is_archive:
+            return await super()._remove_scale_requests_in_range(start_ts_utc, end_ts_utc, is_archive=is_archive)
+        result = []
+        async with self._lock:
+            await self._migrate_legacy_archive()
+            for key in self.archive_segment_keys(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc):
+                to_keep, to_remove = [], []
+                for req in await self._read_archive_segment(key):
+                    if self._is_request_in_range(req=req, start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc):
+                        to_remove.append(req)
+                    else:
+                        to_keep.append(req)
+                if to_remove:
+                    await self._write_archive_segment(key, to_keep)
+                result.extend(to_remove)
+        return result
+
+    async def _migrate_legacy_archive(self) -> None:
+        """Moves the content of the archive file, written by previous versions, into segments."""
+        if not self._archive_json_line_file.exists():
+            return
+        legacy = [req async for req in self._read_lines(self._archive_json_line_file)]
+        _LOGGER.info("Moving %d archived requests from '%s' into segments", len(legacy), self._archive_json_line_file)
+        await self._merge_into_archive_segments(legacy)
+        self._archive_json_line_file.unlink()
+        self._index_path(self._archive_json_line_file).unlink(missing_ok=True)
+
+    async def _merge_into_archive_segments(self, value: List[request.ScaleRequest]) -> None:
+        key_to_requests = {}
+        for req in value:
+            key_to_requests.setdefault(self._archive_segment_key(req.timestamp_utc), []).append(req)
+        for key, request_lst in key_to_requests.items():
+            content = await self._read_archive_segment(key)
+            await self._write_archive_segment(key, sorted(content + request_lst, key=lambda req: req.timestamp_utc))
+
+    async def _read_archive_segment(self, key: str) -> List[request.ScaleRequest]:
+        path = self._archive_segment_path(key)
+        result = []
+        if path.exists():
+            async with aiofiles.open(path, "rb") as in_file:
+                content = gzip.decompress(await in_file.read()).decode(const.ENCODING_UTF8)
+            for line in content.splitlines():
+                line = line.strip()
+                if line:
+                    result.append(request.ScaleRequest.from_json(line))
+        return result
+
+    async def _write_archive_segment(self, key: str, value: List[request.ScaleRequest]) -> None:
+        path = self._archive_segment_path(key)
+        if not value:
+            path.unlink(missing_ok=True)
+            return
+        content = "".join(f"{req.as_json()}\n" for req in value).encode(const.ENCODING_UTF8)
         # pylint: disable=consider-using-with
-        tmp_file = pathlib.Path(tempfile.NamedTemporaryFile().name)
+        tmp_file = pathlib.Path(tempfile.NamedTemporaryFile(dir=path.parent, delete=False).name)
         # pylint: enable=consider-using-with
-        async with aiofiles.open(tmp_file, "w", encoding=const.ENCODING_UTF8) as out_file:
-            async for req in self._read_scale_requests(is_archive=is_archive):
-                if req not in value:
-                    await out_file.write(f"\n{req.as_json()}")
-        json_file = self._archive_json_line_file if is_archive else self._json_line_file
         try:
-            tmp_file.rename(json_file)
+            async with aiofiles.open(tmp_file, "wb") as out_file:
+                await out_file.write(gzip.compress(content))
+            os.replace(tmp_file, path)
         except Exception as err:
+            tmp_file.unlink(missing_ok=True)
             raise RuntimeError(
-                f"[DATA LOSS] Could not move content from {tmp_file} into {json_file}. Error: {err}"
+                f"Could not write archive segment {path}, its content is unchanged. Error: {err}"
             ) from err
-        return value
 
 
 def _sqlite_column_type_from_attr(attribute: attrs.Attribute) -> str:
@@ -332,14 +629,141 @@ def _sqlite_schema_from_dto(dto_class: Type, primary_key: Optional[str] = None)
     return f"CREATE TABLE IF NOT EXISTS {_SQLITE_SCHEMA_NAME_TOKEN}_{dto_class.__name__} ({columns_stmt});"
 
 
+def _sqlite_index_from_dto(dto_class: Type, *columns: str, is_unique: Optional[bool] = False) -> str:
+    table_name = f"{_SQLITE_SCHEMA_NAME_TOKEN}_{dto_class.__name__}"
+    index_name = f"{table_name}_{'_'.join(columns)}_{'uidx' if is_unique else 'idx'}"
+    return (
+        f"CREATE {'UNIQUE ' if is_unique else ''}INDEX IF NOT EXISTS {index_name} "
+        f"ON {table_name} ({', '.join(columns)});"
+    )
+
+
 _SQLITE_TABLE_SCHEMA_TMPL: str = _sqlite_schema_from_dto(request.ScaleRequest)
+_SQLITE_TIMESTAMP_UTC_INDEX_TMPL: str = _sqlite_index_from_dto(
+    request.ScaleRequest, request.ScaleRequest.timestamp_utc.__name__
+)
+_SQLITE_UNIQUE_KEY_COLUMNS: List[str] = [
+    request.ScaleRequest.topic.__name__,
+    request.ScaleRequest.resource.__name__,
+    request.ScaleRequest.command.__name__,
+    request.ScaleRequest.timestamp_utc.__name__,
+]
+"""
+Identity of a request in the SQLite store, writes of an existing request are ignored.
+"""
 _SQLITE_CURRENT_SCHEMA_NAME: str = "current"
 _SQLITE_ARCHIVE_SCHEMA_NAME: str = "archive"
+_SQLITE_SCALE_REQUEST_TABLE_TMPL: str = f"{_SQLITE_SCHEMA_NAME_TOKEN}_{request.ScaleRequest.__name__}"
+_SQLITE_PAYLOAD_TABLE_NAME: str = "EventPayload"
+_SQLITE_PAYLOAD_COLUMN: str = request.ScaleRequest.original_json_event.__name__
+_SQLITE_PAYLOAD_HASH_COLUMN: str = "payload_hash"
+_SQLITE_PAYLOAD_HASH_FUNCTION: str = "yaas_payload_hash"
+_SQLITE_SCHEMA_MIGRATIONS: List[List[str]] = [
+    # version 1: tables
+    [_SQLITE_TABLE_SCHEMA_TMPL],
+    # version 2: index on timestamp_utc for range reads/deletes
+    [_SQLITE_TIMESTAMP_UTC_INDEX_TMPL],
+    # version 3: event payloads stored once, in a table shared by current and archive, and referenced by hash
+    [
+        f"CREATE TABLE IF NOT EXISTS {_SQLITE_PAYLOAD_TABLE_NAME} "
+        f"({_SQLITE_PAYLOAD_HASH_COLUMN} TEXT PRIMARY KEY, {_SQLITE_PAYLOAD_COLUMN} TEXT NOT NULL);",
+        f"ALTER TABLE {_SQLITE_SCALE_REQUEST_TABLE_TMPL} ADD COLUMN {_SQLITE_PAYLOAD_HASH_COLUMN} TEXT;",
+        f"INSERT OR IGNORE INTO {_SQLITE_PAYLOAD_TABLE_NAME} ({_SQLITE_PAYLOAD_HASH_COLUMN}, {_SQLITE_PAYLOAD_COLUMN}) "
+        f"SELECT {_SQLITE_PAYLOAD_HASH_FUNCTION}({_SQLITE_PAYLOAD_COLUMN}), {_SQLITE_PAYLOAD_COLUMN} "
+        f"FROM {_SQLITE_SCALE_REQUEST_TABLE_TMPL} WHERE {_SQLITE_PAYLOAD_COLUMN} IS NOT NULL;",
+        f"UPDATE {_SQLITE_SCALE_REQUEST_TABLE_TMPL} "
+        f"SET {_SQLITE_PAYLOAD_HASH_COLUMN} = {_SQLITE_PAYLOAD_HASH_FUNCTION}({_SQLITE_PAYLOAD_COLUMN}), "
+        f"{_SQLITE_PAYLOAD_COLUMN} = NULL WHERE {_SQLITE_PAYLOAD_COLUMN} IS NOT NULL;",
+    ],
+    # version 4: unique key, duplicates are removed first, keeping the oldest
+    [
+        f"DELETE FROM {_SQLITE_SCALE_REQUEST_TABLE_TMPL} WHERE rowid NOT IN "
+        f"(SELECT MIN(rowid) FROM {_SQLITE_SCALE_REQUEST_TABLE_TMPL} "
+        f"GROUP BY {', '.join(_SQLITE_UNIQUE_KEY_COLUMNS)});",
+        _sqlite_index_from_dto(request.ScaleRequest, *_SQLITE_UNIQUE_KEY_COLUMNS, is_unique=True),
+    ],
+]
+"""
+Each entry is a list of statement templates, containing :py:data:`_SQLITE_SCHEMA_NAME_TOKEN`,
+that bring the schema from version ``index`` to ``index + 1``.
+The statements are applied to both, current and archive, tables.
+**NOTE**: only append to this list, never change existing entries.
+"""
+SQLITE_SCHEMA_VERSION: int = len(_SQLITE_SCHEMA_MIGRATIONS)
+"""
+Current schema version, stored in the database file as ``PRAGMA user_version``.
+"""
+_SQLITE_FETCH_SIZE: int = base.DEFAULT_READ_BATCH_SIZE
+"""
+How many rows are fetched at once, using :py:meth:`sqlite3.Cursor.fetchmany`, when reading.
+"""
+
+
+def _sqlite_payload_hash(value: Optional[str] = None) -> Optional[str]:
+    """Content hash used to reference ``original_json_event`` payloads,
+    also available in SQL as :py:data:`_SQLITE_PAYLOAD_HASH_FUNCTION`."""
+    result = None
+    if value is not None:
+        result = hashlib.sha256(value.encode(const.ENCODING_UTF8)).hexdigest()
+    return result
+
+
+def _sqlite_schema_version(cursor: sqlite3.Cursor) -> int:
+    return cursor.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def _sqlite_migrate_schema(cursor: sqlite3.Cursor) -> int:
+    """Brings the database schema to :py:data:`SQLITE_SCHEMA_VERSION`, applying all migrations, in a single
+    transaction, from the version stored in the file. Files created before the schema was versioned are at version
+    ``0`` and all statements are idempotent (``IF NOT EXISTS``).
+
+    Returns:
+        The schema version before the migration.
+    """
+    result = _sqlite_schema_version(cursor)
+    if result > SQLITE_SCHEMA_VERSION:
+        raise base.StoreError(
+            f"SQLite schema version {result} is newer than the supported version {SQLITE_SCHEMA_VERSION}. "
+            "Most likely the file was created by a newer version of this code."
+        )
+    if result < SQLITE_SCHEMA_VERSION:
+        _LOGGER.info("Migrating SQLite schema from version %d to %d", result, SQLITE_SCHEMA_VERSION)
+        cursor.execute("BEGIN;")
+        try:
+            for stmt_tmpl_lst in _SQLITE_SCHEMA_MIGRATIONS[result:]:
+                for stmt_tmpl in stmt_tmpl_lst:
+                    for schema_name in (_SQLITE_CURRENT_SCHEMA_NAME, _SQLITE_ARCHIVE_SCHEMA_NAME):
+                        cursor.execute(stmt_tmpl.replace(_SQLITE_SCHEMA_NAME_TOKEN, schema_name))
+            # PRAGMA does not accept bound parameters
+            cursor.execute(f"PRAGMA user_version = {SQLITE_SCHEMA_VERSION:d};")
+            cursor.connection.commit()
+        except Exception as err:
+            cursor.connection.rollback()
+            raise base.StoreError(
+                f"Could not migrate SQLite schema from version {result} to {SQLITE_SCHEMA_VERSION}. Error: {err}"
+            ) from err
+    return result
 
 
 class SQLiteStoreContextManager(BaseFileStoreContextManager):
     """Uses a `SQLite`_ database to back the store.
 
+    Requests are unique by :py:data:`_SQLITE_UNIQUE_KEY_COLUMNS`, enforced by an index,
+    therefore writes are a bulk ``INSERT OR IGNORE`` without reading existing requests first.
+
+    The ``original_json_event`` of each request is stored only once, in a table shared by current and archive,
+    keyed by its content hash, and the requests only keep the hash.
+    Payloads are fetched, once per read, only for the hashes found in the rows being read.
+    Payloads no longer referenced are deleted when requests are removed.
+
+    The connection is tuned by ``performance_config``, see :py:class:`config.SqlitePerformanceConfig`,
+    and, when closing, the file is vacuumed if too many pages are free and the WAL, if any, is checkpointed,
+    so the file holds all content on its own.
+
+    All database access runs in a single worker thread, owned by the instance, see :py:meth:`_run`,
+    so the event loop is not blocked while a query runs and reads fetch rows in batches of
+    :py:data:`_SQLITE_FETCH_SIZE`.
+
     .. _SQLite: https://www.sqlite.org/
     """
 
@@ -347,25 +771,63 @@ class SQLiteStoreContextManager(BaseFileStoreContextManager):
         self,
         *,
         sqlite_file: pathlib.Path,
+        performance_config: Optional[config.SqlitePerformanceConfig] = None,
         **kwargs,
     ):
         if not isinstance(sqlite_file, pathlib.Path):
             raise TypeError(f"SQLite file must be a {pathlib.Path.__name__}. Got: '{sqlite_file}'({type(sqlite_file)})")
+        if performance_config is None:
+            performance_config = config.SqlitePerformanceConfig()
+        if not isinstance(performance_config, config.SqlitePerformanceConfig):
+            raise TypeError(
+                f"Performance config must be a {config.SqlitePerformanceConfig.__name__}. "
+                f"Got: '{performance_config}'({type(performance_config)})"
+            )
+        self._performance_config = performance_config
         sqlite_file = sqlite_file.absolute()
         self._sqlite_file = sqlite_file
         if "source" not in kwargs:
             kwargs["source"] = self._sqlite_file.name
         super().__init__(lock_file=self._sqlite_file.with_suffix(".lock"), **kwargs)
         self._connection = None
+        self._executor: Optional[futures.ThreadPoolExecutor] = None
 
     @property
     def sqlite_file(self) -> pathlib.Path:
         """Which is the SQLite file being used."""
         return self._sqlite_file
 
+    @property
+    def performance_config(self) -> config.SqlitePerformanceConfig:
+        """How the connection is tuned."""
+        return self._performance_config
+
+    async def _run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Runs ``func`` in the worker thread, where the connection lives, without blocking the event loop.
+        Calls are executed one at a time, in the order they were made."""
+        if self._executor is None:
+            self._executor = futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f"{self.__class__.__name__}-{self._sqlite_file.name}"
+            )
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def _run_with_cursor(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Same as :py:meth:`_run` but ``func`` gets a new cursor as first argument, closed once it returns."""
+        return await self._run(self._with_cursor, func, *args, **kwargs)
+
+    def _with_cursor(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        cursor = self._create_cursor()
+        try:
+            result = func(cursor, *args, **kwargs)
+        finally:
+            cursor.close()
+        return result
+
     async def _open(self) -> None:
-        self._connection = _sqlite_connection(self._sqlite_file)
-        self._create_tables(self._create_cursor())
+        self._connection = await self._run(_sqlite_connection, self._sqlite_file, self._performance_config)
+        await self._run(lambda: self._create_tables(self._create_cursor()))
 
     def _create_cursor(self) -> sqlite3.Cursor:
         if self._connection is None:
@@ -377,13 +839,7 @@ class SQLiteStoreContextManager(BaseFileStoreContextManager):
 
     @staticmethod
     def _create_tables(cursor: sqlite3.Cursor) -> None:
-        # template
-        create_stmt = _sqlite_schema_from_dto(request.ScaleRequest)
-        # current
-        cursor.execute(create_stmt.replace(_SQLITE_SCHEMA_NAME_TOKEN, _SQLITE_CURRENT_SCHEMA_NAME))
-        # archive
-        cursor.execute(create_stmt.replace(_SQLITE_SCHEMA_NAME_TOKEN, _SQLITE_ARCHIVE_SCHEMA_NAME))
-        # done
+        _sqlite_migrate_schema(cursor)
         cursor.close()
 
     @staticmethod
@@ -395,9 +851,92 @@ class SQLiteStoreContextManager(BaseFileStoreContextManager):
         return f"{_SQLITE_ARCHIVE_SCHEMA_NAME}_{request.ScaleRequest.__name__}"
 
     async def _close(self) -> None:
+        try:
+            await self._commit_and_compact()
+            await self._close_connection()
+        finally:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def _close_connection(self) -> None:
+        """Closes the connection, without committing, if it is open."""
+        if self._connection is not None:
+            await self._run(self._connection.close)
+            self._connection = None
+
+    async def _flush(self) -> None:
+        await self._run(self._connection.commit)
+
+    async def _commit_and_compact(self) -> None:
+        """Commits, vacuums if needed, see :py:meth:`_vacuum_if_fragmented`,
+        and checkpoints the WAL, if any, so the file alone holds all content, e.g., to be copied."""
+        await self._run_with_cursor(self._commit_vacuum_and_checkpoint)
+
+    def _commit_vacuum_and_checkpoint(self, cursor: sqlite3.Cursor) -> None:
         self._connection.commit()
-        self._connection.close()
-        self._connection = None
+        self._vacuum_if_fragmented(cursor)
+        cursor.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+
+    def _vacuum_if_fragmented(self, cursor: sqlite3.Cursor) -> bool:
+        """Vacuums if the ratio of free pages reaches
+        :py:attr:`config.SqlitePerformanceConfig.vacuum_free_page_ratio`.
+        It must be called outside a transaction.
+
+        Returns:
+            :py:obj:`True` if vacuumed.
+        """
+        page_count = cursor.execute("PRAGMA page_count;").fetchone()[0]
+        free_page_count = cursor.execute("PRAGMA freelist_count;").fetchone()[0]
+        if not page_count or free_page_count / page_count < self._performance_config.vacuum_free_page_ratio:
+            return False
+        cursor.execute("VACUUM;")
+        _LOGGER.info(
+            "Vacuumed %s, %d out of %d pages were free, now it has %d pages",
+            self._sqlite_file,
+            free_page_count,
+            page_count,
+            cursor.execute("PRAGMA page_count;").fetchone()[0],
+        )
+        return True
+
+    async def is_empty(self) -> bool:
+        """Returns :py:obj:`True` if there are no requests, neither current nor archived."""
+        return await self._run_with_cursor(self._is_empty)
+
+    @staticmethod
+    def _is_empty(cursor: sqlite3.Cursor) -> bool:
+        return all(
+            cursor.execute(f"SELECT 1 FROM {table_name} LIMIT 1;").fetchone() is None
+            for table_name in (
+                SQLiteStoreContextManager._current_table_name(),
+                SQLiteStoreContextManager._archive_table_name(),
+            )
+        )
+
+    async def content_digest(self) -> str:
+        """Hash of all requests, current and archived, independent of how the file is laid out,
+        i.e., the same requests give the same digest regardless of the order they were written or removed in.
+        """
+        return await self._run_with_cursor(self._content_digest)
+
+    @staticmethod
+    def _content_digest(cursor: sqlite3.Cursor) -> str:
+        result = hashlib.sha256()
+        columns = ", ".join(SQLiteStoreContextManager._column_names())
+        order_by = ", ".join(_SQLITE_UNIQUE_KEY_COLUMNS)
+        for table_name in (
+            SQLiteStoreContextManager._current_table_name(),
+            SQLiteStoreContextManager._archive_table_name(),
+        ):
+            result.update(table_name.encode(const.ENCODING_UTF8))
+            cursor.execute(f"SELECT {columns} FROM {table_name} ORDER BY {order_by};")
+            while True:
+                rows = cursor.fetchmany(_SQLITE_FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    result.update(repr(row).encode(const.ENCODING_UTF8))
+        return result.hexdigest()
 
     async def _read_scale_requests(
         self,
@@ -406,38 +945,56 @@ class SQLiteStoreContextManager(BaseFileStoreContextManager):
         end_ts_utc: Optional[int] = None,
         is_archive: Optional[bool] = False,
     ) -> Generator[request.ScaleRequest, None, None]:
-        cursor = self._create_cursor()
-        cursor.execute(self._select_stmt_by_timestamp_utc(start_ts_utc, end_ts_utc, is_archive))
-        for row in cursor.fetchall():
-            yield self._dto_from_row(row)
-        cursor.close()
+        cursor = await self._run(self._create_cursor)
+        payloads = {}
+        try:
+            await self._run(cursor.execute, *self._select_stmt_by_timestamp_utc(start_ts_utc, end_ts_utc, is_archive))
+            # rows are fetched in batches, the event loop runs in between
+            while True:
+                batch = await self._run(self._fetch_scale_requests, cursor, payloads)
+                if not batch:
+                    break
+                for result in batch:
+                    yield result
+        finally:
+            await self._run(cursor.close)
+
+    def _fetch_scale_requests(self, cursor: sqlite3.Cursor, payloads: Dict[str, str]) -> List[request.ScaleRequest]:
+        return [self._dto_from_row(row, payloads) for row in cursor.fetchmany(_SQLITE_FETCH_SIZE)]
 
     @staticmethod
     def _select_stmt_by_timestamp_utc(
         start_ts_utc: Optional[int] = None,
         end_ts_utc: Optional[int] = None,
         is_archive: Optional[bool] = False,
-    ) -> str:
+    ) -> Tuple[str, Tuple[int, ...]]:
         # table name
         table_name = SQLiteStoreContextManager._table_name(is_archive)
         # where clause
-        where_clause = SQLiteStoreContextManager._ts_where_clause(start_ts_utc, end_ts_utc)
-        return f"SELECT * FROM {table_name} {where_clause};"
+        where_clause, params = SQLiteStoreContextManager._ts_where_clause(start_ts_utc, end_ts_utc)
+        columns = ", ".join(SQLiteStoreContextManager._column_names())
+        order_by = request.ScaleRequest.timestamp_utc.__name__
+        return f"SELECT {columns} FROM {table_name} {where_clause} ORDER BY {order_by};", params
 
     @staticmethod
     def _ts_where_clause(
         start_ts_utc: Optional[int] = None,
         end_ts_utc: Optional[int] = None,
-    ) -> str:
-        result = ""
+    ) -> Tuple[str, Tuple[int, ...]]:
+        """Returns the ``WHERE`` clause, with ``?`` place holders, and the corresponding parameters.
+
+        The statement text only depends on which boundaries are given,
+        so :py:mod:`sqlite3` statement cache can reuse the prepared statement.
+        """
+        result = "", ()
         if start_ts_utc is not None or end_ts_utc is not None:
-            result = f"WHERE {request.ScaleRequest.timestamp_utc.__name__}"
+            where_clause = f"WHERE {request.ScaleRequest.timestamp_utc.__name__}"
             if start_ts_utc is not None and end_ts_utc is not None:
-                result = f"{result} BETWEEN {start_ts_utc} AND {end_ts_utc}"
+                result = f"{where_clause} BETWEEN ? AND ?", (start_ts_utc, end_ts_utc)
             elif start_ts_utc is not None:
-                result = f"{result} >= {start_ts_utc}"
+                result = f"{where_clause} >= ?", (start_ts_utc,)
             elif end_ts_utc is not None:
-                result = f"{result} <= {end_ts_utc}"
+                result = f"{where_clause} <= ?", (end_ts_utc,)
         return result
 
     @staticmethod
@@ -448,35 +1005,86 @@ class SQLiteStoreContextManager(BaseFileStoreContextManager):
             else SQLiteStoreContextManager._current_table_name()
         )
 
-    @staticmethod
-    def _dto_from_row(row: Tuple) -> request.ScaleRequest:
-        kwargs = dict(zip(SQLiteStoreContextManager._column_names(), row))
+    def _dto_from_row(self, row: Tuple, payloads: Dict[str, str]) -> request.ScaleRequest:
+        """Hydrates the ``original_json_event`` from its hash.
+
+        Args:
+            row: as returned by the select statements.
+            payloads: payloads already fetched, by hash, it is updated with the ones fetched.
+        """
+        kwargs = dict(zip(self._column_names(), row))
+        payload_hash = kwargs.pop(_SQLITE_PAYLOAD_HASH_COLUMN)
+        if payload_hash is not None:
+            if payload_hash not in payloads:
+                payloads[payload_hash] = self._read_payload(payload_hash)
+            kwargs[_SQLITE_PAYLOAD_COLUMN] = payloads.get(payload_hash)
         return request.ScaleRequest.from_dict(kwargs)
 
+    def _read_payload(self, payload_hash: str) -> str:
+        cursor = self._create_cursor()
+        try:
+            row = cursor.execute(
+                f"SELECT {_SQLITE_PAYLOAD_COLUMN} FROM {_SQLITE_PAYLOAD_TABLE_NAME} "
+                f"WHERE {_SQLITE_PAYLOAD_HASH_COLUMN} = ?;",
+                (payload_hash,),
+            ).fetchone()
+        finally:
+            cursor.close()
+        if row is None:
+            raise base.StoreError(f"Event payload with hash '{payload_hash}' does not exist in {self._sqlite_file}")
+        return row[0]
+
     @staticmethod
     def _column_names() -> List[str]:
-        return sorted([field.name for field in attrs.fields(request.ScaleRequest)])
+        """Stored columns, ``original_json_event`` is replaced by its hash."""
+        return sorted(
+            [field.name for field in attrs.fields(request.ScaleRequest) if field.name != _SQLITE_PAYLOAD_COLUMN]
+            + [_SQLITE_PAYLOAD_HASH_COLUMN]
+        )
+
+    async def _write(self, value: event.EventSnapshot) -> None:
+        to_write = value.all_requests()
+        written = await self._write_scale_requests_with_lock(to_write, is_archive=False)
+        self._validate_all_requests_were_dealt_with(to_write, written, "written")
 
     async def _write_scale_requests(
         self, value: List[request.ScaleRequest], *, is_archive: Optional[bool] = False
     ) -> List[request.ScaleRequest]:
-        insert_stmt = self._insert_stmt_tmpl(is_archive)
-        cursor = self._create_cursor()
-        cursor.executemany(insert_stmt, [self._to_row(val) for val in value])
-        cursor.close()
+        await self._run_with_cursor(self._insert_scale_requests, value, is_archive=is_archive)
         return value
 
+    @staticmethod
+    def _insert_scale_requests(
+        cursor: sqlite3.Cursor, value: List[request.ScaleRequest], *, is_archive: Optional[bool] = False
+    ) -> None:
+        payloads = {
+            _sqlite_payload_hash(val.original_json_event): val.original_json_event
+            for val in value
+            if val.original_json_event is not None
+        }
+        cursor.executemany(
+            f"INSERT OR IGNORE INTO {_SQLITE_PAYLOAD_TABLE_NAME} "
+            f"({_SQLITE_PAYLOAD_HASH_COLUMN}, {_SQLITE_PAYLOAD_COLUMN}) VALUES(?, ?)",
+            payloads.items(),
+        )
+        cursor.executemany(
+            SQLiteStoreContextManager._insert_stmt_tmpl(is_archive),
+            [SQLiteStoreContextManager._to_row(val) for val in value],
+        )
+
     @staticmethod
     def _insert_stmt_tmpl(is_archive: Optional[bool] = False) -> str:
         table_name = SQLiteStoreContextManager._table_name(is_archive)
-        values_place_holders = ", ".join(["?"] * len(attrs.fields(request.ScaleRequest)))
-        return f"INSERT INTO {table_name} VALUES({values_place_holders})"
+        column_names = SQLiteStoreContextManager._column_names()
+        values_place_holders = ", ".join(["?"] * len(column_names))
+        return f"INSERT OR IGNORE INTO {table_name} ({', '.join(column_names)}) VALUES({values_place_holders})"
 
     @staticmethod
     def _to_row(value: request.ScaleRequest) -> tuple:
         value_dict = value.as_dict()
+        value_dict[_SQLITE_PAYLOAD_HASH_COLUMN] = _sqlite_payload_hash(value_dict.pop(_SQLITE_PAYLOAD_COLUMN))
         # pylint: disable=consider-using-generator
-        return tuple([value_dict.get(key) for key in sorted(value_dict.keys())])
+        return tuple([value_dict.get(key) for key in SQLiteStoreContextManager._column_names()])
 
     async def _remove_scale_requests_in_range(
         self,
@@ -485,14 +1093,10 @@ class SQLiteStoreContextManager(BaseFileStoreContextManager):
         *,
         is_archive: Optional[bool] = False,
     ) -> List[request.ScaleRequest]:
-        result = []
-        async for req in self._read_scale_requests_in_range(
-            start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, is_archive=is_archive
-        ):
-            result.append(req)
-        await self._remove_scale_requests_in_range_from_db(
-            start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, is_archive=is_archive
-        )
+        async with self._lock:
+            result = await self._remove_scale_requests_in_range_from_db(
+                start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, is_archive=is_archive
+            )
         return result
 
     async def _remove_scale_requests_in_range_from_db(
@@ -501,34 +1105,170 @@ class SQLiteStoreContextManager(BaseFileStoreContextManager):
         start_ts_utc: Optional[int] = None,
         end_ts_utc: Optional[int] = None,
         is_archive: Optional[bool] = False,
-    ) -> None:
-        delete_stmt = self._delete_stmt_by_timestamp_utc(start_ts_utc, end_ts_utc, is_archive)
-        cursor = self._create_cursor()
-        cursor.execute(delete_stmt)
-        cursor.close()
+    ) -> List[request.ScaleRequest]:
+        return await self._run_with_cursor(
+            self._delete_scale_requests_in_range,
+            start_ts_utc=start_ts_utc,
+            end_ts_utc=end_ts_utc,
+            is_archive=is_archive,
+        )
+
+    def _delete_scale_requests_in_range(
+        self,
+        cursor: sqlite3.Cursor,
+        *,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+        is_archive: Optional[bool] = False,
+    ) -> List[request.ScaleRequest]:
+        select_stmt, params = self._select_stmt_by_timestamp_utc(start_ts_utc, end_ts_utc, is_archive)
+        delete_stmt, _ = self._delete_stmt_by_timestamp_utc(start_ts_utc, end_ts_utc, is_archive)
+        payloads = {}
+        with _sqlite_savepoint(cursor, "remove"):
+            result = [self._dto_from_row(row, payloads) for row in cursor.execute(select_stmt, params)]
+            cursor.execute(delete_stmt, params)
+            if payloads:
+                cursor.execute(self._delete_orphan_payloads_stmt())
+        return result
+
+    @staticmethod
+    def _delete_orphan_payloads_stmt() -> str:
+        referenced = " UNION ".join(
+            f"SELECT {_SQLITE_PAYLOAD_HASH_COLUMN} FROM {table_name} WHERE {_SQLITE_PAYLOAD_HASH_COLUMN} IS NOT NULL"
+            for table_name in (
+                SQLiteStoreContextManager._current_table_name(),
+                SQLiteStoreContextManager._archive_table_name(),
+            )
+        )
+        return f"DELETE FROM {_SQLITE_PAYLOAD_TABLE_NAME} WHERE {_SQLITE_PAYLOAD_HASH_COLUMN} NOT IN ({referenced});"
+
+    async def _archive(
+        self, *, start_ts_utc: Optional[int] = None, end_ts_utc: Optional[int] = None
+    ) -> event.EventSnapshot:
+        async with self._lock:
+            archived = await self._archive_scale_requests_in_range_from_db(
+                start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc
+            )
+        return self._snapshot_from_request_lst(archived)
+
+    async def _archive_scale_requests_in_range_from_db(
+        self,
+        *,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+    ) -> List[request.ScaleRequest]:
+        """Moves all requests within the range from the current into the archive table using ``INSERT INTO ...
+        SELECT`` followed by ``DELETE``, inside a single savepoint. Either both statements are applied or none is.
+        A request already archived, by :py:data:`_SQLITE_UNIQUE_KEY_COLUMNS`, is overwritten by the current one.
+
+        The rows are only read into Python to build the returned value, they are never re-inserted from Python.
+        """
+        return await self._run_with_cursor(
+            self._move_scale_requests_in_range_to_archive, start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc
+        )
+
+    def _move_scale_requests_in_range_to_archive(
+        self,
+        cursor: sqlite3.Cursor,
+        *,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+    ) -> List[request.ScaleRequest]:
+        select_stmt, params = self._select_stmt_by_timestamp_utc(start_ts_utc, end_ts_utc, False)
+        archive_stmt, _ = self._archive_stmt_by_timestamp_utc(start_ts_utc, end_ts_utc)
+        delete_stmt, _ = self._delete_stmt_by_timestamp_utc(start_ts_utc, end_ts_utc, False)
+        payloads = {}
+        with _sqlite_savepoint(cursor, "archive"):
+            result = [self._dto_from_row(row, payloads) for row in cursor.execute(select_stmt, params)]
+            cursor.execute(archive_stmt, params)
+            cursor.execute(delete_stmt, params)
+            if payloads:
+                # overwritten archived requests might have been the last reference to their payload
+                cursor.execute(self._delete_orphan_payloads_stmt())
+        return result
+
+    @staticmethod
+    def _archive_stmt_by_timestamp_utc(
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+    ) -> Tuple[str, Tuple[int, ...]]:
+        # table names
+        current_table_name = SQLiteStoreContextManager._current_table_name()
+        archive_table_name = SQLiteStoreContextManager._archive_table_name()
+        # where clause
+        where_clause, params = SQLiteStoreContextManager._ts_where_clause(start_ts_utc, end_ts_utc)
+        # without a WHERE clause SQLite would parse ON CONFLICT as a join constraint
+        where_clause = where_clause or "WHERE true"
+        column_names = SQLiteStoreContextManager._column_names()
+        columns = ", ".join(column_names)
+        updates = ", ".join(
+            f"{name} = excluded.{name}" for name in column_names if name not in _SQLITE_UNIQUE_KEY_COLUMNS
+        )
+        return (
+            f"INSERT INTO {archive_table_name} ({columns}) "
+            f"SELECT {columns} FROM {current_table_name} {where_clause} "
+            f"ON CONFLICT ({', '.join(_SQLITE_UNIQUE_KEY_COLUMNS)}) DO UPDATE SET {updates};"
+        ), params
 
     @staticmethod
     def _delete_stmt_by_timestamp_utc(
         start_ts_utc: Optional[int] = None,
         end_ts_utc: Optional[int] = None,
         is_archive: Optional[bool] = False,
-    ) -> str:
+    ) -> Tuple[str, Tuple[int, ...]]:
         # table name
         table_name = SQLiteStoreContextManager._table_name(is_archive)
         # where clause
-        where_clause = SQLiteStoreContextManager._ts_where_clause(start_ts_utc, end_ts_utc)
-        return f"DELETE FROM {table_name} {where_clause};"
+        where_clause, params = SQLiteStoreContextManager._ts_where_clause(start_ts_utc, end_ts_utc)
+        return f"DELETE FROM {table_name} {where_clause};", params
 
     async def _remove_scale_requests(
         self, value: List[request.ScaleRequest], *, is_archive: Optional[bool] = False
+    ) -> List[request.ScaleRequest]:
+        """Deletes by :py:data:`_SQLITE_UNIQUE_KEY_COLUMNS`, using the unique index, instead of by range."""
+        await self._run_with_cursor(self._delete_scale_requests, value, is_archive=is_archive)
+        return value
+
+    @staticmethod
+    def _delete_scale_requests(
+        cursor: sqlite3.Cursor, value: List[request.ScaleRequest], *, is_archive: Optional[bool] = False
     ) -> None:
-        raise NotImplementedError(
-            f"This method {SQLiteStoreContextManager._remove_scale_requests.__name__} " "should be called."
-        )
+        key_clause = " AND ".join(f"{column} IS ?" for column in _SQLITE_UNIQUE_KEY_COLUMNS)
+        delete_stmt = f"DELETE FROM {SQLiteStoreContextManager._table_name(is_archive)} WHERE {key_clause};"
+        with _sqlite_savepoint(cursor, "remove_requests"):
+            cursor.executemany(
+                delete_stmt,
+                [tuple(getattr(req, column) for column in _SQLITE_UNIQUE_KEY_COLUMNS) for req in value],
+            )
+            cursor.execute(SQLiteStoreContextManager._delete_orphan_payloads_stmt())
+
 
+@contextlib.contextmanager
+def _sqlite_savepoint(cursor: sqlite3.Cursor, name: str) -> Iterator[sqlite3.Cursor]:
+    """All statements executed within the context are either all applied or all rolled back.
 
-def _sqlite_connection(database: Optional[pathlib.Path] = None) -> sqlite3.Connection:
+    Uses `SAVEPOINT`_, instead of ``BEGIN``/``COMMIT``,
+    so it nests within any pending transaction without committing it.
+
+    .. _SAVEPOINT: https://www.sqlite.org/lang_savepoint.html
+    """
+    cursor.execute(f"SAVEPOINT {name};")
+    try:
+        yield cursor
+    except Exception:
+        cursor.execute(f"ROLLBACK TO SAVEPOINT {name};")
+        cursor.execute(f"RELEASE SAVEPOINT {name};")
+        raise
+    cursor.execute(f"RELEASE SAVEPOINT {name};")
+
+
+def _sqlite_connection(
+    database: Optional[pathlib.Path] = None,
+    performance_config: Optional[config.SqlitePerformanceConfig] = None,
+) -> sqlite3.Connection:
     """
+    If ``performance_config`` is given, it is applied, see :py:func:`_sqlite_apply_performance_config`.
+
     Do not cache the connection using external libraries as cachetools due to thread-safety.
     Sources:
     * https://ricardoanderegg.com/posts/python-sqlite-thread-safety/#conclusion
@@ -550,4 +1290,19 @@ def _sqlite_connection(database: Optional[pathlib.Path] = None) -> sqlite3.Conne
             "More information at: https://www.sqlite.org/threadsafe.html"
         )
     check_same_thread = sqlite3.threadsafety != 3
-    return sqlite3.connect(database, check_same_thread=check_same_thread)
+    result = sqlite3.connect(database, check_same_thread=check_same_thread)
+    result.create_function(_SQLITE_PAYLOAD_HASH_FUNCTION, 1, _sqlite_payload_hash, deterministic=True)
+    if performance_config is not None:
+        _sqlite_apply_performance_config(result, performance_config)
+    return result
+
+
+def _sqlite_apply_performance_config(connection: sqlite3.Connection, value: config.SqlitePerformanceConfig) -> None:
+    """Sets the pragmas, ``page_size`` first, since it only applies before the file is written."""
+    connection.execute(f"PRAGMA page_size = {value.page_size};")
+    journal_mode = connection.execute(f"PRAGMA journal_mode = {value.journal_mode};").fetchone()[0]
+    if journal_mode.upper() != value.journal_mode:
+        _LOGGER.info("SQLite journal mode %s is not available, using %s", value.journal_mode, journal_mode)
+    connection.execute(f"PRAGMA synchronous = {value.synchronous};")
+    # negative means in KiB instead of pages
+    connection.execute(f"PRAGMA cache_size = -{value.cache_size_in_kib};")
@@ -3,22 +3,95 @@
 
 .. _Google Cloud Storage: https://cloud.google.com/storage
 """
+import collections
+import gzip
+import os
 import pathlib
+import re
+import shutil
 import tempfile
-from typing import Optional
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
 
-from yaas_caching import file
-from yaas_common import logger
+from yaas_caching import base, delta, event, file, version_control
+from yaas_common import const, logger, request
+from yaas_config import config
 from yaas_gcp import gcs
 
 _LOGGER = logger.get(__name__)
 
+DEFAULT_LOCAL_CACHE_DIR: pathlib.Path = pathlib.Path(tempfile.gettempdir()) / "yaas_gcs_cache"
+"""
+Where downloaded objects are kept, between sessions, if no other directory is given.
+"""
+_LOCAL_CACHE_FILE_SUFFIX: str = ".db"
+_DELTA_OBJECT_PATH_SUFFIX: str = ".deltas"
+_DELTA_OBJECT_SUFFIX: str = ".json"
+_DELTA_SEQUENCE_WIDTH: int = 10
+_DEFAULT_MAX_CONFLICT_RETRIES: int = 5
+_SHARD_OBJECT_SUFFIX: str = ".db"
+_CURRENT_SHARD_DIR: str = "current"
+_ARCHIVE_SHARD_DIR: str = "archive"
+_CURRENT_SHARD_KEY_FORMAT: str = "%Y-%m-%d"
+_ARCHIVE_SHARD_KEY_FORMAT: str = "%Y-%m"
+_GZIP_COMPRESS_LEVEL: int = 6
+"""
+Compression level for :py:attr:`config.CacheCompression.GZIP`, a balance between speed and size.
+"""
+_COMPRESSION_BUFFER_SIZE: int = 1024 * 1024
+"""
+Files are (de)compressed in chunks of this size, so they are never fully in memory.
+"""
+
+
+class _RemoteChangedError(base.StoreError):
+    """The remote objects changed while being read."""
+
+
+def _requests_only_in_b(value: event.EventSnapshotComparison) -> event.EventSnapshot:
+    """Merge strategy that keeps only what is in ``snapshot_b`` but not in ``snapshot_a``."""
+    existing = set(value.snapshot_a.all_requests())
+    return event.EventSnapshot.from_list_requests(
+        source=value.snapshot_b.source,
+        request_lst=[req for req in value.snapshot_b.all_requests() if req not in existing],
+    )
+
 
 class GcsObjectStoreContextManager(file.SQLiteStoreContextManager):
     """This implementation is very simple remote storage for SQLite databases.
 
     It will, at opening, retrieve the remote object into the local file
     and, at closing, write the object with the local file content.
+
+    To avoid downloading an object that has not changed,
+    the last downloaded (or uploaded) copy is kept in ``local_cache_dir``, keyed by bucket, object, and
+    `generation`_. At opening, only the object metadata is retrieved and,
+    if the remote generation is already cached, the local copy is used instead.
+
+    To keep uploads proportional to what changed, instead of the whole database,
+    data modifying operations are journaled and, at closing, written as a small delta object next to the base::
+        <db_object_path>.deltas/<base generation>-<sequence>.json
+    At opening, all deltas for the current base generation are replayed, in order, on top of it.
+    Once there are ``delta_compaction_threshold`` deltas, the whole database is uploaded as a new base instead
+    and the previous deltas are deleted.
+
+    Concurrent writers, e.g., multiple Cloud Run instances, are handled optimistically:
+    * A delta is only written if its sequence slot is still free (``if_generation_match=0``);
+    * Before uploading a new base, a *sealed* delta takes the next slot, so no other writer appends to the old base;
+    * The new base is only uploaded if the base `generation`_ is still the one read (``if_generation_match``).
+    If any precondition fails, the remote state is read again, the journal is re-applied on top of it,
+    using :py:func:`version_control.merge` to skip requests already present, and the upload is retried.
+
+    The base object can be stored compressed, see ``compression`` and :py:class:`config.CacheCompression`,
+    with the corresponding ``Content-Encoding``. It is always downloaded as stored and decompressed locally,
+    so existing uncompressed objects are still read. The bytes transferred since opening are in
+    :py:attr:`bytes_downloaded` and :py:attr:`bytes_uploaded`.
+
+    Changes that cancel each other out, e.g., removing and writing back the same requests, do not cause an upload:
+    before the first change, the :py:meth:`file.SQLiteStoreContextManager.content_digest` of the remote state is kept
+    and, if it matches the local content when uploading, nothing is written, see :py:attr:`uploads_skipped`.
+
+    .. _generation: https://cloud.google.com/storage/docs/metadata#generation-number
     """
 
     def __init__(
@@ -27,12 +100,56 @@ class GcsObjectStoreContextManager(file.SQLiteStoreContextManager):
         bucket_name: str,
         db_object_path: str,
         project: Optional[str] = None,
+        local_cache_dir: Optional[pathlib.Path] = None,
+        delta_compaction_threshold: Optional[int] = None,
+        max_conflict_retries: Optional[int] = None,
+        compression: Optional[str] = None,
         **kwargs,
     ):
         self._bucket_name = gcs.validate_and_clean_bucket_name(bucket_name)
         self._db_object_path = gcs.validate_and_clean_object_path(db_object_path)
+        if local_cache_dir is None:
+            local_cache_dir = DEFAULT_LOCAL_CACHE_DIR
+        if not isinstance(local_cache_dir, pathlib.Path):
+            raise TypeError(
+                f"Local cache directory must be a {pathlib.Path.__name__}. "
+                f"Got: '{local_cache_dir}'({type(local_cache_dir)})"
+            )
+        if delta_compaction_threshold is None:
+            delta_compaction_threshold = config.DEFAULT_GCS_CACHE_DELTA_COMPACTION_THRESHOLD
+        if not isinstance(delta_compaction_threshold, int) or delta_compaction_threshold < 1:
+            raise ValueError(
+                "Delta compaction threshold must be an integer >= 1. "
+                f"Got: '{delta_compaction_threshold}'({type(delta_compaction_threshold)})"
+            )
+        if max_conflict_retries is None:
+            max_conflict_retries = _DEFAULT_MAX_CONFLICT_RETRIES
+        if not isinstance(max_conflict_retries, int) or max_conflict_retries < 0:
+            raise ValueError(
+                "Maximum conflict retries must be an integer >= 0. "
+                f"Got: '{max_conflict_retries}'({type(max_conflict_retries)})"
+            )
+        if compression is None:
+            compression = config.CacheCompression.default().value
+        self._compression = config.CacheCompression.from_str(compression)
+        if self._compression is None:
+            raise ValueError(
+                f"Compression must be one of {[val.value for val in config.CacheCompression]}. "
+                f"Got: '{compression}'({type(compression)})"
+            )
         super().__init__(sqlite_file=self._temporary_file(), source=self.gcs_uri, **kwargs)
         self._project = project
+        self._local_cache_dir = local_cache_dir
+        self._delta_compaction_threshold = delta_compaction_threshold
+        self._max_conflict_retries = max_conflict_retries
+        self._generation = None
+        self._is_sealed = False
+        self._delta_object_paths: List[str] = []
+        self._journal: List[delta.DeltaOperation] = []
+        self._bytes_downloaded = 0
+        self._bytes_uploaded = 0
+        self._uploads_skipped = 0
+        self._remote_digest: Optional[str] = None
 
     @staticmethod
     def _temporary_file() -> pathlib.Path:
@@ -58,13 +175,84 @@ class GcsObjectStoreContextManager(file.SQLiteStoreContextManager):
         """Google Cloud project ID."""
         return self._project
 
+    @property
+    def local_cache_dir(self) -> pathlib.Path:
+        """Where the downloaded objects are kept."""
+        return self._local_cache_dir
+
+    @property
+    def delta_compaction_threshold(self) -> int:
+        """How many delta objects are allowed before writing a new base object."""
+        return self._delta_compaction_threshold
+
+    @property
+    def max_conflict_retries(self) -> int:
+        """How many times to retry when the remote object changed concurrently."""
+        return self._max_conflict_retries
+
+    @property
+    def delta_object_paths(self) -> List[str]:
+        """Delta objects, in order, applied on top of the current base generation."""
+        return list(self._delta_object_paths)
+
+    @property
+    def generation(self) -> Optional[int]:
+        """Remote object generation the local file is based on, :py:obj:`None` if the object does not exist."""
+        return self._generation
+
+    @property
+    def compression(self) -> config.CacheCompression:
+        """How the base object is compressed when uploaded."""
+        return self._compression
+
+    @property
+    def bytes_downloaded(self) -> int:
+        """Bytes read from Cloud Storage, as stored, since it was opened."""
+        return self._bytes_downloaded
+
+    @property
+    def bytes_uploaded(self) -> int:
+        """Bytes written into Cloud Storage, as stored, since it was opened."""
+        return self._bytes_uploaded
+
+    @property
+    def uploads_skipped(self) -> int:
+        """Uploads avoided, since it was opened, because the content was the same as the remote one."""
+        return self._uploads_skipped
+
     async def _open(self) -> None:
-        exists = gcs.read_object(
+        self._bytes_downloaded = 0
+        self._bytes_uploaded = 0
+        self._uploads_skipped = 0
+        await self._read_remote()
+
+    async def _read_remote(self) -> None:
+        for attempt in range(self._max_conflict_retries + 1):
+            try:
+                await self._open_remote()
+                break
+            except _RemoteChangedError as err:
+                await self._close_connection()
+                if attempt >= self._max_conflict_retries:
+                    raise base.StoreError(
+                        f"Remote GCS object '{self.gcs_uri}' kept changing while being read, "
+                        f"gave up after {attempt + 1} attempts. Error: {err}"
+                    ) from err
+                _LOGGER.info("Remote GCS object '%s' changed while being read, retrying. Error: %s", self.gcs_uri, err)
+
+    async def _open_remote(self) -> None:
+        metadata = gcs.read_object_metadata(
             bucket_name=self._bucket_name,
             object_path=self._db_object_path,
-            filename=self.sqlite_file,
             project=self._project,
         )
+        self._generation = metadata.generation if metadata is not None else None
+        exists = self._generation is not None
+        if exists and not self._read_from_local_cache(self._generation):
+            exists = self._download_base(self._generation, content_encoding=metadata.content_encoding)
+            if not exists:
+                raise _RemoteChangedError(f"Generation {self._generation} is no longer available")
+            self._write_to_local_cache(self._generation)
         # To force creation of the file remotely
         if not exists:
             _LOGGER.warning(
@@ -72,21 +260,775 @@ class GcsObjectStoreContextManager(file.SQLiteStoreContextManager):
                 self.gcs_uri,
                 self.__class__.__name__,
             )
+            self._generation = None
             self._has_changed = True
+        self._journal = []
+        self._delta_object_paths = []
+        self._is_sealed = False
+        self._remote_digest = None
         await super()._open()
+        if self._generation is not None:
+            await self._replay_deltas()
 
-    async def _close(self) -> None:
-        await super()._close()
-        if self.has_changed:
-            gcs.write_object(
+    def _download_base(self, generation: int, *, content_encoding: Optional[str] = None) -> bool:
+        """Downloads the base object, as stored, and decompresses it, if needed, into the local file.
+
+        Returns:
+            :py:obj:`False` if the generation is no longer available.
+        """
+        compression = config.CacheCompression.from_str(content_encoding) if content_encoding else None
+        if content_encoding and compression in (None, config.CacheCompression.NONE):
+            raise base.StoreError(f"Remote GCS object '{self.gcs_uri}' has unsupported encoding '{content_encoding}'")
+        target = self._compressed_file() if compression is not None else self.sqlite_file
+        try:
+            result = gcs.read_object(
                 bucket_name=self._bucket_name,
                 object_path=self._db_object_path,
-                content_source=self.sqlite_file,
+                filename=target,
+                project=self._project,
+                generation=generation,
+                raw_download=True,
+            )
+            if result:
+                self._bytes_downloaded += target.stat().st_size
+                if compression is not None:
+                    _decompress_file(target, self.sqlite_file)
+        finally:
+            if compression is not None:
+                target.unlink(missing_ok=True)
+        return result
+
+    def _compressed_file(self) -> pathlib.Path:
+        return self.sqlite_file.with_name(f"{self.sqlite_file.name}.{self._compression.value}")
+
+    def _delta_object_prefix(self, generation: int) -> str:
+        return f"{self._db_object_path}{_DELTA_OBJECT_PATH_SUFFIX}{gcs.GCS_PATH_SEP}{generation}-"
+
+    async def _replay_deltas(self) -> None:
+        """Replays, in order, all deltas not yet in :py:attr:`delta_object_paths`."""
+        replayed = set(self._delta_object_paths)
+        object_path_lst = sorted(
+            blob.name
+            for blob in gcs.list_objects(
+                bucket_name=self._bucket_name,
+                prefix=self._delta_object_prefix(self._generation),
                 project=self._project,
             )
+            if blob.name not in replayed
+        )
+        for object_path in object_path_lst:
+            content = gcs.read_object(
+                bucket_name=self._bucket_name,
+                object_path=object_path,
+                project=self._project,
+                warn_read_failure=False,
+            )
+            if content is None:
+                raise _RemoteChangedError(f"Delta object '{object_path}' is no longer available")
+            self._bytes_downloaded += len(content)
+            try:
+                value = delta.StoreDelta.from_json(content, context=object_path)
+            except Exception as err:
+                raise base.StoreError(f"Could not parse delta object '{object_path}'. Error: {err}") from err
+            if value.base_generation != self._generation:
+                raise base.StoreError(
+                    f"Delta object '{object_path}' is based on generation {value.base_generation}, "
+                    f"expected generation {self._generation}"
+                )
+            for operation in value.operations:
+                await self._apply_delta_operation(operation)
+            self._delta_object_paths.append(object_path)
+            self._is_sealed = self._is_sealed or value.is_sealed
+        if object_path_lst:
+            _LOGGER.info(
+                "Replayed %d delta objects on top of '%s' generation %s",
+                len(object_path_lst),
+                self.gcs_uri,
+                self._generation,
+            )
+
+    async def _apply_delta_operation(self, value: delta.DeltaOperation) -> None:
+        """Applies the operation, without journaling it."""
+        operation_type = delta.DeltaOperationType.from_str(value.type)
+        if operation_type == delta.DeltaOperationType.WRITE:
+            await super()._write_scale_requests(value.requests, is_archive=value.is_archive)
+        elif operation_type == delta.DeltaOperationType.REMOVE_REQUESTS:
+            await super()._remove_scale_requests(value.requests, is_archive=value.is_archive)
+        elif operation_type == delta.DeltaOperationType.REMOVE:
+            await super()._remove_scale_requests_in_range_from_db(
+                start_ts_utc=value.start_ts_utc, end_ts_utc=value.end_ts_utc, is_archive=value.is_archive
+            )
+        elif operation_type == delta.DeltaOperationType.ARCHIVE:
+            await super()._archive_scale_requests_in_range_from_db(
+                start_ts_utc=value.start_ts_utc, end_ts_utc=value.end_ts_utc
+            )
+        else:
+            raise base.StoreError(f"Delta operation type '{value.type}' is not supported. Operation: {value}")
+
+    async def _rebase_delta_operation(self, value: delta.DeltaOperation) -> None:
+        """Applies the operation, journaling it, on top of a possibly different state than the original."""
+        operation_type = delta.DeltaOperationType.from_str(value.type)
+        if operation_type == delta.DeltaOperationType.WRITE:
+            to_write = self._snapshot_from_request_lst(value.requests)
+            start_ts_utc, end_ts_utc = to_write.range()
+            existing = self._snapshot_from_request_lst(
+                [
+                    req
+                    async for req in self._read_scale_requests(
+                        start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, is_archive=value.is_archive
+                    )
+                ]
+            )
+            is_required, merged = version_control.merge(
+                snapshot_a=existing, snapshot_b=to_write, merge_strategy=_requests_only_in_b
+            )
+            if is_required and merged.all_requests():
+                await self._write_scale_requests(merged.all_requests(), is_archive=value.is_archive)
+        elif operation_type == delta.DeltaOperationType.REMOVE_REQUESTS:
+            await self._remove_scale_requests(value.requests, is_archive=value.is_archive)
+        elif operation_type == delta.DeltaOperationType.REMOVE:
+            await self._remove_scale_requests_in_range_from_db(
+                start_ts_utc=value.start_ts_utc, end_ts_utc=value.end_ts_utc, is_archive=value.is_archive
+            )
+        elif operation_type == delta.DeltaOperationType.ARCHIVE:
+            await self._archive_scale_requests_in_range_from_db(
+                start_ts_utc=value.start_ts_utc, end_ts_utc=value.end_ts_utc
+            )
+        else:
+            raise base.StoreError(f"Delta operation type '{value.type}' is not supported. Operation: {value}")
+
+    async def _keep_remote_digest(self) -> None:
+        """Keeps the digest of the remote state, i.e., before any local change, see :py:meth:`_is_same_as_remote`."""
+        if self._remote_digest is None and not self._journal and self._generation is not None:
+            self._remote_digest = await self.content_digest()
+
+    async def _is_same_as_remote(self) -> bool:
+        return (
+            self._generation is not None
+            and self._remote_digest is not None
+            and await self.content_digest() == self._remote_digest
+        )
+
+    async def _write_scale_requests(
+        self, value: List[request.ScaleRequest], *, is_archive: Optional[bool] = False
+    ) -> List[request.ScaleRequest]:
+        await self._keep_remote_digest()
+        result = await super()._write_scale_requests(value, is_archive=is_archive)
+        if result:
+            self._journal.append(
+                delta.DeltaOperation(
+                    type=delta.DeltaOperationType.WRITE.value, is_archive=bool(is_archive), requests=list(result)
+                )
+            )
+        return result
+
+    async def _remove_scale_requests(
+        self, value: List[request.ScaleRequest], *, is_archive: Optional[bool] = False
+    ) -> List[request.ScaleRequest]:
+        await self._keep_remote_digest()
+        result = await super()._remove_scale_requests(value, is_archive=is_archive)
+        if result:
+            self._journal.append(
+                delta.DeltaOperation(
+                    type=delta.DeltaOperationType.REMOVE_REQUESTS.value,
+                    is_archive=bool(is_archive),
+                    requests=list(result),
+                )
+            )
+        return result
+
+    async def _remove_scale_requests_in_range_from_db(
+        self,
+        *,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+        is_archive: Optional[bool] = False,
+    ) -> List[request.ScaleRequest]:
+        await self._keep_remote_digest()
+        result = await super()._remove_scale_requests_in_range_from_db(
+            start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, is_archive=is_archive
+        )
+        if result:
+            self._journal.append(
+                delta.DeltaOperation(
+                    type=delta.DeltaOperationType.REMOVE.value,
+                    is_archive=bool(is_archive),
+                    start_ts_utc=start_ts_utc,
+                    end_ts_utc=end_ts_utc,
+                )
+            )
+        return result
+
+    async def _archive_scale_requests_in_range_from_db(
+        self,
+        *,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+    ) -> List[request.ScaleRequest]:
+        await self._keep_remote_digest()
+        result = await super()._archive_scale_requests_in_range_from_db(
+            start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc
+        )
+        if result:
+            self._journal.append(
+                delta.DeltaOperation(
+                    type=delta.DeltaOperationType.ARCHIVE.value,
+                    start_ts_utc=start_ts_utc,
+                    end_ts_utc=end_ts_utc,
+                )
+            )
+        return result
+
+    def _local_cache_file(self, generation: int) -> pathlib.Path:
+        return (
+            self._local_cache_dir / self._bucket_name / self._db_object_path / f"{generation}{_LOCAL_CACHE_FILE_SUFFIX}"
+        )
+
+    def _read_from_local_cache(self, generation: int) -> bool:
+        cache_file = self._local_cache_file(generation)
+        try:
+            shutil.copyfile(cache_file, self.sqlite_file)
+            result = True
+            _LOGGER.info("Using local copy '%s' for '%s' generation %s", cache_file, self.gcs_uri, generation)
+        except FileNotFoundError:
+            result = False
+        except Exception as err:  # pylint: disable=broad-except
+            _LOGGER.warning("Could not copy local copy '%s' into '%s'. Error: %s", cache_file, self.sqlite_file, err)
+            result = False
+        return result
+
+    def _write_to_local_cache(self, generation: int) -> None:
+        """Keeps a copy of the local file as the given generation, discarding copies of other generations.
+
+        The copy is renamed into place, so concurrent readers never see a partial file.
+        """
+        cache_file = self._local_cache_file(generation)
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=cache_file.parent, delete=False) as tmp_file:
+                tmp_path = pathlib.Path(tmp_file.name)
+            shutil.copyfile(self.sqlite_file, tmp_path)
+            os.replace(tmp_path, cache_file)
+            for stale_file in cache_file.parent.glob(f"*{_LOCAL_CACHE_FILE_SUFFIX}"):
+                if stale_file != cache_file:
+                    stale_file.unlink(missing_ok=True)
+        except Exception as err:  # pylint: disable=broad-except
+            _LOGGER.warning(
+                "Could not keep local copy of '%s' generation %s in '%s'. Ignoring. Error: %s",
+                self.gcs_uri,
+                generation,
+                cache_file,
+                err,
+            )
+
+    async def _close(self) -> None:
+        if self.has_changed:
+            await self._upload()
         else:
             _LOGGER.debug(
                 "There are not changes to the local file %s, not uploading to %s",
                 self.sqlite_file,
                 self.gcs_uri,
             )
+        await super()._close()
+        _LOGGER.info(
+            "Transferred %d bytes down and %d bytes up, skipped %d unchanged uploads, for '%s'",
+            self._bytes_downloaded,
+            self._bytes_uploaded,
+            self._uploads_skipped,
+            self.gcs_uri,
+        )
+
+    async def _flush(self) -> None:
+        await self._upload()
+
+    async def _upload(self) -> None:
+        if await self._is_same_as_remote():
+            await super()._flush()
+            self._uploads_skipped += 1
+            _LOGGER.info(
+                "Content of %s is the same as '%s' generation %s, discarding %d operations and not uploading",
+                self.sqlite_file,
+                self.gcs_uri,
+                self._generation,
+                len(self._journal),
+            )
+        else:
+            await self._upload_with_retries()
+        self._has_changed = False
+        self._journal = []
+        self._remote_digest = None
+
+    async def _upload_with_retries(self) -> None:
+        for attempt in range(self._max_conflict_retries + 1):
+            await self._commit_and_compact()
+            try:
+                self._write_remote()
+                break
+            except gcs.PreconditionFailedError as err:
+                if attempt >= self._max_conflict_retries:
+                    raise base.StoreError(
+                        f"Remote GCS object '{self.gcs_uri}' kept changing concurrently, "
+                        f"gave up uploading after {attempt + 1} attempts. Error: {err}"
+                    ) from err
+                _LOGGER.warning(
+                    "Remote GCS object '%s' changed concurrently, re-applying %d operations and retrying. Error: %s",
+                    self.gcs_uri,
+                    len(self._journal),
+                    err,
+                )
+                await self._close_connection()
+                await self._rebase()
+
+    async def _refresh(self) -> bool:
+        """Only the object metadata and the delta listing are retrieved.
+        New deltas on top of the same base are replayed, a new base is read again."""
+        metadata = gcs.read_object_metadata(
+            bucket_name=self._bucket_name,
+            object_path=self._db_object_path,
+            project=self._project,
+        )
+        generation = metadata.generation if metadata is not None else None
+        if generation is None and self._generation is None:
+            return False
+        if generation == self._generation:
+            amount_deltas = len(self._delta_object_paths)
+            try:
+                await self._replay_deltas()
+                result = len(self._delta_object_paths) > amount_deltas
+                if result:
+                    self._remote_digest = None
+                return result
+            except _RemoteChangedError as err:
+                _LOGGER.info("Deltas of '%s' changed while being read, reading it again. Error: %s", self.gcs_uri, err)
+        _LOGGER.info(
+            "Remote GCS object '%s' changed from generation %s to %s, reading it again",
+            self.gcs_uri,
+            self._generation,
+            generation,
+        )
+        await self._close_connection()
+        await self._read_remote()
+        return True
+
+    async def _rebase(self) -> None:
+        """Reads the remote state again and re-applies the journal on top of it."""
+        journal = self._journal
+        await self._read_remote()
+        for operation in journal:
+            await self._rebase_delta_operation(operation)
+        self._has_changed = True
+
+    def _write_remote(self) -> None:
+        if self._generation is not None and not self._is_sealed:
+            if self._journal and len(self._delta_object_paths) + 1 < self._delta_compaction_threshold:
+                self._write_delta()
+                return
+            # claims the next slot, so nobody else appends to the current base
+            self._write_delta(is_sealed=True)
+        self._write_base()
+
+    def _write_delta(self, *, is_sealed: bool = False) -> None:
+        object_path = (
+            f"{self._delta_object_prefix(self._generation)}"
+            f"{len(self._delta_object_paths):0{_DELTA_SEQUENCE_WIDTH}d}{_DELTA_OBJECT_SUFFIX}"
+        )
+        content = (
+            delta.StoreDelta(base_generation=self._generation, operations=self._journal, is_sealed=is_sealed)
+            .as_json()
+            .encode(const.ENCODING_UTF8)
+        )
+        gcs.write_object(
+            bucket_name=self._bucket_name,
+            object_path=object_path,
+            content_source=content,
+            project=self._project,
+            if_generation_match=0,
+        )
+        self._bytes_uploaded += len(content)
+        self._delta_object_paths.append(object_path)
+        self._is_sealed = is_sealed
+        _LOGGER.info(
+            "Wrote %d operations as %sdelta '%s' on top of '%s' generation %s",
+            len(self._journal),
+            "sealed " if is_sealed else "",
+            object_path,
+            self.gcs_uri,
+            self._generation,
+        )
+
+    def _write_base(self) -> None:
+        """Uploads the whole database as a new base, compacting all deltas into it."""
+        stale_delta_object_paths = self._delta_object_paths
+        is_compressed = self._compression != config.CacheCompression.NONE
+        content_source = self._compressed_file() if is_compressed else self.sqlite_file
+        try:
+            if is_compressed:
+                _compress_file(self.sqlite_file, content_source)
+            generation = gcs.write_object(
+                bucket_name=self._bucket_name,
+                object_path=self._db_object_path,
+                content_source=content_source,
+                project=self._project,
+                if_generation_match=self._generation if self._generation is not None else 0,
+                content_encoding=self._compression.value if is_compressed else None,
+            )
+            self._bytes_uploaded += content_source.stat().st_size
+        finally:
+            if is_compressed:
+                content_source.unlink(missing_ok=True)
+        self._generation = generation
+        self._delta_object_paths = []
+        self._is_sealed = False
+        if generation is not None:
+            self._write_to_local_cache(generation)
+        self._delete_deltas(stale_delta_object_paths)
+
+    def _delete_deltas(self, object_path_lst: List[str]) -> None:
+        for object_path in object_path_lst:
+            try:
+                gcs.delete_object(bucket_name=self._bucket_name, object_path=object_path, project=self._project)
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.warning("Could not delete delta '%s'. Ignoring. Error: %s", object_path, err)
+
+    async def remove_if_empty(self) -> bool:
+        """Deletes the remote object, and its deltas, instead of uploading the changes, if the store became empty.
+
+        The current base is sealed first, with a delta holding the pending operations,
+        so no other writer can append to it while it is deleted.
+        If the seal can not be written, another writer changed the remote state concurrently,
+        it is read again, the journal is re-applied on top of it, and nothing is deleted.
+
+        Returns:
+            :py:obj:`True` if there is no remote object anymore, nothing is left to upload.
+        """
+        if not self.has_changed or not await self.is_empty():
+            return False
+        if self._generation is not None:
+            if self._is_sealed:
+                # another writer is replacing the base, it is left to upload it
+                return False
+            try:
+                self._write_delta(is_sealed=True)
+            except gcs.PreconditionFailedError as err:
+                _LOGGER.info(
+                    "Remote GCS object '%s' changed concurrently, not deleting it. Error: %s", self.gcs_uri, err
+                )
+                await self._close_connection()
+                await self._rebase()
+                return False
+            gcs.delete_object(
+                bucket_name=self._bucket_name,
+                object_path=self._db_object_path,
+                project=self._project,
+                if_generation_match=self._generation,
+            )
+            self._delete_deltas(self._delta_object_paths)
+            _LOGGER.info("Deleted empty '%s' generation %s", self.gcs_uri, self._generation)
+        self._generation = None
+        self._delta_object_paths = []
+        self._is_sealed = False
+        self._has_changed = False
+        self._journal = []
+        self._remote_digest = None
+        return True
+
+
+def _compress_file(source: pathlib.Path, target: pathlib.Path) -> None:
+    with open(source, "rb") as in_file, gzip.open(target, "wb", compresslevel=_GZIP_COMPRESS_LEVEL) as out_file:
+        shutil.copyfileobj(in_file, out_file, _COMPRESSION_BUFFER_SIZE)
+
+
+def _decompress_file(source: pathlib.Path, target: pathlib.Path) -> None:
+    try:
+        with gzip.open(source, "rb") as in_file, open(target, "wb") as out_file:
+            shutil.copyfileobj(in_file, out_file, _COMPRESSION_BUFFER_SIZE)
+    except Exception as err:
+        raise base.StoreError(f"Could not decompress '{source}' into '{target}'. Error: {err}") from err
+
+
+class ShardedGcsObjectStoreContextManager(base.StoreContextManager):
+    """Splits the store into one :py:class:`GcsObjectStoreContextManager` object per time bucket,
+    a day for current requests and a month for archived requests::
+        <object_prefix>/current/<YYYY-MM-DD>.db
+        <object_prefix>/archive/<YYYY-MM>.db
+
+    At opening, only the existing shards are listed.
+    A shard is only opened, i.e., downloaded, the first time an operation touches its time bucket,
+    so reading a short window only downloads the shards overlapping it.
+    All opened shards are closed, i.e., uploaded if changed, at closing.
+    Flushing and refreshing only touch the shards opened so far.
+
+    **NOTE**: archived requests are kept in the *current* table of the archive shards.
+    """
+
+    def __init__(
+        self,
+        *,
+        bucket_name: str,
+        object_prefix: str,
+        project: Optional[str] = None,
+        local_cache_dir: Optional[pathlib.Path] = None,
+        delta_compaction_threshold: Optional[int] = None,
+        max_conflict_retries: Optional[int] = None,
+        performance_config: Optional[config.SqlitePerformanceConfig] = None,
+        compression: Optional[str] = None,
+        **kwargs,
+    ):
+        self._bucket_name = gcs.validate_and_clean_bucket_name(bucket_name)
+        self._object_prefix = gcs.validate_and_clean_object_path(object_prefix)
+        super().__init__(source=self.gcs_uri, **kwargs)
+        self._shard_kwargs = dict(
+            project=project,
+            local_cache_dir=local_cache_dir,
+            delta_compaction_threshold=delta_compaction_threshold,
+            max_conflict_retries=max_conflict_retries,
+            performance_config=performance_config,
+            compression=compression,
+            **kwargs,
+        )
+        self._project = project
+        self._existing_shard_keys: Dict[bool, Set[str]] = {False: set(), True: set()}
+        self._open_shards: Dict[Tuple[bool, str], GcsObjectStoreContextManager] = {}
+
+    @property
+    def bucket_name(self) -> str:
+        """Remote GCS bucket name."""
+        return self._bucket_name
+
+    @property
+    def object_prefix(self) -> str:
+        """Remote GCS prefix for all shards."""
+        return self._object_prefix
+
+    @property
+    def gcs_uri(self) -> str:
+        """GCS URI."""
+        return f"gs://{self._bucket_name}/{self._object_prefix}"
+
+    def existing_shard_keys(self, is_archive: Optional[bool] = False) -> List[str]:
+        """Sorted time bucket keys of all known shards."""
+        return sorted(self._existing_shard_keys[bool(is_archive)])
+
+    def open_shard_keys(self, is_archive: Optional[bool] = False) -> List[str]:
+        """Sorted time bucket keys of all shards opened so far."""
+        return sorted(key for shard_is_archive, key in self._open_shards if shard_is_archive == bool(is_archive))
+
+    def _shard_dir(self, is_archive: bool) -> str:
+        return gcs.GCS_PATH_SEP.join([self._object_prefix, _ARCHIVE_SHARD_DIR if is_archive else _CURRENT_SHARD_DIR])
+
+    def _shard_object_path(self, key: str, is_archive: bool) -> str:
+        return f"{self._shard_dir(is_archive)}{gcs.GCS_PATH_SEP}{key}{_SHARD_OBJECT_SUFFIX}"
+
+    @staticmethod
+    def _shard_key(value: int, is_archive: bool) -> str:
+        key_format = _ARCHIVE_SHARD_KEY_FORMAT if is_archive else _CURRENT_SHARD_KEY_FORMAT
+        return datetime.fromtimestamp(value, tz=timezone.utc).strftime(key_format)
+
+    @staticmethod
+    def _shard_range(key: str, is_archive: bool) -> Tuple[int, int]:
+        """Returns the inclusive range of timestamps, in seconds, covered by the shard."""
+        key_format = _ARCHIVE_SHARD_KEY_FORMAT if is_archive else _CURRENT_SHARD_KEY_FORMAT
+        start = datetime.strptime(key, key_format).replace(tzinfo=timezone.utc)
+        if is_archive:
+            end = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        else:
+            end = start + timedelta(days=1)
+        return int(start.timestamp()), int(end.timestamp()) - 1
+
+    async def _open(self) -> None:
+        for is_archive in (False, True):
+            self._existing_shard_keys[is_archive] = self._list_shard_keys(is_archive)
+        _LOGGER.debug(
+            "Found %d current and %d archive shards in '%s'",
+            len(self._existing_shard_keys[False]),
+            len(self._existing_shard_keys[True]),
+            self.gcs_uri,
+        )
+
+    def _list_shard_keys(self, is_archive: bool) -> Set[str]:
+        shard_dir = self._shard_dir(is_archive)
+        name_regex = re.compile(
+            rf"^{re.escape(shard_dir + gcs.GCS_PATH_SEP)}"
+            rf"(?P<key>[^{gcs.GCS_PATH_SEP}]+)"
+            rf"{re.escape(_SHARD_OBJECT_SUFFIX)}$"
+        )
+        result = set()
+        for blob in gcs.list_objects(bucket_name=self._bucket_name, prefix=shard_dir, project=self._project):
+            match = name_regex.match(blob.name)
+            if match:
+                key = match.group("key")
+                try:
+                    self._shard_range(key, is_archive)
+                    result.add(key)
+                except ValueError as err:
+                    _LOGGER.warning("Ignoring object '%s', it is not a valid shard. Error: %s", blob.name, err)
+        return result
+
+    def _overlapping_shard_keys(
+        self, start_ts_utc: Optional[int], end_ts_utc: Optional[int], is_archive: bool
+    ) -> List[Tuple[str, int, int]]:
+        """Returns all existing shards, in order, overlapping the range as: ``<key>,<start>,<end>``,
+        where start and end are the range clipped to the shard."""
+        result = []
+        for key in sorted(self._existing_shard_keys[is_archive]):
+            shard_start, shard_end = self._shard_range(key, is_archive)
+            if (start_ts_utc is None or shard_end >= start_ts_utc) and (
+                end_ts_utc is None or shard_start <= end_ts_utc
+            ):
+                result.append(
+                    (
+                        key,
+                        shard_start if start_ts_utc is None else max(shard_start, start_ts_utc),
+                        shard_end if end_ts_utc is None else min(shard_end, end_ts_utc),
+                    )
+                )
+        return result
+
+    async def _shard(self, key: str, is_archive: bool) -> GcsObjectStoreContextManager:
+        result = self._open_shards.get((is_archive, key))
+        if result is None:
+            result = GcsObjectStoreContextManager(
+                bucket_name=self._bucket_name,
+                db_object_path=self._shard_object_path(key, is_archive),
+                **self._shard_kwargs,
+            )
+            await result.__aenter__()  # pylint: disable=unnecessary-dunder-call
+            self._open_shards[(is_archive, key)] = result
+            self._existing_shard_keys[is_archive].add(key)
+        return result
+
+    async def _close(self) -> None:
+        errors = []
+        for (is_archive, key), shard in sorted(self._open_shards.items()):
+            try:
+                await self._close_shard(key, is_archive, shard)
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.error("Could not close shard '%s'. Error: %s", shard.gcs_uri, err)
+                errors.append(err)
+        self._open_shards = {}
+        if errors:
+            raise base.StoreError(f"Could not close {len(errors)} shards of '{self.gcs_uri}'. Errors: {errors}")
+
+    async def _flush(self) -> None:
+        for _, shard in sorted(self._open_shards.items()):
+            await shard.flush()
+
+    async def _refresh(self) -> bool:
+        """Lists the shards again, closes opened shards that were removed and refreshes the remaining ones."""
+        await self._open()
+        result = False
+        for (is_archive, key), shard in sorted(self._open_shards.items()):
+            if key in self._existing_shard_keys[is_archive]:
+                result = await shard.refresh() or result
+            else:
+                _LOGGER.info("Shard '%s' was removed, closing it", shard.gcs_uri)
+                await shard.__aexit__(None, None, None)
+                del self._open_shards[(is_archive, key)]
+                result = True
+        return result
+
+    async def _close_shard(self, key: str, is_archive: bool, shard: GcsObjectStoreContextManager) -> None:
+        """Closes the shard and, if it became empty, deletes it so it is neither listed nor opened again,
+        see :py:meth:`GcsObjectStoreContextManager.remove_if_empty`."""
+        try:
+            is_removed = await shard.remove_if_empty()
+        finally:
+            await shard.__aexit__(None, None, None)
+        if is_removed:
+            self._existing_shard_keys[is_archive].discard(key)
+            _LOGGER.info("Removed empty shard '%s'", shard.gcs_uri)
+
+    async def _read(
+        self,
+        *,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+        is_archive: Optional[bool] = False,
+    ) -> event.EventSnapshot:
+        is_archive = bool(is_archive)
+        request_lst = []
+        for key, shard_start_ts_utc, shard_end_ts_utc in self._overlapping_shard_keys(
+            start_ts_utc, end_ts_utc, is_archive
+        ):
+            shard = await self._shard(key, is_archive)
+            snapshot = await shard.read(start_ts_utc=shard_start_ts_utc, end_ts_utc=shard_end_ts_utc)
+            request_lst.extend(snapshot.all_requests())
+        return self._snapshot_from_request_lst(request_lst)
+
+    async def _read_iter(
+        self,
+        *,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+        is_archive: Optional[bool] = False,
+        batch_size: int,
+    ) -> AsyncIterator[List[request.ScaleRequest]]:
+        async for batch in self._batched(
+            self._read_shards_iter(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, is_archive=bool(is_archive)),
+            batch_size,
+        ):
+            yield batch
+
+    async def _read_shards_iter(
+        self, *, start_ts_utc: Optional[int], end_ts_utc: Optional[int], is_archive: bool
+    ) -> AsyncIterator[request.ScaleRequest]:
+        for key, shard_start_ts_utc, shard_end_ts_utc in self._overlapping_shard_keys(
+            start_ts_utc, end_ts_utc, is_archive
+        ):
+            shard = await self._shard(key, is_archive)
+            async for batch in shard.read_iter(start_ts_utc=shard_start_ts_utc, end_ts_utc=shard_end_ts_utc):
+                for req in batch:
+                    yield req
+
+    async def _write(self, value: event.EventSnapshot) -> None:
+        await self._write_to_shards(value.all_requests(), is_archive=False)
+
+    async def _write_to_shards(self, value: List[request.ScaleRequest], *, is_archive: bool) -> None:
+        key_to_requests = collections.defaultdict(list)
+        for req in value:
+            key_to_requests[self._shard_key(req.timestamp_utc, is_archive)].append(req)
+        for key, request_lst in sorted(key_to_requests.items()):
+            shard = await self._shard(key, is_archive)
+            await shard.write(self._snapshot_from_request_lst(request_lst), overwrite_within_range=False)
+
+    async def _remove_requests(self, value: List[request.ScaleRequest]) -> None:
+        key_to_requests = collections.defaultdict(list)
+        for req in value:
+            key_to_requests[self._shard_key(req.timestamp_utc, False)].append(req)
+        for key, request_lst in sorted(key_to_requests.items()):
+            if key in self._existing_shard_keys[False]:
+                shard = await self._shard(key, False)
+                await shard.apply(event.EventSnapshotDiff(to_remove=self._snapshot_from_request_lst(request_lst)))
+
+    async def _remove(
+        self,
+        *,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+        is_archive: Optional[bool] = False,
+    ) -> event.EventSnapshot:
+        is_archive = bool(is_archive)
+        request_lst = []
+        for key, shard_start_ts_utc, shard_end_ts_utc in self._overlapping_shard_keys(
+            start_ts_utc, end_ts_utc, is_archive
+        ):
+            shard = await self._shard(key, is_archive)
+            snapshot = await shard.remove(start_ts_utc=shard_start_ts_utc, end_ts_utc=shard_end_ts_utc)
+            request_lst.extend(snapshot.all_requests())
+        return self._snapshot_from_request_lst(request_lst)
+
+    async def _archive(
+        self, *, start_ts_utc: Optional[int] = None, end_ts_utc: Optional[int] = None
+    ) -> event.EventSnapshot:
+        """Requests are first written into the archive shards and only then removed from the current shards.
+        If it fails in between, requests are duplicated, never lost."""
+        request_lst = []
+        for key, shard_start_ts_utc, shard_end_ts_utc in self._overlapping_shard_keys(start_ts_utc, end_ts_utc, False):
+            shard = await self._shard(key, False)
+            to_archive = await shard.read(start_ts_utc=shard_start_ts_utc, end_ts_utc=shard_end_ts_utc)
+            if to_archive.all_requests():
+                await self._write_to_shards(to_archive.all_requests(), is_archive=True)
+                await shard.remove(start_ts_utc=shard_start_ts_utc, end_ts_utc=shard_end_ts_utc)
+                request_lst.extend(to_archive.all_requests())
+        return self._snapshot_from_request_lst(request_lst)
@@ -0,0 +1,292 @@
+# vim: ai:sw=4:ts=4:sta:et:fo=croql
+"""Stores that keep :py:class:`event.EventSnapshot` content in memory, either on their own,
+:py:class:`MemoryStoreContextManager`, or in front of a durable store, :py:class:`TieredStoreContextManager`.
+
+Usage::
+    store = TieredStoreContextManager(durable=file.SQLiteStoreContextManager(sqlite_file="cache.db"))
+    async with store:
+        # first read loads from SQLite, the following ones, within TTL, are served from memory
+        snapshot = await store.read(start_ts_utc=now, end_ts_utc=now + 3600)
+"""
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from yaas_caching import base, event
+from yaas_common import logger, request
+
+_LOGGER = logger.get(__name__)
+
+
+def _now() -> float:
+    return time.monotonic()
+
+
+class _MemoryTable:
+    """Requests by timestamp, each timestamp expires ``ttl_in_sec`` after it was last written."""
+
+    def __init__(self, *, source: str, ttl_in_sec: Optional[int]):
+        self._ttl_in_sec = ttl_in_sec
+        self._snapshot = event.EventSnapshot(source=source)
+        # insertion ordered, the least recently written timestamp first
+        self._written_at: Dict[int, float] = {}
+
+    def _evict(self) -> None:
+        if self._ttl_in_sec is None:
+            return
+        now = _now()
+        for ts_utc, written_at in list(self._written_at.items()):
+            if now - written_at < self._ttl_in_sec:
+                break
+            del self._written_at[ts_utc]
+            self._snapshot.timestamp_to_request.pop(ts_utc, None)
+
+    def slice(self, start_ts_utc: int, end_ts_utc: int) -> Dict[int, List[request.ScaleRequest]]:
+        self._evict()
+        result = self._snapshot.slice(start_ts_utc, end_ts_utc)
+        return {ts_utc: list(req_lst) for ts_utc, req_lst in result.timestamp_to_request.items()}
+
+    def add(self, value: Dict[int, List[request.ScaleRequest]]) -> None:
+        self._evict()
+        now = _now()
+        timestamp_to_request = self._snapshot.timestamp_to_request
+        for ts_utc, req_lst in value.items():
+            if not req_lst:
+                continue
+            existing = timestamp_to_request.get(ts_utc)
+            if existing is None:
+                timestamp_to_request[ts_utc] = list(req_lst)
+            else:
+                # a new list, so the snapshot notices the change
+                timestamp_to_request[ts_utc] = existing + [req for req in req_lst if req not in existing]
+            self._written_at.pop(ts_utc, None)
+            self._written_at[ts_utc] = now
+
+    def pop(self, start_ts_utc: int, end_ts_utc: int) -> Dict[int, List[request.ScaleRequest]]:
+        result = self.slice(start_ts_utc, end_ts_utc)
+        for ts_utc in result:
+            del self._snapshot.timestamp_to_request[ts_utc]
+            del self._written_at[ts_utc]
+        return result
+
+    def remove(self, value: List[request.ScaleRequest]) -> None:
+        self._evict()
+        timestamp_to_request = self._snapshot.timestamp_to_request
+        for req in value:
+            existing = timestamp_to_request.get(req.timestamp_utc)
+            if existing is not None and req in existing:
+                remaining = list(existing)
+                remaining.remove(req)
+                if remaining:
+                    timestamp_to_request[req.timestamp_utc] = remaining
+                else:
+                    del timestamp_to_request[req.timestamp_utc]
+                    del self._written_at[req.timestamp_utc]
+
+    def clear(self) -> None:
+        self._snapshot.timestamp_to_request.clear()
+        self._written_at.clear()
+
+
+class MemoryStoreContextManager(base.StoreContextManager):
+    """Keeps everything in memory, requests expire ``ttl_in_sec`` after their timestamp was last written.
+
+    **NOTE**: content is lost when the instance is discarded.
+    """
+
+    def __init__(self, *, ttl_in_sec: Optional[int] = None, **kwargs):
+        super().__init__(**kwargs)
+        if ttl_in_sec is not None and (not isinstance(ttl_in_sec, int) or ttl_in_sec < 1):
+            raise ValueError(f"TTL must be None or an integer >= 1. Got: '{ttl_in_sec}'({type(ttl_in_sec)})")
+        self._ttl_in_sec = ttl_in_sec
+        self._current = _MemoryTable(source=self.source, ttl_in_sec=ttl_in_sec)
+        self._archive_table = _MemoryTable(source=self.source, ttl_in_sec=ttl_in_sec)
+
+    @property
+    def ttl_in_sec(self) -> Optional[int]:
+        """For how long requests are kept, :py:obj:`None` means forever."""
+        return self._ttl_in_sec
+
+    def _table(self, is_archive: bool) -> _MemoryTable:
+        return self._archive_table if is_archive else self._current
+
+    async def _read(
+        self,
+        *,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+        is_archive: Optional[bool] = False,
+    ) -> event.EventSnapshot:
+        return event.EventSnapshot(
+            source=self.source,
+            timestamp_to_request=self._table(is_archive).slice(start_ts_utc, end_ts_utc),
+        )
+
+    async def _write(
+        self,
+        value: event.EventSnapshot,
+    ) -> None:
+        self._current.add(value.timestamp_to_request)
+
+    async def _remove_requests(self, value: List[request.ScaleRequest]) -> None:
+        self._current.remove(value)
+
+    async def _remove(
+        self,
+        *,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+        is_archive: Optional[bool] = False,
+    ) -> event.EventSnapshot:
+        return event.EventSnapshot(
+            source=self.source,
+            timestamp_to_request=self._table(is_archive).pop(start_ts_utc, end_ts_utc),
+        )
+
+    async def _archive(
+        self, *, start_ts_utc: Optional[int] = None, end_ts_utc: Optional[int] = None
+    ) -> event.EventSnapshot:
+        result = event.EventSnapshot(
+            source=self.source,
+            timestamp_to_request=self._current.pop(start_ts_utc, end_ts_utc),
+        )
+        self._archive_table.add(result.timestamp_to_request)
+        return result
+
+    def _clear(self) -> None:
+        self._current.clear()
+        self._archive_table.clear()
+
+
+class TieredStoreContextManager(base.StoreContextManager):
+    """Layers a :py:class:`MemoryStoreContextManager` over a ``durable`` store.
+
+    Reads are read-through: a range is loaded once from ``durable`` and,
+    for ``ttl_in_sec``, reads within it are served from memory.
+    Writes are write-behind: they change memory right away and are replayed into ``durable`` on flush,
+    see :py:meth:`base.StoreContextManager.flush`, or when closing.
+    Removing or archiving a range, as well as reading the archive, first replays pending writes
+    and then goes straight to ``durable``, since it holds the complete content.
+    """
+
+    def __init__(
+        self,
+        *,
+        durable: base.StoreContextManager,
+        ttl_in_sec: Optional[int] = None,
+        source: Optional[str] = None,
+        **kwargs,
+    ):
+        if not isinstance(durable, base.StoreContextManager):
+            raise TypeError(
+                f"Durable store must be a {base.StoreContextManager.__name__}. Got: '{durable}'({type(durable)})"
+            )
+        if source is None:
+            source = durable.source
+        super().__init__(source=source, **kwargs)
+        self._durable = durable
+        self._memory = MemoryStoreContextManager(source=self.source, ttl_in_sec=ttl_in_sec)
+        self._loaded: List[Tuple[int, int, float]] = []
+        self._pending: List[Tuple[Callable[..., Any], Dict[str, Any]]] = []
+
+    @property
+    def durable(self) -> base.StoreContextManager:
+        """Where content is persisted."""
+        return self._durable
+
+    @property
+    def ttl_in_sec(self) -> Optional[int]:
+        """For how long a loaded range is served from memory, :py:obj:`None` means forever."""
+        return self._memory.ttl_in_sec
+
+    def _is_loaded(self, start_ts_utc: int, end_ts_utc: int) -> bool:
+        if self.ttl_in_sec is not None:
+            now = _now()
+            self._loaded = [item for item in self._loaded if now - item[2] < self.ttl_in_sec]
+        return any(start <= start_ts_utc and end_ts_utc <= end for start, end, _ in self._loaded)
+
+    async def _open(self) -> None:
+        await self._durable.__aenter__()
+
+    async def _close(self) -> None:
+        try:
+            await self._flush_pending()
+        finally:
+            await self._durable.__aexit__(None, None, None)
+            self._loaded.clear()
+            self._memory._clear()  # pylint: disable=protected-access
+
+    async def _flush(self) -> None:
+        await self._flush_pending()
+        await self._durable.flush()
+
+    async def _flush_pending(self) -> None:
+        if self._pending:
+            _LOGGER.debug("Replaying %d pending changes into %s", len(self._pending), self._durable.source)
+        while self._pending:
+            func, kwargs = self._pending[0]
+            await func(**kwargs)
+            self._pending.pop(0)
+
+    async def _refresh(self) -> bool:
+        result = await self._durable.refresh()
+        if result:
+            self._loaded.clear()
+            self._memory._clear()  # pylint: disable=protected-access
+        return result
+
+    async def _read(
+        self,
+        *,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+        is_archive: Optional[bool] = False,
+    ) -> event.EventSnapshot:
+        # pylint: disable=protected-access
+        if is_archive:
+            await self._flush_pending()
+            return await self._durable.read(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, is_archive=True)
+        if not self._is_loaded(start_ts_utc, end_ts_utc):
+            # loading time before reading, so memory never outlives the range
+            loaded_at = _now()
+            await self._flush_pending()
+            snapshot = await self._durable.read(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc)
+            await self._memory._remove(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc)
+            await self._memory._write(snapshot)
+            self._loaded = [
+                item for item in self._loaded if not (start_ts_utc <= item[0] and item[1] <= end_ts_utc)
+            ] + [(start_ts_utc, end_ts_utc, loaded_at)]
+        return await self._memory._read(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc)
+
+    async def _write(
+        self,
+        value: event.EventSnapshot,
+    ) -> None:
+        await self._memory._write(value)  # pylint: disable=protected-access
+        self._pending.append((self._durable.write, dict(value=value, overwrite_within_range=False)))
+
+    async def _remove_requests(self, value: List[request.ScaleRequest]) -> None:
+        await self._memory._remove_requests(value)  # pylint: disable=protected-access
+        diff = event.EventSnapshotDiff(to_remove=self._snapshot_from_request_lst(value))
+        self._pending.append((self._durable.apply, dict(value=diff)))
+
+    async def _remove(
+        self,
+        *,
+        start_ts_utc: Optional[int] = None,
+        end_ts_utc: Optional[int] = None,
+        is_archive: Optional[bool] = False,
+    ) -> event.EventSnapshot:
+        await self._flush_pending()
+        result = await self._durable.remove(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, is_archive=is_archive)
+        if not is_archive:
+            # pylint: disable=protected-access
+            await self._memory._remove(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc)
+        return result
+
+    async def _archive(
+        self, *, start_ts_utc: Optional[int] = None, end_ts_utc: Optional[int] = None
+    ) -> event.EventSnapshot:
+        await self._flush_pending()
+        result = await self._durable.archive(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc)
+        await self._memory._remove(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc)  # pylint: disable=protected-access
+        return result
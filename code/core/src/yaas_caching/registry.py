@@ -0,0 +1,380 @@
+# vim: ai:sw=4:ts=4:sta:et:fo=croql
+"""Process-wide registry of opened :py:class:`base.StoreContextManager` instances.
+
+Opening a store can be expensive, e.g., :py:class:`gcs.GcsObjectStoreContextManager` downloads the database
+and opens a new SQLite connection. The registry keeps one opened store per cache configuration alive
+across requests and hands it out through leases::
+    async with registry.default().lease(cache_config) as store:
+        snapshot = await store.read(start_ts_utc=0, end_ts_utc=1)
+
+A lease is exclusive, i.e., concurrent leases for the same configuration wait for each other.
+Before handing out a store it is re-synchronized with its backing storage, see
+:py:meth:`base.StoreContextManager.refresh`, which, for remote stores, only checks the remote generation.
+Changes are flushed when a lease is released, if the flush interval elapsed, periodically, and at shutdown.
+Periodic flushes run on an event loop owned by the registry, in its own thread,
+because the loop a store was opened on, e.g., the one serving a request, might already be closed.
+Once its time-to-live expires a store is closed and opened again on the next lease.
+"""
+import asyncio
+import contextlib
+import threading
+import time
+import types
+from concurrent.futures import thread  # pylint: disable=unused-import # noqa: F401
+from typing import Callable, Dict, List, Optional, Type
+
+from yaas_caching import base, factory
+from yaas_common import logger
+from yaas_config import config
+
+_LOGGER = logger.get(__name__)
+
+DEFAULT_STORE_TTL_IN_SEC: int = 10 * 60
+"""
+For how long a store is kept opened before being closed and opened again.
+"""
+DEFAULT_FLUSH_INTERVAL_IN_SEC: int = 0
+"""
+Minimum interval between flushes, ``0`` means changes are flushed whenever a lease is released.
+"""
+_DEFAULT_LEASE_TIMEOUT_IN_SEC: int = 60
+
+
+def _now() -> float:
+    return time.monotonic()
+
+
+class _LeaseAttempt:
+    """Shared between the waiting coroutine and the worker thread acquiring :py:attr:`_StoreSession.lock`,
+    guarded by :py:attr:`lock`."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.is_acquired = False
+        self.is_abandoned = False
+
+
+class _StoreSession:
+    """Holds an opened store and when it was opened and last flushed."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.store: Optional[base.StoreContextManager] = None
+        self.opened_at: float = 0
+        self.flushed_at: float = 0
+
+    def is_expired(self, ttl_in_sec: int, now: float) -> bool:
+        return self.store is not None and now - self.opened_at >= ttl_in_sec
+
+    async def close(self) -> None:
+        store, self.store = self.store, None
+        if store is not None:
+            await store.__aexit__(None, None, None)
+
+    async def discard(self) -> None:
+        """Closes the store, ignoring failures, so its resources are released even if it is no longer usable."""
+        source = self.store.source if self.store is not None else None
+        try:
+            await self.close()
+        except Exception as err:  # pylint: disable=broad-except
+            _LOGGER.warning("Could not close discarded store '%s'. Ignoring. Error: %s", source, err)
+
+
+class StoreLease(contextlib.AbstractAsyncContextManager):
+    """Exclusive access to the opened store for a given configuration, see :py:meth:`StoreRegistry.lease`."""
+
+    def __init__(self, *, registry: "StoreRegistry", cache_config: config.CacheConfig):
+        self._registry = registry
+        self._cache_config = cache_config
+        self._session: Optional[_StoreSession] = None
+
+    @property
+    def cache_config(self) -> config.CacheConfig:
+        """Configuration of the leased store."""
+        return self._cache_config
+
+    async def __aenter__(self) -> base.StoreContextManager:
+        if self._session is not None:
+            raise base.StoreError(f"Lease for {self._cache_config} is already in use")
+        session = self._registry._session(self._cache_config)  # pylint: disable=protected-access
+        await self._registry._acquire(session)  # pylint: disable=protected-access
+        try:
+            result = await self._registry._checkout(session, self._cache_config)  # pylint: disable=protected-access
+        except Exception:
+            session.lock.release()
+            raise
+        self._session = session
+        return result
+
+    async def __aexit__(
+        self,
+        __exc_type: Optional[Type[BaseException]] = None,  # noqa: F841
+        __exc_value: Optional[BaseException] = None,  # noqa: F841
+        __traceback: Optional[types.TracebackType] = None,  # noqa: F841
+    ) -> Optional[bool]:
+        session, self._session = self._session, None
+        try:
+            await self._registry._checkin(session, is_failed=__exc_type is not None)  # pylint: disable=protected-access
+        finally:
+            session.lock.release()
+
+
+class StoreRegistry:
+    """Keeps one opened store per :py:class:`config.CacheConfig`.
+
+    **NOTE**: stores are shared across threads and event loops, therefore all synchronization uses thread locks.
+    """
+
+    def __init__(
+        self,
+        *,
+        store_factory: Optional[Callable[[config.CacheConfig], base.StoreContextManager]] = None,
+        ttl_in_sec: Optional[int] = None,
+        flush_interval_in_sec: Optional[int] = None,
+        lease_timeout_in_sec: Optional[int] = None,
+    ):
+        if store_factory is None:
+            store_factory = factory.store_from_cache_config
+        if not callable(store_factory):
+            raise TypeError(f"Store factory must be callable. Got: '{store_factory}'({type(store_factory)})")
+        if ttl_in_sec is None:
+            ttl_in_sec = DEFAULT_STORE_TTL_IN_SEC
+        if flush_interval_in_sec is None:
+            flush_interval_in_sec = DEFAULT_FLUSH_INTERVAL_IN_SEC
+        if lease_timeout_in_sec is None:
+            lease_timeout_in_sec = _DEFAULT_LEASE_TIMEOUT_IN_SEC
+        for name, value, minimum in [
+            ("TTL", ttl_in_sec, 1),
+            ("Flush interval", flush_interval_in_sec, 0),
+            ("Lease timeout", lease_timeout_in_sec, 1),
+        ]:
+            if not isinstance(value, int) or value < minimum:
+                raise ValueError(f"{name} must be an integer >= {minimum}. Got: '{value}'({type(value)})")
+        self._store_factory = store_factory
+        self._ttl_in_sec = ttl_in_sec
+        self._flush_interval_in_sec = flush_interval_in_sec
+        self._lease_timeout_in_sec = lease_timeout_in_sec
+        self._sessions: Dict[config.CacheConfig, _StoreSession] = {}
+        self._sessions_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._flusher_stop = threading.Event()
+
+    @property
+    def ttl_in_sec(self) -> int:
+        """For how long a store is kept opened."""
+        return self._ttl_in_sec
+
+    @property
+    def flush_interval_in_sec(self) -> int:
+        """Minimum interval between flushes."""
+        return self._flush_interval_in_sec
+
+    @property
+    def lease_timeout_in_sec(self) -> int:
+        """How long to wait for a lease before raising :py:class:`base.StoreLockTimeoutError`."""
+        return self._lease_timeout_in_sec
+
+    def open_stores(self) -> List[base.StoreContextManager]:
+        """All stores currently opened."""
+        with self._sessions_lock:
+            return [session.store for session in self._sessions.values() if session.store is not None]
+
+    def lease(self, cache_config: config.CacheConfig) -> StoreLease:
+        """Returns an `Asynchronous Context Manager`_ that yields the opened store for the configuration.
+
+        Args:
+            cache_config: which store to lease.
+
+        Returns:
+            A :py:class:`StoreLease`, which can be used multiple times, sequentially.
+
+        .. _Asynchronous Context Manager: https://peps.python.org/pep-0492/#asynchronous-context-managers-and-async-with
+        """
+        if not isinstance(cache_config, config.CacheConfig):
+            raise TypeError(
+                f"Cache configuration must be an instance of {config.CacheConfig.__name__}. "
+                f"Got: '{cache_config}'({type(cache_config)})"
+            )
+        return StoreLease(registry=self, cache_config=cache_config)
+
+    def _session(self, cache_config: config.CacheConfig) -> _StoreSession:
+        with self._sessions_lock:
+            result = self._sessions.get(cache_config)
+            if result is None:
+                result = self._sessions[cache_config] = _StoreSession()
+        return result
+
+    async def _acquire(self, session: _StoreSession) -> None:
+        if session.lock.acquire(blocking=False):  # pylint: disable=consider-using-with
+            return
+        attempt = _LeaseAttempt()
+        future = asyncio.get_running_loop().run_in_executor(None, self._acquire_blocking, session, attempt)
+        try:
+            # shielded, the worker thread can not be interrupted, it is told to give up instead
+            is_acquired = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if self._abandon(attempt):
+                session.lock.release()
+            raise
+        if not is_acquired:
+            raise base.StoreLockTimeoutError(
+                f"Could not lease store in the past {self._lease_timeout_in_sec} seconds. Store: {session.store}"
+            )
+
+    def _acquire_blocking(self, session: _StoreSession, attempt: _LeaseAttempt) -> bool:
+        """Runs in a worker thread, if the waiter gave up in the meantime the lock is released right away."""
+        is_acquired = session.lock.acquire(True, self._lease_timeout_in_sec)  # pylint: disable=consider-using-with
+        with attempt.lock:
+            if is_acquired and attempt.is_abandoned:
+                session.lock.release()
+                is_acquired = False
+            attempt.is_acquired = is_acquired
+        return is_acquired
+
+    @staticmethod
+    def _abandon(attempt: _LeaseAttempt) -> bool:
+        """Tells the worker thread to give up.
+
+        Returns:
+            :py:obj:`True` if it acquired the lock in the meantime.
+        """
+        with attempt.lock:
+            attempt.is_abandoned = not attempt.is_acquired
+            return attempt.is_acquired
+
+    async def _checkout(self, session: _StoreSession, cache_config: config.CacheConfig) -> base.StoreContextManager:
+        now = _now()
+        if session.is_expired(self._ttl_in_sec, now):
+            _LOGGER.info("Store '%s' expired after %d seconds, closing it", session.store.source, self._ttl_in_sec)
+            await session.close()
+        if session.store is None:
+            store = self._store_factory(cache_config)
+            await store.__aenter__()  # pylint: disable=unnecessary-dunder-call
+            session.store = store
+            session.opened_at = session.flushed_at = now
+            _LOGGER.info("Opened store '%s' to be kept for %d seconds", store.source, self._ttl_in_sec)
+            self._start_flusher()
+        else:
+            try:
+                await session.store.refresh()
+            except Exception as err:
+                _LOGGER.error("Could not refresh store '%s', discarding it. Error: %s", session.store.source, err)
+                await session.discard()
+                raise
+        return session.store
+
+    async def _checkin(self, session: _StoreSession, *, is_failed: bool) -> None:
+        if session.store is None:
+            return
+        now = _now()
+        if is_failed or session.is_expired(self._ttl_in_sec, now):
+            await session.close()
+        elif now - session.flushed_at >= self._flush_interval_in_sec:
+            await self._flush_session(session, now)
+
+    @staticmethod
+    async def _flush_session(session: _StoreSession, now: float) -> None:
+        try:
+            await session.store.flush()
+        except Exception as err:
+            _LOGGER.error("Could not flush store '%s', discarding it. Error: %s", session.store.source, err)
+            await session.discard()
+            raise
+        session.flushed_at = now
+
+    def _start_flusher(self) -> None:
+        if not self._flush_interval_in_sec:
+            return
+        with self._sessions_lock:
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher_stop.clear()
+                self._flusher = threading.Thread(target=self._flush_periodically, name=self.__class__.__name__)
+                self._flusher.daemon = True
+                self._flusher.start()
+
+    def _flush_periodically(self) -> None:
+        loop = asyncio.new_event_loop()
+        try:
+            while not self._flusher_stop.wait(self._flush_interval_in_sec):
+                try:
+                    loop.run_until_complete(self.flush(is_blocking=False))
+                except Exception as err:  # pylint: disable=broad-except
+                    _LOGGER.error("Could not flush stores periodically. Error: %s", err)
+        finally:
+            loop.close()
+
+    async def flush(self, *, is_blocking: Optional[bool] = True) -> None:
+        """Flushes all opened stores and closes the expired ones.
+
+        Args:
+            is_blocking: if :py:obj:`False` stores currently leased are skipped.
+
+        """
+        for session in self._all_sessions():
+            await self._flush_or_close(session, is_blocking=is_blocking)
+
+    async def _flush_or_close(self, session: _StoreSession, *, is_blocking: bool) -> None:
+        if is_blocking:
+            await self._acquire(session)
+        elif not session.lock.acquire(blocking=False):  # pylint: disable=consider-using-with
+            return
+        try:
+            if session.is_expired(self._ttl_in_sec, _now()):
+                await session.close()
+            elif session.store is not None:
+                await self._flush_session(session, _now())
+        finally:
+            session.lock.release()
+
+    async def close(self) -> None:
+        """Closes all opened stores, flushing their changes, and stops the periodic flushing."""
+        self._flusher_stop.set()
+        errors = []
+        for session in self._all_sessions():
+            await self._acquire(session)
+            try:
+                await session.close()
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.error("Could not close store. Error: %s", err)
+                errors.append(err)
+            finally:
+                session.lock.release()
+        if errors:
+            raise base.StoreError(f"Could not close {len(errors)} stores. Errors: {errors}")
+
+    def _all_sessions(self) -> List[_StoreSession]:
+        with self._sessions_lock:
+            return list(self._sessions.values())
+
+    def close_at_exit(self) -> None:
+        """Synchronous version of :py:meth:`close`, to be called at interpreter shutdown."""
+        try:
+            asyncio.run(self.close())
+        except Exception as err:  # pylint: disable=broad-except
+            _LOGGER.error("Could not close stores at exit. Error: %s", err)
+
+
+def _register_at_exit(func: Callable[[], None]) -> None:
+    """Registers ``func`` to run at interpreter shutdown while thread pools still accept work.
+
+    Stores run their I/O in :py:class:`concurrent.futures.ThreadPoolExecutor` workers,
+    which refuse new work once their own shutdown hook ran.
+    That hook runs before any :py:func:`atexit.register` function,
+    but after hooks registered later through ``threading._register_atexit``, which run in reverse order.
+    """
+    # ``thread`` is imported by this module, so its hook is already registered and runs after ``func``
+    threading._register_atexit(func)  # pylint: disable=protected-access
+
+
+_DEFAULT_REGISTRY: Optional[StoreRegistry] = None
+_DEFAULT_REGISTRY_LOCK: threading.Lock = threading.Lock()
+
+
+def default() -> StoreRegistry:
+    """Returns the process-wide :py:class:`StoreRegistry`, which is closed at interpreter exit."""
+    global _DEFAULT_REGISTRY  # pylint: disable=global-statement
+    with _DEFAULT_REGISTRY_LOCK:
+        if _DEFAULT_REGISTRY is None:
+            _DEFAULT_REGISTRY = StoreRegistry()
+            _register_at_exit(_DEFAULT_REGISTRY.close_at_exit)
+    return _DEFAULT_REGISTRY
@@ -5,10 +5,11 @@ The difficulty here is to build and merge snapshots,  in case the
 current cached values deviate from what is in newly fetched upcoming
 events.
 """
-from typing import Callable, List, Optional, Tuple
+import collections
+from typing import Callable, Counter, List, Optional, Tuple
 
 from yaas_caching import event
-from yaas_common import logger
+from yaas_common import logger, request
 
 _LOGGER = logger.get(__name__)
 
@@ -55,6 +56,38 @@ def merge(
     return is_required, result
 
 
+def diff(*, current: event.EventSnapshot, target: event.EventSnapshot) -> event.EventSnapshotDiff:
+    """Returns the requests to add to, and remove from, ``current`` so it becomes ``target``.
+
+    It mirrors overwriting ``current`` with ``target``, i.e.,
+    only requests of ``current`` within the range of ``target`` are removed.
+    Therefore, an empty ``target`` never removes anything.
+
+    Args:
+        current: usually what is cached.
+        target: usually the result of :py:func:`merge`.
+
+    Returns:
+    """
+    # validation
+    if not isinstance(current, event.EventSnapshot):
+        raise TypeError(f"Argument current is not {event.EventSnapshot.__name__}. Got '{current}'({type(current)})")
+    if not isinstance(target, event.EventSnapshot):
+        raise TypeError(f"Argument target is not {event.EventSnapshot.__name__}. Got '{target}'({type(target)})")
+    # logic
+    current_set = set(current.all_requests())
+    target_set = set(target.all_requests())
+    to_add = [req for req in target.all_requests() if req not in current_set]
+    to_remove = []
+    if target_set:
+        start_ts_utc, end_ts_utc = target.range()
+        to_remove = [req for req in current.slice(start_ts_utc, end_ts_utc).all_requests() if req not in target_set]
+    return event.EventSnapshotDiff(
+        to_add=event.EventSnapshot.from_list_requests(source=target.source, request_lst=to_add),
+        to_remove=event.EventSnapshot.from_list_requests(source=current.source, request_lst=to_remove),
+    )
+
+
 def compare(*, snapshot_a: event.EventSnapshot, snapshot_b: event.EventSnapshot) -> event.EventSnapshotComparison:
     """Repeating the documentation in :py:cls:`event.EventSnapshotComparison`.
 
@@ -83,6 +116,10 @@ def compare(*, snapshot_a: event.EventSnapshot, snapshot_b: event.EventSnapshot)
         * only_in_a: [snapshot_a_event_4].
         * only_in_b: [snapshot_b_event_3].
 
+    Timestamps where both snapshots hold the same requests, compared by
+    :py:meth:`request.ScaleRequest.content_hash` regardless of order but counting repetitions, are left out,
+    therefore comparing identical snapshots is not :py:meth:`event.EventSnapshotComparison.are_different`.
+
     Args:
         snapshot_a:
         snapshot_b:
@@ -154,6 +191,7 @@ def _compare_potential_conflict(
 
 
 def _breakdown_timestamp_to_request(snapshot_a, snapshot_b):
+    """Timestamps where both snapshots hold the same requests are neither overlapping nor exclusive."""
     overlapping_a_ts = {}
     overlapping_b_ts = {}
     only_in_a_ts = {}
@@ -164,6 +202,8 @@ def _breakdown_timestamp_to_request(snapshot_a, snapshot_b):
         req_list_a = snapshot_a.timestamp_to_request.get(t_stamp)
         req_list_b = snapshot_b.timestamp_to_request.get(t_stamp)
         if req_list_a and req_list_b:
+            if _content_hashes(req_list_a) == _content_hashes(req_list_b):
+                continue
             overlapping_a_ts[t_stamp] = req_list_a
             overlapping_b_ts[t_stamp] = req_list_b
         elif not req_list_a:
@@ -173,6 +213,11 @@ def _breakdown_timestamp_to_request(snapshot_a, snapshot_b):
     return only_in_a_ts, only_in_b_ts, overlapping_a_ts, overlapping_b_ts
 
 
+def _content_hashes(value: List[request.ScaleRequest]) -> Counter[str]:
+    """A multiset, so ``[a, a]`` is not the same as ``[a]``."""
+    return collections.Counter(req.content_hash() for req in value)
+
+
 def _get_timestamp_timeline(snapshot_a: event.EventSnapshot, snapshot_b: event.EventSnapshot) -> List[int]:
     all_timestamps = set(snapshot_a.timestamp_to_request.keys())
     all_timestamps = all_timestamps.union(set(snapshot_b.timestamp_to_request.keys()))
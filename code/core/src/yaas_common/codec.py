@@ -0,0 +1,213 @@
+# vim: ai:sw=4:ts=4:sta:et:fo=croql
+"""Compact binary encoding of :py:class:`request.ScaleRequest` groups, an opt-in alternative to JSON.
+
+The layout is::
+    <magic><version><strings><groups><extra>
+where ``strings`` is every distinct string once (topic, resource, command, ``original_json_event``, and extras),
+each group is its key followed by its requests,
+and each request is a sequence of unsigned `LEB128`_ integers:
+``topic``, ``resource``, ``command``, ``timestamp_utc``, ``original_json_event``.
+Strings are referenced by position plus one, so ``0`` encodes :py:obj:`None`, as it does for ``timestamp_utc``.
+
+Decoding ``encode(value)`` always gives back ``value``, in the same order.
+
+.. _LEB128: https://en.wikipedia.org/wiki/LEB128
+"""
+from typing import Dict, List, Optional, Tuple
+
+import attrs
+
+from yaas_common import const, request
+
+_MAGIC: bytes = b"YAAS"
+_VERSION: int = 1
+_REQUEST_FIELDS: Tuple[str, ...] = (
+    request.ScaleRequest.topic.__name__,
+    request.ScaleRequest.resource.__name__,
+    request.ScaleRequest.command.__name__,
+    request.ScaleRequest.timestamp_utc.__name__,
+    request.ScaleRequest.original_json_event.__name__,
+)
+"""
+Fields in the order they are encoded, it must cover all fields in :py:class:`request.ScaleRequest`.
+"""
+_TIMESTAMP_FIELD: str = request.ScaleRequest.timestamp_utc.__name__
+"""
+The only integer field, all others are strings.
+"""
+
+
+class CodecError(ValueError):
+    """The content is not a valid encoding."""
+
+
+def encode_requests(value: List[request.ScaleRequest], *extra: Optional[str]) -> bytes:
+    """Encodes a list of requests, and optionally extra strings.
+
+    Args:
+        value: requests to encode.
+        *extra: strings to encode after the requests, see :py:func:`decode_requests`.
+
+    Returns:
+        The encoded content.
+    """
+    if not isinstance(value, list):
+        raise TypeError(f"Value must be a {list.__name__}. Got: '{value}'({type(value)})")
+    return encode({0: value}, *extra)
+
+
+def decode_requests(value: bytes) -> Tuple[List[request.ScaleRequest], List[Optional[str]]]:
+    """Reverses :py:func:`encode_requests`.
+
+    Args:
+        value: encoded content.
+
+    Returns:
+        A :py:class:`tuple` in the format: ``<requests>,<extra strings>``.
+    """
+    groups, extra = decode(value)
+    return [req for req_lst in groups.values() for req in req_lst], extra
+
+
+def encode(value: Dict[int, List[request.ScaleRequest]], *extra: Optional[str]) -> bytes:
+    """Encodes requests grouped by a non-negative integer key, e.g., a timestamp, and optionally extra strings,
+    e.g., a snapshot source.
+
+    Args:
+        value: groups to encode.
+        *extra: strings to encode after the groups, see :py:func:`decode`.
+
+    Returns:
+        The encoded content.
+    """
+    if not isinstance(value, dict):
+        raise TypeError(f"Value must be a {dict.__name__}. Got: '{value}'({type(value)})")
+    _validate_request_fields()
+    strings: Dict[str, int] = {}
+
+    def ref(val: Optional[str]) -> int:
+        if val is None:
+            return 0
+        if val not in strings:
+            strings[val] = len(strings) + 1
+        return strings[val]
+
+    body = bytearray()
+    _write_uint(body, len(value))
+    for key, req_lst in value.items():
+        if not isinstance(key, int) or not isinstance(req_lst, list):
+            raise TypeError(f"Group '{key}'({type(key)}) must be an {int.__name__} to a {list.__name__}")
+        _write_uint(body, key)
+        _write_uint(body, len(req_lst))
+        for ndx, req in enumerate(req_lst):
+            if not isinstance(req, request.ScaleRequest):
+                raise TypeError(f"Item '{req}'({type(req)})[{key}][{ndx}] is not a {request.ScaleRequest.__name__}")
+            for field in _REQUEST_FIELDS:
+                field_value = getattr(req, field)
+                _write_uint(body, (field_value or 0) if field == _TIMESTAMP_FIELD else ref(field_value))
+    _write_uint(body, len(extra))
+    for val in extra:
+        _write_uint(body, ref(val))
+    result = bytearray(_MAGIC)
+    result.append(_VERSION)
+    _write_uint(result, len(strings))
+    for val in strings:
+        content = val.encode(const.ENCODING_UTF8)
+        _write_uint(result, len(content))
+        result.extend(content)
+    result.extend(body)
+    return bytes(result)
+
+
+def decode(value: bytes) -> Tuple[Dict[int, List[request.ScaleRequest]], List[Optional[str]]]:
+    """Reverses :py:func:`encode`.
+
+    Args:
+        value: encoded content.
+
+    Returns:
+        A :py:class:`tuple` in the format: ``<groups>,<extra strings>``.
+    """
+    if not isinstance(value, (bytes, bytearray, memoryview)):
+        raise TypeError(f"Value must be bytes. Got: '{value}'({type(value)})")
+    value = bytes(value)
+    if len(value) <= len(_MAGIC) or not value.startswith(_MAGIC):
+        raise CodecError(f"Content does not start with {_MAGIC!r}")
+    version = value[len(_MAGIC)]
+    if version != _VERSION:
+        raise CodecError(f"Version {version} is not supported, only {_VERSION}")
+    try:
+        result = _decode_body(value, len(_MAGIC) + 1)
+    except CodecError:
+        raise
+    except Exception as err:
+        raise CodecError(f"Could not decode {len(value)} bytes. Error: {err}") from err
+    return result
+
+
+def _decode_body(value: bytes, offset: int) -> Tuple[Dict[int, List[request.ScaleRequest]], List[Optional[str]]]:
+    amount, offset = _read_uint(value, offset)
+    strings: List[Optional[str]] = [None]
+    for _ in range(amount):
+        size, offset = _read_uint(value, offset)
+        if offset + size > len(value):
+            raise CodecError(f"String of {size} bytes at offset {offset} goes beyond the content")
+        strings.append(value[offset : offset + size].decode(const.ENCODING_UTF8))
+        offset += size
+    groups = {}
+    amount, offset = _read_uint(value, offset)
+    for _ in range(amount):
+        key, offset = _read_uint(value, offset)
+        size, offset = _read_uint(value, offset)
+        req_lst = []
+        for _ in range(size):
+            kwargs = {}
+            for field in _REQUEST_FIELDS:
+                field_value, offset = _read_uint(value, offset)
+                kwargs[field] = (field_value or None) if field == _TIMESTAMP_FIELD else strings[field_value]
+            req_lst.append(request.ScaleRequest(**kwargs))
+        groups[key] = req_lst
+    amount, offset = _read_uint(value, offset)
+    extra = []
+    for _ in range(amount):
+        ndx, offset = _read_uint(value, offset)
+        extra.append(strings[ndx])
+    if offset != len(value):
+        raise CodecError(f"There are {len(value) - offset} unexpected bytes at the end")
+    return groups, extra
+
+
+def _validate_request_fields() -> None:
+    fields = {field.name for field in attrs.fields(request.ScaleRequest)}
+    if fields != set(_REQUEST_FIELDS):
+        raise CodecError(
+            f"Encoded fields {_REQUEST_FIELDS} do not match {request.ScaleRequest.__name__} fields {sorted(fields)}"
+        )
+
+
+def _write_uint(buffer: bytearray, value: int) -> None:
+    if value < 0:
+        raise ValueError(f"Only non-negative integers are supported. Got: {value}")
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            buffer.append(byte | 0x80)
+        else:
+            buffer.append(byte)
+            break
+
+
+def _read_uint(buffer: bytes, offset: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        if offset >= len(buffer):
+            raise CodecError(f"Content ended in the middle of an integer at offset {offset}")
+        byte = buffer[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    return result, offset
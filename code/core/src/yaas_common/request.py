@@ -1,5 +1,7 @@
 # vim: ai:sw=4:ts=4:sta:et:fo=croql
 """Basic definition of types and expected functionality for resource scaler."""
+import hashlib
+import json
 from collections import abc
 from datetime import datetime, timedelta
 from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
@@ -58,6 +60,11 @@ class ScaleRequest(dto_defaults.HasFromJsonString):
         validator=attrs.validators.optional(attrs.validators.instance_of(str)),
     )
 
+    def content_hash(self) -> str:
+        """SHA-256 of all fields, it is stable across processes and versions, unlike :py:func:`hash`."""
+        content = json.dumps(self.as_dict(), sort_keys=True)
+        return hashlib.sha256(content.encode(const.ENCODING_UTF8)).hexdigest()
+
 
 def _convert_list_dict(value: List[Union[ScaleRequest, Dict[str, Any]]]) -> List[ScaleRequest]:
     """To be used when converting back from full dictionary."""
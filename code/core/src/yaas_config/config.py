@@ -1,6 +1,6 @@
 # vim: ai:sw=4:ts=4:sta:et:fo=croql
 """Configurations."""
-from typing import Any, Callable, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 import attrs
 
@@ -17,6 +17,10 @@ class CacheType(dto_defaults.EnumWithFromStrIgnoreCase):
     LOCAL_JSON_LINE = "local_json"
     LOCAL_SQLITE = "local_sqlite"
     GCS_SQLITE = "gcs_sqlite"
+    GCS_SQLITE_SHARDED = "gcs_sqlite_sharded"
+    MEMORY = "memory"
+    TIERED = "tiered"
+    COLD_ARCHIVE = "cold_archive"
 
     @classmethod
     def default(cls) -> Any:
@@ -72,10 +76,18 @@ class CacheConfig(dto_defaults.HasFromJsonString):
             result = factory_fn(GoogleCaldavCacheConfig, *args, **kwargs)
         elif base_cfg.type == CacheType.GCS_SQLITE.value:
             result = factory_fn(GcsCacheConfig, *args, **kwargs)
+        elif base_cfg.type == CacheType.GCS_SQLITE_SHARDED.value:
+            result = factory_fn(GcsShardedCacheConfig, *args, **kwargs)
         elif base_cfg.type == CacheType.LOCAL_JSON_LINE.value:
             result = factory_fn(LocalJsonLineCacheConfig, *args, **kwargs)
         elif base_cfg.type == CacheType.LOCAL_SQLITE.value:
             result = factory_fn(LocalSqliteCacheConfig, *args, **kwargs)
+        elif base_cfg.type == CacheType.MEMORY.value:
+            result = factory_fn(MemoryCacheConfig, *args, **kwargs)
+        elif base_cfg.type == CacheType.TIERED.value:
+            result = factory_fn(TieredCacheConfig, *args, **kwargs)
+        elif base_cfg.type == CacheType.COLD_ARCHIVE.value:
+            result = factory_fn(ColdArchiveCacheConfig, *args, **kwargs)
         else:
             raise TypeError(
                 f"Cache type '{base_cfg.type}' is not a supported type. "
@@ -165,6 +177,83 @@ class LocalJsonLineCacheConfig(CacheConfig):
             raise ValueError(f"Value for field {name} must be {valid_type}")
 
 
+SQLITE_JOURNAL_MODES: List[str] = ["DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"]
+"""
+Accepted by `PRAGMA journal_mode`_.
+
+.. _PRAGMA journal_mode: https://www.sqlite.org/pragma.html#pragma_journal_mode
+"""
+SQLITE_SYNCHRONOUS_LEVELS: List[str] = ["OFF", "NORMAL", "FULL", "EXTRA"]
+"""
+Accepted by `PRAGMA synchronous`_.
+
+.. _PRAGMA synchronous: https://www.sqlite.org/pragma.html#pragma_synchronous
+"""
+DEFAULT_SQLITE_JOURNAL_MODE: str = "WAL"
+DEFAULT_SQLITE_SYNCHRONOUS: str = "NORMAL"
+DEFAULT_SQLITE_PAGE_SIZE: int = 4096
+DEFAULT_SQLITE_CACHE_SIZE_IN_KIB: int = 16 * 1024
+DEFAULT_SQLITE_VACUUM_FREE_PAGE_RATIO: float = 0.25
+"""
+Fraction of free pages, left by deletes, above which the database file is vacuumed.
+"""
+
+
+def _upper_case(value: Any) -> Any:
+    return value.upper() if isinstance(value, str) else value
+
+
+@attrs.define(**const.ATTRS_DEFAULTS)
+class SqlitePerformanceConfig(dto_defaults.HasFromJsonString):
+    """How a SQLite DB file is tuned, applied as pragmas when it is opened.
+
+    **NOTE**: ``page_size`` only applies to new files,
+    or to existing files once vacuumed, if the journal mode is not ``WAL``.
+    """
+
+    journal_mode: str = attrs.field(
+        default=DEFAULT_SQLITE_JOURNAL_MODE,
+        converter=attrs.converters.pipe(
+            attrs.converters.default_if_none(default=DEFAULT_SQLITE_JOURNAL_MODE), _upper_case
+        ),
+        validator=attrs.validators.in_(SQLITE_JOURNAL_MODES),
+    )
+    synchronous: str = attrs.field(
+        default=DEFAULT_SQLITE_SYNCHRONOUS,
+        converter=attrs.converters.pipe(
+            attrs.converters.default_if_none(default=DEFAULT_SQLITE_SYNCHRONOUS), _upper_case
+        ),
+        validator=attrs.validators.in_(SQLITE_SYNCHRONOUS_LEVELS),
+    )
+    page_size: int = attrs.field(
+        default=DEFAULT_SQLITE_PAGE_SIZE,
+        converter=attrs.converters.default_if_none(default=DEFAULT_SQLITE_PAGE_SIZE),
+        validator=attrs.validators.instance_of(int),
+    )
+    cache_size_in_kib: int = attrs.field(
+        default=DEFAULT_SQLITE_CACHE_SIZE_IN_KIB,
+        converter=attrs.converters.default_if_none(default=DEFAULT_SQLITE_CACHE_SIZE_IN_KIB),
+        validator=attrs.validators.and_(
+            attrs.validators.instance_of(int),
+            attrs.validators.ge(0),
+        ),
+    )
+    vacuum_free_page_ratio: float = attrs.field(
+        default=DEFAULT_SQLITE_VACUUM_FREE_PAGE_RATIO,
+        converter=attrs.converters.default_if_none(default=DEFAULT_SQLITE_VACUUM_FREE_PAGE_RATIO),
+        validator=attrs.validators.and_(
+            attrs.validators.instance_of((int, float)),
+            attrs.validators.gt(0),
+            attrs.validators.le(1),
+        ),
+    )
+
+    @page_size.validator
+    def _is_page_size_valid(self, attribute: attrs.Attribute, value: int) -> None:
+        if not 512 <= value <= 65536 or value & (value - 1):
+            raise ValueError(f"Attribute {attribute.name} must be a power of two between 512 and 65536. Got: {value}")
+
+
 @attrs.define(**const.ATTRS_DEFAULTS)
 class LocalSqliteCacheConfig(CacheConfig):
     """Storing as a local SQLite DB file.
@@ -173,6 +262,11 @@ class LocalSqliteCacheConfig(CacheConfig):
     """
 
     sqlite_file: str = attrs.field(validator=attrs.validators.instance_of(str))
+    performance_config: SqlitePerformanceConfig = attrs.field(
+        default=None,
+        converter=attrs.converters.default_if_none(default=attrs.Factory(SqlitePerformanceConfig)),
+        validator=attrs.validators.instance_of(SqlitePerformanceConfig),
+    )
 
     def _is_type_valid_subclass(self, name: str, value: str) -> None:
         valid_type = CacheType.LOCAL_SQLITE
@@ -180,7 +274,31 @@ class LocalSqliteCacheConfig(CacheConfig):
             raise ValueError(f"Value for field {name} must be {valid_type}")
 
 
+class CacheCompression(dto_defaults.EnumWithFromStrIgnoreCase):
+    """How the cache object is compressed in Cloud Storage, the value is used as its ``Content-Encoding``."""
+
+    NONE = "none"
+    GZIP = "gzip"
+
+    @classmethod
+    def default(cls) -> Any:
+        """Default compression."""
+        return CacheCompression.NONE
+
+
+def _is_compression_valid(instance: Any, attribute: attrs.Attribute, value: str) -> None:
+    # pylint: disable=unused-argument
+    if not CacheCompression.from_str(value):
+        raise ValueError(
+            f"Attribute {attribute.name} does not accept '{value}'. Valid values are: {list(CacheCompression)}"
+        )
+
+
 _DEFAULT_GCS_CACHE_OBJECT_PATH: str = "cache/event_cache.db"
+DEFAULT_GCS_CACHE_DELTA_COMPACTION_THRESHOLD: int = 20
+"""
+After how many delta objects the next change is written as a new, full, base object instead.
+"""
 
 
 @attrs.define(**const.ATTRS_DEFAULTS)
@@ -192,6 +310,26 @@ class GcsCacheConfig(CacheConfig):
         default=_DEFAULT_GCS_CACHE_OBJECT_PATH,
         validator=attrs.validators.instance_of(str),
     )
+    delta_compaction_threshold: int = attrs.field(
+        default=DEFAULT_GCS_CACHE_DELTA_COMPACTION_THRESHOLD,
+        converter=attrs.converters.default_if_none(default=DEFAULT_GCS_CACHE_DELTA_COMPACTION_THRESHOLD),
+        validator=attrs.validators.and_(
+            attrs.validators.instance_of(int),
+            attrs.validators.ge(1),
+        ),
+    )
+
+    performance_config: SqlitePerformanceConfig = attrs.field(
+        default=None,
+        converter=attrs.converters.default_if_none(default=attrs.Factory(SqlitePerformanceConfig)),
+        validator=attrs.validators.instance_of(SqlitePerformanceConfig),
+    )
+
+    compression: str = attrs.field(
+        default=CacheCompression.default().value,
+        converter=attrs.converters.default_if_none(default=CacheCompression.default().value),
+        validator=attrs.validators.and_(attrs.validators.instance_of(str), _is_compression_valid),
+    )
 
     def _is_type_valid_subclass(self, name: str, value: str) -> None:
         valid_type = CacheType.GCS_SQLITE
@@ -199,6 +337,129 @@ class GcsCacheConfig(CacheConfig):
             raise ValueError(f"Value for field {name} must be {valid_type}")
 
 
+_DEFAULT_GCS_SHARDED_CACHE_OBJECT_PREFIX: str = "cache/event_cache_shards"
+
+
+@attrs.define(**const.ATTRS_DEFAULTS)
+class GcsShardedCacheConfig(CacheConfig):
+    """Defines GCS location for the cache, split in one object per time bucket."""
+
+    bucket_name: str = attrs.field(validator=attrs.validators.instance_of(str))
+    object_prefix: str = attrs.field(
+        default=_DEFAULT_GCS_SHARDED_CACHE_OBJECT_PREFIX,
+        converter=attrs.converters.default_if_none(default=_DEFAULT_GCS_SHARDED_CACHE_OBJECT_PREFIX),
+        validator=attrs.validators.instance_of(str),
+    )
+    delta_compaction_threshold: int = attrs.field(
+        default=DEFAULT_GCS_CACHE_DELTA_COMPACTION_THRESHOLD,
+        converter=attrs.converters.default_if_none(default=DEFAULT_GCS_CACHE_DELTA_COMPACTION_THRESHOLD),
+        validator=attrs.validators.and_(
+            attrs.validators.instance_of(int),
+            attrs.validators.ge(1),
+        ),
+    )
+
+    performance_config: SqlitePerformanceConfig = attrs.field(
+        default=None,
+        converter=attrs.converters.default_if_none(default=attrs.Factory(SqlitePerformanceConfig)),
+        validator=attrs.validators.instance_of(SqlitePerformanceConfig),
+    )
+
+    compression: str = attrs.field(
+        default=CacheCompression.default().value,
+        converter=attrs.converters.default_if_none(default=CacheCompression.default().value),
+        validator=attrs.validators.and_(attrs.validators.instance_of(str), _is_compression_valid),
+    )
+
+    def _is_type_valid_subclass(self, name: str, value: str) -> None:
+        valid_type = CacheType.GCS_SQLITE_SHARDED
+        if CacheType.from_str(value) != valid_type:
+            raise ValueError(f"Value for field {name} must be {valid_type}")
+
+
+DEFAULT_MEMORY_CACHE_TTL_IN_SEC: int = 60 * 60
+"""
+For how long requests are kept in memory before being evicted.
+"""
+
+
+@attrs.define(**const.ATTRS_DEFAULTS)
+class MemoryCacheConfig(CacheConfig):
+    """Storing in memory only, content is lost when the process exits.
+
+    **NOTE**: use for test only or as the fast tier in :py:class:`TieredCacheConfig`.
+    """
+
+    ttl_in_sec: int = attrs.field(
+        default=DEFAULT_MEMORY_CACHE_TTL_IN_SEC,
+        converter=attrs.converters.default_if_none(default=DEFAULT_MEMORY_CACHE_TTL_IN_SEC),
+        validator=attrs.validators.and_(
+            attrs.validators.instance_of(int),
+            attrs.validators.ge(1),
+        ),
+    )
+
+    def _is_type_valid_subclass(self, name: str, value: str) -> None:
+        valid_type = CacheType.MEMORY
+        if CacheType.from_str(value) != valid_type:
+            raise ValueError(f"Value for field {name} must be {valid_type}")
+
+
+@attrs.define(**const.ATTRS_DEFAULTS)
+class TieredCacheConfig(CacheConfig):
+    """Serves reads from memory, loading them from ``durable_cache_config`` on a miss,
+    and persists changes there on flush."""
+
+    durable_cache_config: CacheConfig = attrs.field(validator=attrs.validators.instance_of(CacheConfig))
+    ttl_in_sec: int = attrs.field(
+        default=DEFAULT_MEMORY_CACHE_TTL_IN_SEC,
+        converter=attrs.converters.default_if_none(default=DEFAULT_MEMORY_CACHE_TTL_IN_SEC),
+        validator=attrs.validators.and_(
+            attrs.validators.instance_of(int),
+            attrs.validators.ge(1),
+        ),
+    )
+
+    def _is_type_valid_subclass(self, name: str, value: str) -> None:
+        valid_type = CacheType.TIERED
+        if CacheType.from_str(value) != valid_type:
+            raise ValueError(f"Value for field {name} must be {valid_type}")
+
+    @durable_cache_config.validator
+    def _is_durable_cache_config_valid(self, attribute: attrs.Attribute, value: CacheConfig) -> None:
+        if isinstance(value, (CalendarCacheConfig, MemoryCacheConfig, TieredCacheConfig)):
+            raise ValueError(f"Attribute {attribute.name} must be a durable, writable, cache. Got: {value}")
+
+
+@attrs.define(**const.ATTRS_DEFAULTS)
+class ColdArchiveCacheConfig(CacheConfig):
+    """Keeps current requests in ``hot_cache_config`` and archived requests, one compressed segment per month,
+    in ``archive_location``, either a GCS URI, e.g., ``gs://my-bucket/cache/event_cache_archive``,
+    or a local directory."""
+
+    hot_cache_config: CacheConfig = attrs.field(validator=attrs.validators.instance_of(CacheConfig))
+    archive_location: str = attrs.field(
+        validator=attrs.validators.and_(attrs.validators.instance_of(str), attrs.validators.min_len(1))
+    )
+
+    def _is_type_valid_subclass(self, name: str, value: str) -> None:
+        valid_type = CacheType.COLD_ARCHIVE
+        if CacheType.from_str(value) != valid_type:
+            raise ValueError(f"Value for field {name} must be {valid_type}")
+
+    @hot_cache_config.validator
+    def _is_hot_cache_config_valid(self, attribute: attrs.Attribute, value: CacheConfig) -> None:
+        if isinstance(value, (CalendarCacheConfig, MemoryCacheConfig, ColdArchiveCacheConfig)):
+            raise ValueError(f"Attribute {attribute.name} must be a durable, writable, cache. Got: {value}")
+
+    @archive_location.validator
+    def _is_archive_location_valid(self, attribute: attrs.Attribute, value: str) -> None:
+        if value.startswith("gs://"):
+            _, prefix = gcs.get_bucket_and_prefix_from_uri(value)
+            if not prefix:
+                raise ValueError(f"Attribute {attribute.name} must have a prefix after the bucket name. Got: {value}")
+
+
 MINIMUM_EXPIRED_ENTRIES_MAX_RETENTION_BEFORE_ARCHIVE_IN_DAYS: int = 1
 DEFAULT_EXPIRED_ENTRIES_MAX_RETENTION_BEFORE_ARCHIVE_IN_DAYS: int = (
     MINIMUM_EXPIRED_ENTRIES_MAX_RETENTION_BEFORE_ARCHIVE_IN_DAYS
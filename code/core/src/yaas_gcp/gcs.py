@@ -14,6 +14,7 @@ import re
 from typing import Generator, Optional, Tuple, Union
 
 import cachetools
+from google.api_core import exceptions
 from google.cloud import storage
 
 from yaas_common import logger
@@ -30,6 +31,10 @@ class CloudStorageError(Exception):
     """To code all GCS related errors."""
 
 
+class PreconditionFailedError(CloudStorageError):
+    """To code failed write preconditions, e.g., the object generation does not match the expected."""
+
+
 def get_bucket_and_prefix_from_uri(value: str) -> Tuple[str, Optional[str]]:
     """
     Will break down a GCS URI into bucket and prefix.
@@ -115,6 +120,8 @@ def read_object(
     project: Optional[str] = None,
     filename: Optional[pathlib.Path] = None,
     warn_read_failure: Optional[bool] = True,
+    generation: Optional[int] = None,
+    raw_download: Optional[bool] = False,
 ) -> Union[bytes, bool]:
     """
 
@@ -130,10 +137,18 @@ def read_object(
         warn_read_failure:
             If :py:obj:`True` will warn about failure to read,
             if :py:obj:`False` will just inform about it.
+        generation:
+            If provided, reads this specific `generation`_ of the object instead of the latest.
+        raw_download:
+            If :py:obj:`True`, the content is read as stored, i.e., it is not decoded according to its
+            ``Content-Encoding``, see `transcoding`_.
 
     Returns:
         Content of the object if no output file is given, else :py:obj:`True` if read.
 
+    .. _generation: https://cloud.google.com/storage/docs/metadata#generation-number
+    .. _transcoding: https://cloud.google.com/storage/docs/transcoding
+
     """
     # validate input
     bucket_name, object_path = validate_and_clean_bucket_and_path(bucket_name, object_path)
@@ -149,9 +164,135 @@ def read_object(
         project=project,
         filename=filename,
         warn_read_failure=warn_read_failure,
+        generation=generation,
+        raw_download=raw_download,
+    )
+
+
+def read_object_metadata(
+    *,
+    bucket_name: str,
+    object_path: str,
+    project: Optional[str] = None,
+) -> Optional[storage.Blob]:
+    """Retrieves only the object metadata, e.g., ``generation``, ``md5_hash``, and ``size``, without downloading its
+    content. It is a single request, cheaper than downloading the object.
+
+    Args:
+        bucket_name:
+            Bucket name
+        object_path:
+            Path to the object (**WITHOUT** leading `/`)
+        project:
+            Which project to use to create the GCS client, optional.
+
+    Returns:
+        The corresponding :py:class:`storage.Blob` or :py:obj:`None` if the object does not exist.
+    """
+    # validate input
+    bucket_name, object_path = validate_and_clean_bucket_and_path(bucket_name, object_path)
+    # logic
+    return _read_object_metadata(bucket_name=bucket_name, object_path=object_path, project=project)
+
+
+def _read_object_metadata(
+    *,
+    bucket_name: str,
+    object_path: str,
+    project: Optional[str] = None,
+) -> Optional[storage.Blob]:
+    """Uses ``Client``_ and ``Bucket``_ classes.
+
+    **NOTE**: it does not check if the bucket exists, as in :py:func:`_bucket`, to keep it to a single request.
+
+    .. _Client: https://cloud.google.com/python/docs/reference/storage/latest/google.cloud.storage.client.Client
+    .. _Bucket: https://cloud.google.com/python/docs/reference/storage/latest/google.cloud.storage.bucket.Bucket
+    """
+    gcs_uri = f"gs://{bucket_name}/{object_path}"
+    _LOGGER.debug("Reading metadata for '%s'", gcs_uri)
+    try:
+        result = _client(project).bucket(bucket_name).get_blob(object_path)
+    except Exception as err:
+        raise CloudStorageError(
+            f"Could not read metadata from '{gcs_uri}' in project '{project}'. Error: {err}"
+        ) from err
+    _LOGGER.debug(
+        "Read metadata for '%s', generation: %s",
+        gcs_uri,
+        result.generation if result is not None else None,
+    )
+    return result
+
+
+def delete_object(
+    *,
+    bucket_name: str,
+    object_path: str,
+    project: Optional[str] = None,
+    if_generation_match: Optional[int] = None,
+) -> bool:
+    """Will delete the object in ``object_path`` from the bucket ``bucket_name``.
+
+    Args:
+        bucket_name:
+            Bucket name
+        object_path:
+            Path to the object (**WITHOUT** leading `/`)
+        project:
+            Which project to use to create the GCS client, optional.
+        if_generation_match:
+            If given, only deletes if the current object `generation`_ matches it.
+
+    Returns:
+        :py:obj:`True` if deleted, :py:obj:`False` if the object did not exist.
+
+    Raises:
+        :py:class:`PreconditionFailedError` if ``if_generation_match`` does not match.
+
+    .. _generation: https://cloud.google.com/storage/docs/metadata#generation-number
+    """
+    # validate input
+    bucket_name, object_path = validate_and_clean_bucket_and_path(bucket_name, object_path)
+    # logic
+    return _delete_object(
+        bucket_name=bucket_name, object_path=object_path, project=project, if_generation_match=if_generation_match
     )
 
 
+def _delete_object(
+    *,
+    bucket_name: str,
+    object_path: str,
+    project: Optional[str] = None,
+    if_generation_match: Optional[int] = None,
+) -> bool:
+    """Uses ``Client``_ and ``Bucket``_ classes.
+
+    **NOTE**: it does not check if the bucket exists, as in :py:func:`_bucket`, to keep it to a single request.
+
+    .. _Client: https://cloud.google.com/python/docs/reference/storage/latest/google.cloud.storage.client.Client
+    .. _Bucket: https://cloud.google.com/python/docs/reference/storage/latest/google.cloud.storage.bucket.Bucket
+    """
+    gcs_uri = f"gs://{bucket_name}/{object_path}"
+    _LOGGER.debug("Deleting '%s'", gcs_uri)
+    try:
+        _client(project).bucket(bucket_name).delete_blob(object_path, if_generation_match=if_generation_match)
+        result = True
+    except exceptions.NotFound:
+        _LOGGER.info("Object '%s' does not exist, nothing to delete", gcs_uri)
+        result = False
+    except exceptions.PreconditionFailed as err:
+        raise PreconditionFailedError(
+            f"Could not delete '{gcs_uri}' in project '{project}', "
+            f"its generation does not match {if_generation_match}. "
+            f"Error: {err}"
+        ) from err
+    except Exception as err:
+        raise CloudStorageError(f"Could not delete '{gcs_uri}' in project '{project}'. Error: {err}") from err
+    _LOGGER.info("Deleted '%s'", gcs_uri)
+    return result
+
+
 def validate_and_clean_bucket_and_path(  # pylint: disable=invalid-name
     bucket_name: str, object_path: str
 ) -> Tuple[str, str]:
@@ -213,6 +354,8 @@ def _read_object(
     project: Optional[str] = None,
     filename: Optional[pathlib.Path] = None,
     warn_read_failure: Optional[bool] = True,
+    generation: Optional[int] = None,
+    raw_download: Optional[bool] = False,
 ) -> Union[bytes, bool]:
     """Uses ``Bucket``_ and ``Blob``_ classes.
 
@@ -224,13 +367,13 @@ def _read_object(
     _LOGGER.debug("Reading '%s'", gcs_uri)
     try:
         bucket_obj = _bucket(bucket_name, project)
-        blob = bucket_obj.blob(object_path)
+        blob = bucket_obj.blob(object_path, generation=generation)
         if blob.exists():
             if filename:
-                blob.download_to_filename(filename)
+                blob.download_to_filename(filename, raw_download=raw_download)
                 result = True
             else:
-                result = blob.download_as_bytes()
+                result = blob.download_as_bytes(raw_download=raw_download)
             _LOGGER.debug("Read '%s'", gcs_uri)
         else:
             _LOGGER.log(
@@ -278,7 +421,9 @@ def write_object(
     object_path: str,
     content_source: Union[bytes, pathlib.Path],
     project: Optional[str] = None,
-) -> None:
+    if_generation_match: Optional[int] = None,
+    content_encoding: Optional[str] = None,
+) -> Optional[int]:
     """Will write the ``content`` on the object in ``path`` into the bucket
     ``bucket_name``.
 
@@ -291,6 +436,20 @@ def write_object(
             Which project to use to create the GCS client, optional.
         content_source:
             What to write, either :py:class:`bytes` or :py:class:`pathlib.Path`.
+        if_generation_match:
+            If given, only writes if the current object `generation`_ matches it.
+            Use ``0`` to only write if the object does not exist.
+        content_encoding:
+            If given, it is set as the object ``Content-Encoding``, e.g., ``gzip``,
+            the content must already be encoded accordingly.
+
+    Returns:
+        The generation of the written object, if reported back by the upload, else :py:obj:`None`.
+
+    Raises:
+        :py:class:`PreconditionFailedError` if ``if_generation_match`` does not match.
+
+    .. _generation: https://cloud.google.com/storage/docs/metadata#generation-number
     """
     # validate input
     bucket_name, object_path = validate_and_clean_bucket_and_path(bucket_name, object_path)
@@ -300,11 +459,13 @@ def write_object(
             f"Got: '{content_source}'({type(content_source)})"
         )
     # logic
-    _write_object(
+    return _write_object(
         bucket_name=bucket_name,
         object_path=object_path,
         content_source=content_source,
         project=project,
+        if_generation_match=if_generation_match,
+        content_encoding=content_encoding,
     )
 
 
@@ -314,7 +475,9 @@ def _write_object(
     object_path: str,
     content_source: Union[bytes, pathlib.Path],
     project: Optional[str] = None,
-) -> None:
+    if_generation_match: Optional[int] = None,
+    content_encoding: Optional[str] = None,
+) -> Optional[int]:
     """Uses ``Bucket``_ and ``Blob``_ classes.
 
     .. _Bucket: https://cloud.google.com/python/docs/reference/storage/latest/google.cloud.storage.bucket.Bucket
@@ -325,12 +488,19 @@ def _write_object(
     try:
         bucket_obj = _bucket(bucket_name, project)
         blob = bucket_obj.blob(object_path)
+        blob.content_encoding = content_encoding
         if isinstance(content_source, pathlib.Path):
-            blob.upload_from_filename(content_source)
+            blob.upload_from_filename(content_source, if_generation_match=if_generation_match)
         else:
-            with blob.open("wb") as out_blob:
+            with blob.open("wb", if_generation_match=if_generation_match) as out_blob:
                 out_blob.write(content_source)
                 _LOGGER.debug("Wrote '%s'", gcs_uri)
+    except exceptions.PreconditionFailed as err:
+        raise PreconditionFailedError(
+            f"Could not write into '{gcs_uri}' in project '{project}', "
+            f"its generation does not match {if_generation_match}. "
+            f"Error: {err}"
+        ) from err
     except Exception as err:
         raise CloudStorageError(
             "Could not upload content from "
@@ -338,4 +508,5 @@ def _write_object(
             f"into '{gcs_uri}' in project '{project}'. "
             f"Error: {err}"
         ) from err
-    _LOGGER.info("Wrote '%s'", gcs_uri)
+    _LOGGER.info("Wrote '%s', generation: %s", gcs_uri, blob.generation)
+    return blob.generation
@@ -164,6 +164,11 @@ class MyStoreContextManager(base.StoreContextManager):
             raise RuntimeError
         return self.result_snapshot
 
+    async def _remove_requests(self, value: List[request.ScaleRequest]) -> None:
+        self.called[base.StoreContextManager.apply.__name__] = locals()
+        if base.StoreContextManager.apply.__name__ in self.to_raise:
+            raise RuntimeError
+
     async def _archive(
         self, *, start_ts_utc: Optional[int] = None, end_ts_utc: Optional[int] = None
     ) -> event.EventSnapshot:
@@ -0,0 +1,257 @@
+# vim: ai:sw=4:ts=4:sta:et:fo=croql
+# pylint: disable=missing-module-docstring,missing-class-docstring,protected-access,attribute-defined-outside-init
+# type: ignore
+import pathlib
+import tempfile
+from typing import Any, Dict, Iterable, Optional, Union
+
+import pytest
+
+from tests import common
+from yaas_caching import archive, base, event, factory, file
+from yaas_config import config
+
+_TEST_JAN_TS_UTC: int = 1705276800  # 2024-01-15
+_TEST_FEB_TS_UTC: int = 1707955200  # 2024-02-15
+_TEST_MAR_TS_UTC: int = 1710460800  # 2024-03-15
+_TEST_BUCKET_NAME: str = "test_bucket"
+_TEST_ARCHIVE_PREFIX: str = "path/to/archive"
+
+
+def _create_snapshot(*ts_list: int) -> event.EventSnapshot:
+    return common.create_event_snapshot("TEST_SOURCE", list(ts_list))
+
+
+class _MyBlob:
+    def __init__(self, name: str, generation: int):
+        self.name = name
+        self.generation = generation
+
+
+class _MyFakeGcs:
+    """In-memory bucket, optionally writing :py:attr:`concurrent_request` into an object right before it is written."""
+
+    def __init__(self):
+        self.objects: Dict[str, bytes] = {}
+        self.generations: Dict[str, int] = {}
+        self.concurrent_changes = 0
+        self.concurrent_request = common.create_scale_request(timestamp_utc=_TEST_JAN_TS_UTC + 1)
+
+    def _next_generation(self, object_path: str) -> int:
+        result = self.generations.get(object_path, 0) + 1
+        self.generations[object_path] = result
+        return result
+
+    def read_object_metadata(self, *, object_path: str, **kwargs) -> Optional[_MyBlob]:
+        # pylint: disable=unused-argument
+        generation = self.generations.get(object_path)
+        return _MyBlob(object_path, generation) if object_path in self.objects else None
+
+    def read_object(self, *, object_path: str, generation: Optional[int] = None, **kwargs) -> Optional[bytes]:
+        # pylint: disable=unused-argument
+        if generation is not None and generation != self.generations.get(object_path):
+            return None
+        return self.objects.get(object_path)
+
+    def write_object(
+        self,
+        *,
+        object_path: str,
+        content_source: Union[bytes, pathlib.Path],
+        if_generation_match: Optional[int] = None,
+        **kwargs,
+    ) -> int:
+        # pylint: disable=unused-argument
+        if self.concurrent_changes > 0:
+            self.concurrent_changes -= 1
+            self._next_generation(object_path)
+            self.objects[object_path] = archive._encode_segment([self.concurrent_request])
+        current = self.generations.get(object_path, 0) if object_path in self.objects else 0
+        if if_generation_match is not None and if_generation_match != current:
+            raise archive.gcs.PreconditionFailedError(f"{object_path} does not match {if_generation_match}")
+        self.objects[object_path] = content_source
+        return self._next_generation(object_path)
+
+    def delete_object(self, *, object_path: str, if_generation_match: Optional[int] = None, **kwargs) -> bool:
+        # pylint: disable=unused-argument
+        if if_generation_match is not None and if_generation_match != self.generations.get(object_path):
+            raise archive.gcs.PreconditionFailedError(f"{object_path} does not match {if_generation_match}")
+        return self.objects.pop(object_path, None) is not None
+
+    def list_objects(self, *, prefix: str, **kwargs) -> Iterable[Any]:  # pylint: disable=unused-argument
+        for object_path in list(self.objects):
+            if object_path.startswith(prefix):
+                yield _MyBlob(object_path, self.generations.get(object_path))
+
+    def patch(self, monkeypatch) -> "_MyFakeGcs":
+        for name in [
+            archive.gcs.read_object_metadata.__name__,
+            archive.gcs.read_object.__name__,
+            archive.gcs.write_object.__name__,
+            archive.gcs.delete_object.__name__,
+            archive.gcs.list_objects.__name__,
+        ]:
+            monkeypatch.setattr(archive.gcs, name, getattr(self, name))
+        return self
+
+
+class TestColdArchiveStoreContextManager:
+    def setup_method(self):
+        self.hot = file.SQLiteStoreContextManager(sqlite_file=common.tmpfile())
+        self.archive_dir = pathlib.Path(tempfile.mkdtemp()) / "archive"
+        self.instance = archive.ColdArchiveStoreContextManager(hot=self.hot, archive_location=str(self.archive_dir))
+
+    def test_properties_ok(self):
+        assert self.instance.hot is self.hot
+        assert self.instance.source == self.hot.source
+        assert self.instance.archive_location == str(self.archive_dir)
+
+    @pytest.mark.asyncio
+    async def test_archive_ok(self):
+        # Given
+        async with self.instance as obj:
+            await obj.write(_create_snapshot(_TEST_JAN_TS_UTC, _TEST_FEB_TS_UTC, _TEST_MAR_TS_UTC))
+            # When
+            archived = await obj.archive(start_ts_utc=_TEST_JAN_TS_UTC, end_ts_utc=_TEST_FEB_TS_UTC)
+            result = await obj.read(start_ts_utc=_TEST_JAN_TS_UTC, end_ts_utc=_TEST_MAR_TS_UTC, is_archive=True)
+            # Then
+            assert await obj.archive_segment_keys() == ["2024-01", "2024-02"]
+            assert await obj.archive_segment_keys(start_ts_utc=_TEST_FEB_TS_UTC) == ["2024-02"]
+            assert archived.all_requests() == result.all_requests()
+            assert list(result.timestamp_to_request) == [_TEST_JAN_TS_UTC, _TEST_FEB_TS_UTC]
+            hot_archive = await self.hot.read(
+                start_ts_utc=_TEST_JAN_TS_UTC, end_ts_utc=_TEST_MAR_TS_UTC, is_archive=True
+            )
+            assert not hot_archive.all_requests()
+            current = await obj.read(start_ts_utc=_TEST_JAN_TS_UTC, end_ts_utc=_TEST_MAR_TS_UTC)
+            assert list(current.timestamp_to_request) == [_TEST_MAR_TS_UTC]
+        assert sorted(path.name for path in self.archive_dir.iterdir()) == ["2024-01.bin.gz", "2024-02.bin.gz"]
+
+    @pytest.mark.asyncio
+    async def test_archive_ok_idempotent_and_moves_hot_archive(self):
+        # Given: archived inside hot
+        async with self.hot:
+            await self.hot.write(_create_snapshot(_TEST_JAN_TS_UTC, _TEST_FEB_TS_UTC))
+            await self.hot.archive(start_ts_utc=_TEST_JAN_TS_UTC, end_ts_utc=_TEST_JAN_TS_UTC)
+        async with self.instance as obj:
+            # When
+            await obj.archive(start_ts_utc=_TEST_FEB_TS_UTC, end_ts_utc=_TEST_FEB_TS_UTC)
+            await obj.write(_create_snapshot(_TEST_FEB_TS_UTC), overwrite_within_range=False)
+            await obj.archive(start_ts_utc=_TEST_FEB_TS_UTC, end_ts_utc=_TEST_FEB_TS_UTC)
+            result = await obj.read(start_ts_utc=_TEST_JAN_TS_UTC, end_ts_utc=_TEST_MAR_TS_UTC, is_archive=True)
+            # Then
+            assert list(result.timestamp_to_request) == [_TEST_JAN_TS_UTC, _TEST_FEB_TS_UTC]
+            assert result.amount_requests() == 2
+            hot_archive = await self.hot.read(
+                start_ts_utc=_TEST_JAN_TS_UTC, end_ts_utc=_TEST_MAR_TS_UTC, is_archive=True
+            )
+            assert not hot_archive.all_requests()
+
+    @pytest.mark.asyncio
+    async def test_remove_ok_archive(self):
+        # Given
+        async with self.instance as obj:
+            await obj.write(_create_snapshot(_TEST_JAN_TS_UTC, _TEST_JAN_TS_UTC + 1, _TEST_FEB_TS_UTC))
+            await obj.archive(start_ts_utc=_TEST_JAN_TS_UTC, end_ts_utc=_TEST_FEB_TS_UTC)
+            # When
+            removed = await obj.remove(start_ts_utc=1, end_ts_utc=_TEST_JAN_TS_UTC, is_archive=True)
+            result = await obj.read(start_ts_utc=_TEST_JAN_TS_UTC, end_ts_utc=_TEST_MAR_TS_UTC, is_archive=True)
+            # Then
+            assert list(removed.timestamp_to_request) == [_TEST_JAN_TS_UTC]
+            assert list(result.timestamp_to_request) == [_TEST_JAN_TS_UTC + 1, _TEST_FEB_TS_UTC]
+            # When: empty segments are deleted
+            await obj.remove(start_ts_utc=1, end_ts_utc=_TEST_JAN_TS_UTC + 1, is_archive=True)
+            # Then
+            assert await obj.archive_segment_keys() == ["2024-02"]
+        assert [path.name for path in self.archive_dir.iterdir()] == ["2024-02.bin.gz"]
+
+    @pytest.mark.asyncio
+    async def test_read_iter_ok(self):
+        # Given
+        async with self.instance as obj:
+            await obj.write(_create_snapshot(_TEST_JAN_TS_UTC, _TEST_FEB_TS_UTC, _TEST_MAR_TS_UTC))
+            await obj.archive(start_ts_utc=_TEST_JAN_TS_UTC, end_ts_utc=_TEST_JAN_TS_UTC)
+            # When
+            current = [
+                batch
+                async for batch in obj.read_iter(
+                    start_ts_utc=_TEST_JAN_TS_UTC, end_ts_utc=_TEST_MAR_TS_UTC, batch_size=1
+                )
+            ]
+            archived = [
+                batch
+                async for batch in obj.read_iter(
+                    start_ts_utc=_TEST_JAN_TS_UTC, end_ts_utc=_TEST_MAR_TS_UTC, is_archive=True
+                )
+            ]
+        # Then
+        assert [[req.timestamp_utc for req in batch] for batch in current] == [[_TEST_FEB_TS_UTC], [_TEST_MAR_TS_UTC]]
+        assert [[req.timestamp_utc for req in batch] for batch in archived] == [[_TEST_JAN_TS_UTC]]
+
+    @pytest.mark.asyncio
+    async def test_archive_ok_gcs_retries_concurrent_change(self, monkeypatch):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        self.instance = archive.ColdArchiveStoreContextManager(
+            hot=self.hot, archive_location=f"gs://{_TEST_BUCKET_NAME}/{_TEST_ARCHIVE_PREFIX}"
+        )
+        async with self.instance as obj:
+            await obj.write(_create_snapshot(_TEST_JAN_TS_UTC, _TEST_FEB_TS_UTC))
+            fake_gcs.concurrent_changes = 1
+            # When
+            await obj.archive(start_ts_utc=_TEST_JAN_TS_UTC, end_ts_utc=_TEST_FEB_TS_UTC)
+            result = await obj.read(start_ts_utc=_TEST_JAN_TS_UTC, end_ts_utc=_TEST_FEB_TS_UTC, is_archive=True)
+        # Then: concurrent content is kept
+        assert sorted(fake_gcs.objects) == [
+            f"{_TEST_ARCHIVE_PREFIX}/2024-01.bin.gz",
+            f"{_TEST_ARCHIVE_PREFIX}/2024-02.bin.gz",
+        ]
+        assert list(result.timestamp_to_request) == [_TEST_JAN_TS_UTC, _TEST_JAN_TS_UTC + 1, _TEST_FEB_TS_UTC]
+
+    @pytest.mark.asyncio
+    async def test_archive_nok_gcs_retries_exhausted(self, monkeypatch):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        self.instance = archive.ColdArchiveStoreContextManager(
+            hot=self.hot, archive_location=f"gs://{_TEST_BUCKET_NAME}/{_TEST_ARCHIVE_PREFIX}", max_conflict_retries=1
+        )
+        async with self.instance as obj:
+            await obj.write(_create_snapshot(_TEST_JAN_TS_UTC))
+            fake_gcs.concurrent_changes = 2
+            # When/Then
+            with pytest.raises(base.StoreError):
+                await obj.archive(start_ts_utc=_TEST_JAN_TS_UTC, end_ts_utc=_TEST_JAN_TS_UTC)
+            # Then: nothing removed from hot
+            current = await obj.read(start_ts_utc=_TEST_JAN_TS_UTC, end_ts_utc=_TEST_JAN_TS_UTC)
+            assert current.amount_requests() == 1
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            dict(hot=None, archive_location="/tmp/archive"),
+            dict(archive_location=""),
+            dict(archive_location="gs://test-bucket"),
+            dict(archive_location="/tmp/archive", max_conflict_retries=-1),
+        ],
+    )
+    def test_ctor_nok(self, kwargs):
+        kwargs = {"hot": self.hot, **kwargs}
+        with pytest.raises((TypeError, ValueError)):
+            archive.ColdArchiveStoreContextManager(**kwargs)
+
+
+def test_store_from_cache_config_ok():
+    # Given
+    value = config.ColdArchiveCacheConfig(
+        type=config.CacheType.COLD_ARCHIVE.value,
+        hot_cache_config=config.LocalSqliteCacheConfig(
+            type=config.CacheType.LOCAL_SQLITE.value, sqlite_file=str(common.tmpfile())
+        ),
+        archive_location=f"gs://{_TEST_BUCKET_NAME}/{_TEST_ARCHIVE_PREFIX}",
+    )
+    # When
+    result = factory.store_from_cache_config(value)
+    # Then
+    assert isinstance(result, archive.ColdArchiveStoreContextManager)
+    assert isinstance(result.hot, file.SQLiteStoreContextManager)
+    assert result.archive_location == value.archive_location
@@ -3,10 +3,12 @@
 # pylint: disable=invalid-name,
 # type: ignore
 import asyncio
+import multiprocessing
 import pathlib
+import time
 from concurrent import futures
 from datetime import datetime, timedelta
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 import pytest
 
@@ -30,14 +32,24 @@ _TEST_NOW_DT: datetime = datetime.utcnow()
 async def _get_lock(obj, start_sleep: int) -> bool:
     await asyncio.sleep(start_sleep)
     async with obj:
-        await asyncio.sleep(obj.lock_timeout_in_sec * 2)
+        await asyncio.sleep(obj.lock_timeout_in_sec * 3)
     return True
 
 
 def _run_sync(lock_file: pathlib.Path, start_sleep: int):
     obj = base.FileBasedLockContextManager(lock_file=lock_file, lock_timeout_in_sec=1)
-    loop = asyncio.get_event_loop()
-    return loop.run_until_complete(_get_lock(obj, start_sleep))
+    return asyncio.run(_get_lock(obj, start_sleep))
+
+
+def _hold_lock(lock_file: pathlib.Path, hold_in_sec: int, is_locked: Any) -> None:
+    obj = base.FileBasedLockContextManager(lock_file=lock_file, lock_timeout_in_sec=1)
+
+    async def hold() -> None:
+        async with obj:
+            is_locked.set()
+            await asyncio.sleep(hold_in_sec)
+
+    asyncio.run(hold())
 
 
 ########################
@@ -92,13 +104,36 @@ class TestFileBasedLockContextManager:
     def test_enter_nok_multiprocess(self):
         lock_file = common.tmpfile()
 
-        with futures.ProcessPoolExecutor() as executor:
+        with futures.ProcessPoolExecutor(max_workers=2) as executor:
             first = executor.submit(_run_sync, lock_file, 0)
             second = executor.submit(_run_sync, lock_file, 1)
             assert first.result()
             with pytest.raises(base.StoreLockTimeoutError):
                 second.result()
 
+    @pytest.mark.doesnt_work_cloudbuild
+    @pytest.mark.asyncio
+    async def test_shared_ok_after_other_process_held_past_timeout(self):
+        # Given
+        is_locked = multiprocessing.Event()
+        holder = multiprocessing.Process(target=_hold_lock, args=(self.instance.lock_file, 3, is_locked))
+        holder.start()
+        try:
+            assert await asyncio.get_running_loop().run_in_executor(None, is_locked.wait, 10)
+            # When: the other process holds it past the timeout
+            with pytest.raises(base.StoreLockTimeoutError):
+                async with self.instance.shared():
+                    assert False, "Should not be reached"
+            # Then: nothing is left acquiring on behalf of this process
+            await asyncio.sleep(base._FILE_LOCK_MAX_BACKOFF_IN_SEC)
+            assert not self.instance.lock_state().get("acquiring")
+            # Then: another reader gets it once the other process releases it
+            other = base.FileBasedLockContextManager(lock_file=self.instance.lock_file, lock_timeout_in_sec=10)
+            async with other.shared(), self.instance.shared():
+                assert self.instance.is_locked()
+        finally:
+            holder.join()
+
     @pytest.mark.asyncio
     async def test_enter_nok_reentrant(self):
         async with self.instance:
@@ -107,6 +142,64 @@ class TestFileBasedLockContextManager:
                 async with self.instance:
                     assert False, "Should not be reached"
 
+    @pytest.mark.asyncio
+    async def test_enter_ok_wakes_up_on_release(self):
+        # Given
+        self.instance = base.FileBasedLockContextManager(lock_file=self.instance.lock_file, lock_timeout_in_sec=10)
+        other = base.FileBasedLockContextManager(lock_file=self.instance.lock_file, lock_timeout_in_sec=10)
+
+        async def hold(value: base.FileBasedLockContextManager) -> None:
+            async with value:
+                await asyncio.sleep(0.1)
+
+        # When
+        start = time.monotonic()
+        await asyncio.gather(hold(self.instance), hold(other), hold(self.instance))
+        # Then: no polling step between holders
+        assert time.monotonic() - start < 1
+        assert not self.instance.is_locked()
+        assert not other.is_locked()
+
+    @pytest.mark.asyncio
+    async def test_shared_ok_concurrent_readers(self):
+        # Given
+        other = base.FileBasedLockContextManager(lock_file=self.instance.lock_file, lock_timeout_in_sec=1)
+        # When
+        async with self.instance.shared(), self.instance.shared(), other.shared():
+            # Then
+            assert self.instance.is_locked()
+            assert other.is_locked()
+            assert self.instance.lock_state().get("readers") == 2
+        assert not self.instance.is_locked()
+        assert not other.is_locked()
+
+    @pytest.mark.asyncio
+    async def test_shared_nok_while_exclusive(self):
+        # Given
+        other = base.FileBasedLockContextManager(lock_file=self.instance.lock_file, lock_timeout_in_sec=1)
+        async with self.instance:
+            # When/Then: same process
+            with pytest.raises(base.StoreLockTimeoutError):
+                async with self.instance.shared():
+                    assert False, "Should not be reached"
+            # When/Then: other file descriptor
+            with pytest.raises(base.StoreLockTimeoutError):
+                async with other.shared():
+                    assert False, "Should not be reached"
+        # Then: the abandoned attempt does not keep the lock
+        async with other:
+            assert other.is_locked()
+
+    @pytest.mark.asyncio
+    async def test_enter_nok_while_shared(self):
+        # Given
+        other = base.FileBasedLockContextManager(lock_file=self.instance.lock_file, lock_timeout_in_sec=1)
+        async with self.instance.shared():
+            # When/Then
+            with pytest.raises(base.StoreLockTimeoutError):
+                async with other:
+                    assert False, "Should not be reached"
+
 
 def test__default_start_ts_utc_ok():
     # Given
@@ -292,6 +385,36 @@ class TestStoreContextManager:  # pylint: disable=too-many-public-methods
         self._assert_called_kwargs(called, exp_kwargs)
         assert not self.object.has_changed
 
+    @pytest.mark.parametrize("batch_size,expected", [(1, [1, 1, 1]), (2, [2, 1]), (None, [3])])
+    @pytest.mark.asyncio
+    async def test_read_iter_ok(self, batch_size: int, expected: List[int]):
+        # Given
+        self.object.result_snapshot = common.create_event_snapshot("test", [13, 17, 23])
+        # When
+        async with self.object:
+            result = [
+                batch async for batch in self.object.read_iter(start_ts_utc=13, end_ts_utc=23, batch_size=batch_size)
+            ]
+        # Then
+        assert [len(batch) for batch in result] == expected
+        assert [req for batch in result for req in batch] == self.object.result_snapshot.all_requests()
+
+    @pytest.mark.parametrize("batch_size", [0, "1"])
+    @pytest.mark.asyncio
+    async def test_read_iter_nok_batch_size(self, batch_size: Any):
+        with pytest.raises(ValueError):
+            async for _ in self.object.read_iter(start_ts_utc=13, end_ts_utc=23, batch_size=batch_size):
+                pass
+
+    @pytest.mark.asyncio
+    async def test_read_iter_nok_raises(self):
+        # Given
+        self.object.to_raise.add(base.StoreContextManager.read.__name__)
+        # When/Then
+        with pytest.raises(base.StoreError):
+            async for _ in self.object.read_iter(start_ts_utc=13, end_ts_utc=23):
+                pass
+
     def _assert_called_only(self, value: str, secondary: Optional[str] = None) -> Any:
         result = self.object.called.get(value)
         assert result
@@ -351,6 +474,56 @@ class TestStoreContextManager:  # pylint: disable=too-many-public-methods
         assert (self.object.called.get(base.StoreContextManager.remove.__name__) is not None) == overwrite
         assert not self.object.has_changed
 
+    @pytest.mark.asyncio
+    async def test_apply_ok(self):
+        # Given
+        to_add = _TEST_EVENT_SNAPSHOT_WITH_REQUEST
+        to_remove = event.EventSnapshot(source="A", timestamp_to_request={1: [_TEST_SCALE_REQUEST]})
+        # When
+        async with self.object:
+            await self.object.apply(event.EventSnapshotDiff(to_add=to_add, to_remove=to_remove))
+        # Then
+        called = self._assert_called_only(
+            base.StoreContextManager.apply.__name__,
+            base.StoreContextManager.write.__name__,
+        )
+        assert called.get("value") == to_remove.all_requests()
+        assert self.object.called.get(base.StoreContextManager.write.__name__).get("value") == to_add
+        assert base.StoreContextManager.remove.__name__ not in self.object.called
+        assert self.object.has_changed
+
+    @pytest.mark.asyncio
+    async def test_apply_ok_empty(self):
+        # Given/When
+        async with self.object:
+            await self.object.apply(event.EventSnapshotDiff(to_add=_TEST_EVENT_SNAPSHOT_EMPTY))
+        # Then
+        assert base.StoreContextManager.write.__name__ not in self.object.called
+        assert base.StoreContextManager.apply.__name__ not in self.object.called
+        assert not self.object.has_changed
+
+    @pytest.mark.parametrize(
+        "to_raise", [base.StoreContextManager.apply.__name__, base.StoreContextManager.write.__name__]
+    )
+    @pytest.mark.asyncio
+    async def test_apply_nok_raises(self, to_raise: str):
+        # Given
+        self.object.to_raise.add(to_raise)
+        # When/Then
+        with pytest.raises(base.StoreError):
+            async with self.object:
+                await self.object.apply(
+                    event.EventSnapshotDiff(
+                        to_add=_TEST_EVENT_SNAPSHOT_WITH_REQUEST, to_remove=_TEST_EVENT_SNAPSHOT_WITH_REQUEST
+                    )
+                )
+
+    @pytest.mark.asyncio
+    async def test_apply_nok_type(self):
+        with pytest.raises(TypeError):
+            async with self.object:
+                await self.object.apply(_TEST_EVENT_SNAPSHOT_WITH_REQUEST)
+
     @pytest.mark.parametrize("is_archive", [True, False])
     @pytest.mark.asyncio
     async def test_remove_nok_raises(self, is_archive: bool):
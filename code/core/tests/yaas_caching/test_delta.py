@@ -0,0 +1,41 @@
+# vim: ai:sw=4:ts=4:sta:et:fo=croql
+# pylint: disable=missing-module-docstring,missing-class-docstring,protected-access,attribute-defined-outside-init
+# type: ignore
+import pytest
+
+from tests import common
+from yaas_caching import delta
+from yaas_common import request
+
+_TEST_OPERATIONS = [
+    delta.DeltaOperation(
+        type=delta.DeltaOperationType.WRITE.value,
+        requests=[common.create_scale_request(timestamp_utc=123), common.create_scale_request(timestamp_utc=321)],
+    ),
+    delta.DeltaOperation(type=delta.DeltaOperationType.REMOVE.value, is_archive=True, start_ts_utc=1, end_ts_utc=2),
+    delta.DeltaOperation(type=delta.DeltaOperationType.ARCHIVE.value, start_ts_utc=1, end_ts_utc=123),
+]
+
+
+class TestDeltaOperation:
+    @pytest.mark.parametrize("value", _TEST_OPERATIONS)
+    def test_from_json_ok(self, value: delta.DeltaOperation):
+        # Given/When
+        result = delta.DeltaOperation.from_json(value.as_json())
+        # Then
+        assert result == value
+
+    def test_ctor_nok_type(self):
+        with pytest.raises(ValueError):
+            delta.DeltaOperation(type="not_a_type")
+
+
+class TestStoreDelta:
+    def test_from_json_ok(self):
+        # Given
+        value = delta.StoreDelta(base_generation=123, operations=_TEST_OPERATIONS)
+        # When
+        result = delta.StoreDelta.from_json(value.as_json())
+        # Then
+        assert result == value
+        assert all(isinstance(req, request.ScaleRequest) for req in result.operations[0].requests)
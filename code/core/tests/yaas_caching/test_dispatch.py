@@ -0,0 +1,266 @@
+# vim: ai:sw=4:ts=4:sta:et:fo=croql
+# pylint: disable=missing-module-docstring,missing-class-docstring,protected-access
+# type: ignore
+import pathlib
+import types
+from typing import Any, List
+
+import attrs
+import pytest
+
+from tests import common
+from yaas_caching import dispatch, event
+from yaas_common import codec
+from yaas_config import config
+
+_TEST_START_TS_UTC: int = 6_000
+_TEST_END_TS_UTC: int = _TEST_START_TS_UTC + 600
+_TEST_SNAPSHOT: event.EventSnapshot = common.create_event_snapshot(
+    "TEST_SOURCE",
+    [
+        _TEST_START_TS_UTC - 1,
+        _TEST_START_TS_UTC,
+        _TEST_START_TS_UTC + 1,
+        _TEST_START_TS_UTC + 59,
+        _TEST_START_TS_UTC + 60,
+        _TEST_START_TS_UTC + 185,
+        _TEST_END_TS_UTC,
+        _TEST_END_TS_UTC + 1,
+    ],
+)
+_TEST_INDEX: dispatch.DispatchIndex = dispatch.DispatchIndex.from_snapshot(
+    _TEST_SNAPSHOT, start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC, created_ts_utc=_TEST_START_TS_UTC
+)
+
+
+def _create_local_sqlite_config() -> config.LocalSqliteCacheConfig:
+    return config.LocalSqliteCacheConfig(type=config.CacheType.LOCAL_SQLITE.value, sqlite_file=str(common.tmpfile()))
+
+
+class TestDispatchIndex:
+    def test_from_snapshot_ok(self):
+        # Given/When
+        result = _TEST_INDEX.bucket_to_request.timestamp_to_request
+        # Then
+        assert list(result) == [
+            _TEST_START_TS_UTC,
+            _TEST_START_TS_UTC + 60,
+            _TEST_START_TS_UTC + 180,
+            _TEST_END_TS_UTC,
+        ]
+        assert len(result.get(_TEST_START_TS_UTC)) == 3
+        assert _TEST_INDEX.bucket_to_request.source == _TEST_SNAPSHOT.source
+
+    @pytest.mark.parametrize(
+        "start_ts_utc,end_ts_utc,expected",
+        [
+            (_TEST_START_TS_UTC, _TEST_END_TS_UTC, [0, 1, 59, 60, 185, 600]),
+            (_TEST_START_TS_UTC + 1, _TEST_START_TS_UTC + 60, [1, 59, 60]),
+            (_TEST_START_TS_UTC + 1.5, _TEST_START_TS_UTC + 59.5, [1, 59]),
+            (_TEST_START_TS_UTC + 186, _TEST_END_TS_UTC - 1, []),
+        ],
+    )
+    def test_requests_ok(self, start_ts_utc: int, end_ts_utc: int, expected: List[int]):
+        # Given/When
+        result = _TEST_INDEX.requests(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc)
+        # Then
+        assert [req.timestamp_utc - _TEST_START_TS_UTC for req in result] == expected
+
+    @pytest.mark.parametrize(
+        "start_ts_utc,end_ts_utc,now,expected",
+        [
+            (_TEST_START_TS_UTC, _TEST_END_TS_UTC, _TEST_START_TS_UTC, False),
+            (_TEST_START_TS_UTC - 1, _TEST_END_TS_UTC, _TEST_START_TS_UTC, True),
+            (_TEST_START_TS_UTC, _TEST_END_TS_UTC + 1, _TEST_START_TS_UTC, True),
+            (
+                _TEST_START_TS_UTC,
+                _TEST_END_TS_UTC,
+                _TEST_START_TS_UTC + dispatch.DEFAULT_DISPATCH_INDEX_PERIOD_IN_SEC + 1,
+                True,
+            ),
+        ],
+    )
+    def test_is_stale_ok(self, start_ts_utc: int, end_ts_utc: int, now: int, expected: bool):
+        assert _TEST_INDEX.is_stale(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, now=now) == expected
+
+    @pytest.mark.parametrize(
+        "cache_version,expected",
+        [
+            ("TEST_VERSION", False),
+            (None, False),
+            ("TEST_OTHER_VERSION", True),
+        ],
+    )
+    def test_is_stale_ok_cache_version(self, cache_version: str, expected: bool):
+        # Given
+        index = dispatch.DispatchIndex.from_snapshot(
+            _TEST_SNAPSHOT,
+            start_ts_utc=_TEST_START_TS_UTC,
+            end_ts_utc=_TEST_END_TS_UTC,
+            created_ts_utc=_TEST_START_TS_UTC,
+            cache_version="TEST_VERSION",
+        )
+        # When
+        result = index.is_stale(
+            start_ts_utc=_TEST_START_TS_UTC,
+            end_ts_utc=_TEST_END_TS_UTC,
+            now=_TEST_START_TS_UTC,
+            cache_version=cache_version,
+        )
+        # Then
+        assert result == expected
+        assert _TEST_INDEX.is_stale(
+            start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC, now=_TEST_START_TS_UTC, cache_version="A"
+        )
+
+    @pytest.mark.parametrize("cache_version", [None, "TEST_VERSION"])
+    def test_as_bytes_ok(self, cache_version: str):
+        # Given
+        index = attrs.evolve(_TEST_INDEX, cache_version=cache_version)
+        # When
+        result = dispatch.DispatchIndex.from_bytes(index.as_bytes())
+        # Then
+        assert result == index
+
+    def test_from_bytes_ok_without_cache_version(self):
+        # Given
+        value = codec.encode(
+            dict(_TEST_INDEX.bucket_to_request.timestamp_to_request),
+            _TEST_INDEX.bucket_to_request.source,
+            str(_TEST_INDEX.created_ts_utc),
+            str(_TEST_INDEX.start_ts_utc),
+            str(_TEST_INDEX.end_ts_utc),
+        )
+        # When
+        result = dispatch.DispatchIndex.from_bytes(value)
+        # Then
+        assert result == _TEST_INDEX
+        assert result.cache_version is None
+
+    def test_from_snapshot_nok(self):
+        with pytest.raises(TypeError):
+            dispatch.DispatchIndex.from_snapshot(None, start_ts_utc=0, end_ts_utc=1)
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        (
+            config.GcsCacheConfig(type=config.CacheType.GCS_SQLITE.value, bucket_name="test-bucket"),
+            ("test-bucket", "cache/event_cache.db.dispatch"),
+        ),
+        (
+            config.GcsShardedCacheConfig(type=config.CacheType.GCS_SQLITE_SHARDED.value, bucket_name="test-bucket"),
+            ("test-bucket", "cache/event_cache_shards.dispatch"),
+        ),
+        (
+            config.TieredCacheConfig(
+                type=config.CacheType.TIERED.value,
+                durable_cache_config=config.LocalSqliteCacheConfig(
+                    type=config.CacheType.LOCAL_SQLITE.value, sqlite_file="/tmp/cache.db"
+                ),
+            ),
+            pathlib.Path("/tmp/cache.db.dispatch"),
+        ),
+        (
+            config.ColdArchiveCacheConfig(
+                type=config.CacheType.COLD_ARCHIVE.value,
+                hot_cache_config=config.GcsCacheConfig(
+                    type=config.CacheType.GCS_SQLITE.value, bucket_name="test-bucket"
+                ),
+                archive_location="gs://test-bucket/cache/event_cache_archive",
+            ),
+            ("test-bucket", "cache/event_cache.db.dispatch"),
+        ),
+        (config.MemoryCacheConfig(type=config.CacheType.MEMORY.value), None),
+    ],
+)
+def test_index_location_ok(value: config.CacheConfig, expected):
+    assert dispatch.index_location(value) == expected
+
+
+@pytest.mark.asyncio
+async def test_write_index_ok():
+    # Given
+    cache_config = _create_local_sqlite_config()
+    # When
+    assert await dispatch.read_index(cache_config) is None
+    assert await dispatch.write_index(_TEST_INDEX, cache_config=cache_config)
+    result = await dispatch.read_index(cache_config)
+    # Then
+    assert result == _TEST_INDEX
+    # When
+    await dispatch.remove_index(cache_config)
+    # Then
+    assert await dispatch.read_index(cache_config) is None
+
+
+@pytest.mark.asyncio
+async def test_write_index_ok_not_supported():
+    assert not await dispatch.write_index(
+        _TEST_INDEX, cache_config=config.MemoryCacheConfig(type=config.CacheType.MEMORY.value)
+    )
+
+
+@pytest.mark.asyncio
+async def test_read_index_nok():
+    # Given
+    cache_config = _create_local_sqlite_config()
+    dispatch.index_location(cache_config).write_bytes(b"not an index")
+    # When/Then
+    with pytest.raises(RuntimeError):
+        await dispatch.read_index(cache_config)
+
+
+@pytest.mark.asyncio
+async def test_cache_version_ok_local_sqlite():
+    # Given
+    cache_config = _create_local_sqlite_config()
+    sqlite_file = pathlib.Path(cache_config.sqlite_file)
+    sqlite_file.unlink(missing_ok=True)
+    # When/Then: stable
+    missing = await dispatch.cache_version(cache_config)
+    assert missing == await dispatch.cache_version(cache_config)
+    # When/Then: written
+    sqlite_file.write_bytes(b"TEST_CONTENT")
+    written = await dispatch.cache_version(cache_config)
+    assert written != missing
+    # When/Then: write-ahead log
+    sqlite_file.with_name(sqlite_file.name + "-wal").write_bytes(b"TEST_WAL")
+    with_wal = await dispatch.cache_version(cache_config)
+    assert with_wal != written
+    # When/Then: the index is not part of it
+    await dispatch.write_index(_TEST_INDEX, cache_config=cache_config)
+    assert await dispatch.cache_version(cache_config) == with_wal
+
+
+@pytest.mark.asyncio
+async def test_cache_version_ok_gcs(monkeypatch):
+    # Given
+    cache_config = config.GcsCacheConfig(type=config.CacheType.GCS_SQLITE.value, bucket_name="test-bucket")
+    objects = {cache_config.object_path: 1, f"{cache_config.object_path}.dispatch": 1}
+
+    def mocked_list_objects(*, prefix: str, **kwargs) -> List[Any]:  # pylint: disable=unused-argument
+        return [
+            types.SimpleNamespace(name=name, generation=generation)
+            for name, generation in objects.items()
+            if name.startswith(prefix)
+        ]
+
+    monkeypatch.setattr(dispatch.gcs, dispatch.gcs.list_objects.__name__, mocked_list_objects)
+    version = await dispatch.cache_version(cache_config)
+    # When/Then: index written
+    objects[f"{cache_config.object_path}.dispatch"] = 2
+    assert await dispatch.cache_version(cache_config) == version
+    # When/Then: delta written
+    objects[f"{cache_config.object_path}.deltas/1-0.json"] = 1
+    with_delta = await dispatch.cache_version(cache_config)
+    assert with_delta != version
+    # When/Then: base written
+    objects[cache_config.object_path] = 2
+    assert await dispatch.cache_version(cache_config) != with_delta
+
+
+@pytest.mark.asyncio
+async def test_cache_version_ok_not_supported():
+    assert await dispatch.cache_version(config.MemoryCacheConfig(type=config.CacheType.MEMORY.value)) is None
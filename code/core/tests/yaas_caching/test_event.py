@@ -123,3 +123,81 @@ class TestEventSnapshot:
         req = common.create_scale_request(timestamp_utc=None)
         with pytest.raises(ValueError):
             event.EventSnapshot.from_list_requests(source="TEST_SOURCE", request_lst=[req], discard_invalid=False)
+
+    @pytest.mark.parametrize(
+        "start_ts_utc,end_ts_utc,expected",
+        [
+            (None, None, [1, 3, 5, 7]),
+            (3, 5, [3, 5]),
+            (2, 6, [3, 5]),
+            (None, 3, [1, 3]),
+            (6, None, [7]),
+            (8, 9, []),
+        ],
+    )
+    def test_slice_ok(self, start_ts_utc: int, end_ts_utc: int, expected: List[int]):
+        # Given
+        obj = common.create_event_snapshot("TEST_SOURCE", [7, 1, 5, 3])
+        # When
+        result = obj.slice(start_ts_utc, end_ts_utc)
+        # Then
+        assert result.source == obj.source
+        assert list(result.timestamp_to_request) == expected
+        for ts in expected:
+            assert result.timestamp_to_request.get(ts) == obj.timestamp_to_request.get(ts)
+
+    def test_timestamp_to_request_ok_keeps_api_and_json(self):
+        # Given
+        obj = common.create_event_snapshot("TEST_SOURCE", [3, 1])
+        # When
+        obj.timestamp_to_request[2] = [_TEST_SCALE_REQUEST]
+        result = event.EventSnapshot.from_json(obj.as_json())
+        # Then
+        assert isinstance(obj.timestamp_to_request, dict)
+        assert obj.range() == (1, 3)
+        assert obj.amount_requests() == 3
+        assert result == obj
+        assert result.as_json() == obj.as_json()
+        del obj.timestamp_to_request[1]
+        assert obj.range() == (2, 3)
+
+    def test_amount_requests_ok_changes_with_content(self):
+        # Given
+        obj = common.create_event_snapshot("TEST_SOURCE", [3, 1])
+        assert obj.amount_requests() == 2
+        assert obj.all_requests() == obj.timestamp_to_request[3] + obj.timestamp_to_request[1]
+        # When/Then: added
+        obj.timestamp_to_request[2] = [_TEST_SCALE_REQUEST, _TEST_SCALE_REQUEST]
+        assert obj.amount_requests() == 4
+        assert obj.all_requests()[-2:] == [_TEST_SCALE_REQUEST, _TEST_SCALE_REQUEST]
+        # When/Then: assigned
+        obj.timestamp_to_request[2] = [_TEST_SCALE_REQUEST]
+        assert obj.amount_requests() == 3
+        # When/Then: removed
+        obj.timestamp_to_request.pop(3)
+        del obj.timestamp_to_request[1]
+        assert obj.amount_requests() == 1
+        assert obj.all_requests() == [_TEST_SCALE_REQUEST]
+        # When/Then: the result is a copy
+        obj.all_requests().append(_TEST_SCALE_REQUEST)
+        assert obj.amount_requests() == len(obj.all_requests()) == 1
+        # When/Then: cleared
+        obj.timestamp_to_request.clear()
+        assert obj.amount_requests() == 0
+        assert not obj.all_requests()
+
+    def test_as_bytes_ok(self):
+        # Given
+        obj = common.create_event_snapshot("TEST_SOURCE", [3, 1, 2])
+        obj.timestamp_to_request[4] = [_TEST_SCALE_REQUEST.clone(timestamp_utc=None)]
+        # When
+        result = event.EventSnapshot.from_bytes(obj.as_bytes())
+        # Then
+        assert result == obj
+        assert list(result.timestamp_to_request) == list(obj.timestamp_to_request)
+        assert result.range() == obj.range()
+        assert len(obj.as_bytes()) < len(obj.as_json())
+
+    def test_from_bytes_nok(self):
+        with pytest.raises(ValueError):
+            event.EventSnapshot.from_bytes(b"not a snapshot")
@@ -3,9 +3,12 @@
 # pylint: disable=invalid-name
 # type: ignore
 import asyncio
+import gzip
 import pathlib
 import re
 import tempfile
+import threading
+import time
 from concurrent import futures
 from typing import Any, Callable, Generator, List, Optional, Tuple, Type
 
@@ -15,6 +18,7 @@ import pytest
 from tests import common
 from yaas_caching import event, file
 from yaas_common import const, request
+from yaas_config import config
 
 _TEST_CALENDAR_ID: str = "TEST_CALENDAR_ID"
 # pylint: disable=consider-using-with
@@ -472,6 +476,89 @@ class TestJsonLineFileStoreContextManager:
             assert len(result) == 1
             assert result[0] == _TEST_SCALE_REQUEST_AFTER
 
+    @pytest.mark.parametrize("is_archive", [True, False])
+    @pytest.mark.asyncio
+    async def test__write_scale_requests_ok_sorted_from_legacy(self, is_archive: bool):
+        # Given
+        self._create_file_with_content(is_archive, _TEST_SCALE_REQUEST_AFTER, _TEST_SCALE_REQUEST)
+        value = common.create_scale_request(timestamp_utc=200)
+        # When
+        async with self.instance as obj:
+            await obj._write_scale_requests([value], is_archive=is_archive)
+        # Then
+        async with self.instance as obj:
+            result = [req async for req in obj._read_scale_requests(is_archive=is_archive)]
+            assert result == [_TEST_SCALE_REQUEST, value, _TEST_SCALE_REQUEST_AFTER]
+            if is_archive:
+                assert not obj.archive_json_line_file.exists()
+                assert obj.archive_segment_keys() == ["197001"]
+            else:
+                assert obj._read_index(obj.json_line_file) is not None
+
+    @pytest.mark.asyncio
+    async def test_archive_ok_segments(self):
+        # Given
+        jan, feb, mar = 1704067200, 1706745600, 1709251200  # 2024-01-01, 2024-02-01, 2024-03-01
+        value = [common.create_scale_request(timestamp_utc=ts) for ts in (mar, jan, feb, jan + 10)]
+        async with self.instance as obj:
+            await obj._write_scale_requests(value, is_archive=True)
+        # When
+        async with self.instance as obj:
+            keys = obj.archive_segment_keys()
+            keys_in_range = obj.archive_segment_keys(start_ts_utc=feb, end_ts_utc=feb + 1)
+            result = [req async for req in obj._read_scale_requests(start_ts_utc=jan, end_ts_utc=jan, is_archive=True)]
+        # Then
+        assert keys == ["202401", "202402", "202403"]
+        assert keys_in_range == ["202402"]
+        assert [req.timestamp_utc for req in result] == [jan, jan + 10]
+        with gzip.open(self.instance._archive_segment_path("202401"), "rt", encoding=const.ENCODING_UTF8) as in_file:
+            assert len(in_file.read().splitlines()) == 2
+
+    @pytest.mark.asyncio
+    async def test_remove_ok_archive_drops_segments(self):
+        # Given
+        jan, feb = 1704067200, 1706745600  # 2024-01-01, 2024-02-01
+        value = [common.create_scale_request(timestamp_utc=ts) for ts in (jan, jan + 10, feb, feb + 10)]
+        async with self.instance as obj:
+            await obj._write_scale_requests(value, is_archive=True)
+        # When
+        async with self.instance as obj:
+            removed = await obj._remove_scale_requests_in_range(1, feb, is_archive=True)
+        # Then
+        assert [req.timestamp_utc for req in removed] == [jan, jan + 10, feb]
+        async with self.instance as obj:
+            assert obj.archive_segment_keys() == ["202402"]
+            result = [req async for req in obj._read_scale_requests(is_archive=True)]
+        assert [req.timestamp_utc for req in result] == [feb + 10]
+
+    @pytest.mark.asyncio
+    async def test__read_scale_requests_ok_seeks_with_index(self, monkeypatch):
+        # Given
+        monkeypatch.setattr(file, "_JSON_LINE_INDEX_STRIDE", 2)
+        value = [common.create_scale_request(timestamp_utc=ts) for ts in range(10, 0, -1)]
+        async with self.instance as obj:
+            await obj._write_scale_requests(value)
+            index = obj._read_index(obj.json_line_file)
+        # When
+        async with self.instance as obj:
+            result = [req async for req in obj._read_scale_requests(start_ts_utc=5, end_ts_utc=7)]
+        # Then
+        assert index.timestamps == [1, 3, 5, 7, 9]
+        assert index.offset(5) == index.offsets[1]
+        assert [req.timestamp_utc for req in result] == [3, 4, 5, 6, 7]
+
+    @pytest.mark.asyncio
+    async def test__read_scale_requests_ok_ignores_stale_index(self):
+        # Given
+        async with self.instance as obj:
+            await obj._write_scale_requests([_TEST_SCALE_REQUEST_AFTER])
+        self._create_file_with_content(False, _TEST_SCALE_REQUEST)
+        # When
+        async with self.instance as obj:
+            result = [req async for req in obj._read_scale_requests(start_ts_utc=0, end_ts_utc=400)]
+        # Then
+        assert set(result) == {_TEST_SCALE_REQUEST, _TEST_SCALE_REQUEST_AFTER}
+
 
 @pytest.mark.parametrize(
     "dto_class,primary_key",
@@ -524,6 +611,73 @@ class TestSQLiteStoreContextManager:
                 sqlite_file=sqlite_file,
             )
 
+    @pytest.mark.asyncio
+    async def test_content_digest_ok(self):
+        # Given
+        value = [common.create_scale_request(timestamp_utc=ts, original_json_event=str(ts)) for ts in range(1, 11)]
+        async with self.instance as obj:
+            empty = await obj.content_digest()
+            await obj._write_scale_requests(value)
+            expected = await obj.content_digest()
+            # When: same content, written in another order
+            await obj.remove(start_ts_utc=1, end_ts_utc=5)
+            await obj._write_scale_requests(list(reversed(value[:5])))
+            result = await obj.content_digest()
+            # Then
+            assert result == expected
+            assert result != empty
+            # When: same requests, archived
+            await obj.archive(start_ts_utc=1, end_ts_utc=1)
+            # Then
+            assert await obj.content_digest() != expected
+
+    def test_ctor_nok_performance_config(self):
+        with pytest.raises(TypeError):
+            file.SQLiteStoreContextManager(sqlite_file=self.instance.sqlite_file, performance_config={})
+
+    @pytest.mark.asyncio
+    async def test_open_ok_performance_config(self):
+        # Given
+        self.instance = file.SQLiteStoreContextManager(
+            sqlite_file=self.instance.sqlite_file,
+            performance_config=config.SqlitePerformanceConfig(
+                journal_mode="wal", synchronous="full", page_size=8192, cache_size_in_kib=1024
+            ),
+        )
+        # When
+        async with self.instance as obj:
+            result = [
+                obj._connection.execute(f"PRAGMA {pragma};").fetchone()[0]
+                for pragma in ("journal_mode", "synchronous", "page_size", "cache_size")
+            ]
+        # Then: synchronous FULL is 2
+        assert result == ["wal", 2, 8192, -1024]
+
+    @pytest.mark.parametrize("vacuum_free_page_ratio,expected_vacuum", [(0.1, True), (1, False)])
+    @pytest.mark.asyncio
+    async def test_close_ok_vacuum_if_fragmented(self, vacuum_free_page_ratio: float, expected_vacuum: bool):
+        # Given
+        self.instance = file.SQLiteStoreContextManager(
+            sqlite_file=self.instance.sqlite_file,
+            performance_config=config.SqlitePerformanceConfig(vacuum_free_page_ratio=vacuum_free_page_ratio),
+        )
+        value = [
+            common.create_scale_request(timestamp_utc=ts, original_json_event=str(ts) * 100) for ts in range(1, 1001)
+        ]
+        async with self.instance as obj:
+            await obj._write_scale_requests(value)
+        size_before = self.instance.sqlite_file.stat().st_size
+        # When
+        async with self.instance as obj:
+            await obj.remove(start_ts_utc=1, end_ts_utc=990)
+        # Then
+        connection = file._sqlite_connection(self.instance.sqlite_file)
+        free_page_count = connection.execute("PRAGMA freelist_count;").fetchone()[0]
+        connection.close()
+        assert (free_page_count == 0) == expected_vacuum
+        assert (self.instance.sqlite_file.stat().st_size < size_before / 2) == expected_vacuum
+        assert not self.instance.sqlite_file.with_name(self.instance.sqlite_file.name + "-wal").exists()
+
     @pytest.mark.parametrize("is_archive", [True, False])
     @pytest.mark.asyncio
     async def test__read_scale_requests_ok_file_does_not_exist(self, is_archive: bool):
@@ -552,10 +706,8 @@ class TestSQLiteStoreContextManager:
         connection = file._sqlite_connection(self.instance.sqlite_file)
         cursor = connection.cursor()
         self.instance._create_tables(cursor)
-        insert_stmt = self.instance._insert_stmt_tmpl(is_archive)
         cursor = connection.cursor()
-        insert_values = [self.instance._to_row(val) for val in values]
-        cursor.executemany(insert_stmt, insert_values)
+        self.instance._insert_scale_requests(cursor, values, is_archive=is_archive)
         connection.commit()
         cursor.close()
         connection.close()
@@ -570,10 +722,23 @@ class TestSQLiteStoreContextManager:
             result = []
             async for req in obj._read_scale_requests(is_archive=is_archive):
                 result.append(req)
-        # Then
-        assert len(result) == 2
-        for val in result:
-            assert val == _TEST_SCALE_REQUEST
+        # Then: duplicates are ignored
+        assert result == [_TEST_SCALE_REQUEST]
+
+    @pytest.mark.parametrize("is_archive", [True, False])
+    @pytest.mark.asyncio
+    async def test_read_iter_ok(self, is_archive: bool):
+        # Given
+        values = [common.create_scale_request(timestamp_utc=ts) for ts in [30, 10, 20, 40]]
+        self._create_file_with_content(is_archive, *values)
+        # When
+        async with self.instance as obj:
+            result = [
+                batch
+                async for batch in obj.read_iter(start_ts_utc=10, end_ts_utc=30, is_archive=is_archive, batch_size=2)
+            ]
+        # Then: ordered by timestamp
+        assert [[req.timestamp_utc for req in batch] for batch in result] == [[10, 20], [30]]
 
     @pytest.mark.parametrize("is_archive", [True, False])
     @pytest.mark.asyncio
@@ -594,24 +759,26 @@ class TestSQLiteStoreContextManager:
         # Given/When
         async with self.instance as obj:
             await obj._write_scale_requests([_TEST_SCALE_REQUEST, _TEST_SCALE_REQUEST], is_archive=is_archive)
-        # Then
+        # Then: duplicates are ignored
         async with self.instance as obj:
             result = []
             async for req in obj._read_scale_requests(is_archive=is_archive):
                 result.append(req)
-            assert len(result) == 2
-            for req in result:
-                assert req == _TEST_SCALE_REQUEST
+            assert result == [_TEST_SCALE_REQUEST]
 
     @pytest.mark.parametrize("is_archive", [True, False])
     @pytest.mark.asyncio
-    async def test__remove_scale_requests_nok(self, is_archive: bool):
+    async def test__remove_scale_requests_ok(self, is_archive: bool):
         # Given
-        value = [_TEST_SCALE_REQUEST]
+        other = _TEST_SCALE_REQUEST.clone(command=None)
+        self._create_file_with_content(is_archive, _TEST_SCALE_REQUEST, other, _TEST_SCALE_REQUEST_AFTER)
         # When
-        with pytest.raises(NotImplementedError):
-            async with self.instance as obj:
-                await obj._remove_scale_requests(value, is_archive=is_archive)
+        async with self.instance as obj:
+            result = await obj._remove_scale_requests([other, _TEST_SCALE_REQUEST_AFTER], is_archive=is_archive)
+            remaining = [req async for req in obj._read_scale_requests(is_archive=is_archive)]
+        # Then
+        assert result == [other, _TEST_SCALE_REQUEST_AFTER]
+        assert remaining == [_TEST_SCALE_REQUEST]
 
     @pytest.mark.parametrize("is_archive", [True, False])
     @pytest.mark.asyncio
@@ -663,6 +830,295 @@ class TestSQLiteStoreContextManager:
             assert len(result) == 1
             assert result[0] == _TEST_SCALE_REQUEST_AFTER
 
+    @pytest.mark.asyncio
+    async def test_archive_ok(self, monkeypatch):
+        # Given
+        self._create_file_with_content(False, _TEST_SCALE_REQUEST, _TEST_SCALE_REQUEST_AFTER)
+
+        async def mocked_write_scale_requests(*args, **kwargs):
+            raise RuntimeError(f"Should not be called with: {args}, {kwargs}")
+
+        monkeypatch.setattr(self.instance, self.instance._write_scale_requests.__name__, mocked_write_scale_requests)
+        # When
+        async with self.instance as obj:
+            result = await obj.archive(
+                start_ts_utc=_TEST_SCALE_REQUEST.timestamp_utc,
+                end_ts_utc=_TEST_SCALE_REQUEST.timestamp_utc,
+            )
+        # Then
+        assert result.all_requests() == [_TEST_SCALE_REQUEST]
+        assert self.instance.has_changed
+        async with self.instance as obj:
+            current = [req async for req in obj._read_scale_requests(is_archive=False)]
+            archived = [req async for req in obj._read_scale_requests(is_archive=True)]
+        assert current == [_TEST_SCALE_REQUEST_AFTER]
+        assert archived == [_TEST_SCALE_REQUEST]
+
+    @pytest.mark.asyncio
+    async def test_archive_nok_rolled_back(self, monkeypatch):
+        # Given
+        self._create_file_with_content(False, _TEST_SCALE_REQUEST, _TEST_SCALE_REQUEST_AFTER)
+
+        def mocked_delete_stmt_by_timestamp_utc(*args, **kwargs):  # pylint: disable=unused-argument
+            return "DELETE FROM table_does_not_exist;", ()
+
+        monkeypatch.setattr(
+            self.instance,
+            self.instance._delete_stmt_by_timestamp_utc.__name__,
+            mocked_delete_stmt_by_timestamp_utc,
+        )
+        # When
+        async with self.instance as obj:
+            with pytest.raises(file.base.StoreError):
+                await obj.archive(start_ts_utc=0, end_ts_utc=_TEST_SCALE_REQUEST_AFTER.timestamp_utc)
+        # Then: nothing moved
+        monkeypatch.undo()
+        async with self.instance as obj:
+            current = [req async for req in obj._read_scale_requests(is_archive=False)]
+            archived = [req async for req in obj._read_scale_requests(is_archive=True)]
+        assert current == [_TEST_SCALE_REQUEST, _TEST_SCALE_REQUEST_AFTER]
+        assert not archived
+
+    @pytest.mark.parametrize("start_ts_utc,end_ts_utc", [(None, None), (0, _TEST_SCALE_REQUEST.timestamp_utc)])
+    @pytest.mark.asyncio
+    async def test_archive_ok_overwrites_already_archived(self, start_ts_utc: Optional[int], end_ts_utc: Optional[int]):
+        # Given: same key, different content
+        already_archived = attrs.evolve(_TEST_SCALE_REQUEST, original_json_event="OLD_EVENT")
+        to_archive = attrs.evolve(_TEST_SCALE_REQUEST, original_json_event="NEW_EVENT")
+        self._create_file_with_content(True, already_archived)
+        self._create_file_with_content(False, to_archive)
+        # When
+        async with self.instance as obj:
+            result = await obj._archive_scale_requests_in_range_from_db(
+                start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc
+            )
+        # Then
+        assert result == [to_archive]
+        async with self.instance as obj:
+            current = [req async for req in obj._read_scale_requests(is_archive=False)]
+            archived = [req async for req in obj._read_scale_requests(is_archive=True)]
+            payloads = obj._connection.execute(f"SELECT {file._SQLITE_PAYLOAD_COLUMN} FROM EventPayload;").fetchall()
+        assert not current
+        assert archived == [to_archive]
+        assert payloads == [("NEW_EVENT",)]
+
+    @pytest.mark.parametrize(
+        "start_ts_utc,end_ts_utc,expected_clause,expected_params",
+        [
+            (None, None, "", ()),
+            (1, None, "WHERE timestamp_utc >= ?", (1,)),
+            (None, 2, "WHERE timestamp_utc <= ?", (2,)),
+            (1, 2, "WHERE timestamp_utc BETWEEN ? AND ?", (1, 2)),
+        ],
+    )
+    def test__ts_where_clause_ok(
+        self, start_ts_utc: int, end_ts_utc: int, expected_clause: str, expected_params: Tuple[int, ...]
+    ):
+        # Given/When
+        clause, params = self.instance._ts_where_clause(start_ts_utc, end_ts_utc)
+        # Then
+        assert clause == expected_clause
+        assert params == expected_params
+
+    @pytest.mark.asyncio
+    async def test__open_ok_migrate_legacy_schema(self):
+        # Given: schema as created before versioning, i.e., no index and user_version = 0
+        connection = file._sqlite_connection(self.instance.sqlite_file)
+        for schema_name in (file._SQLITE_CURRENT_SCHEMA_NAME, file._SQLITE_ARCHIVE_SCHEMA_NAME):
+            connection.execute(file._SQLITE_TABLE_SCHEMA_TMPL.replace(file._SQLITE_SCHEMA_NAME_TOKEN, schema_name))
+        legacy_columns = sorted(field.name for field in attrs.fields(request.ScaleRequest))
+        connection.executemany(
+            f"INSERT INTO {self.instance._current_table_name()} ({', '.join(legacy_columns)}) "
+            f"VALUES({', '.join(['?'] * len(legacy_columns))})",
+            [
+                tuple(val.as_dict().get(column) for column in legacy_columns)
+                for val in (_TEST_SCALE_REQUEST, _TEST_SCALE_REQUEST_AFTER)
+            ],
+        )
+        connection.commit()
+        connection.close()
+        # When
+        async with self.instance as obj:
+            result = await obj.read(start_ts_utc=0, end_ts_utc=_TEST_SCALE_REQUEST_AFTER.timestamp_utc)
+        # Then
+        assert result.all_requests() == [_TEST_SCALE_REQUEST, _TEST_SCALE_REQUEST_AFTER]
+        connection = file._sqlite_connection(self.instance.sqlite_file)
+        assert file._sqlite_schema_version(connection.cursor()) == file.SQLITE_SCHEMA_VERSION
+        index_names = [
+            row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index';").fetchall()
+        ]
+        connection.close()
+        for table_name in (self.instance._current_table_name(), self.instance._archive_table_name()):
+            assert f"{table_name}_timestamp_utc_idx" in index_names
+
+    @pytest.mark.asyncio
+    async def test__write_scale_requests_ok_payload_stored_once(self):
+        # Given
+        value = [common.create_scale_request(timestamp_utc=ts) for ts in range(1, 21)]
+        # When
+        async with self.instance as obj:
+            await obj._write_scale_requests(value)
+            await obj._write_scale_requests([_TEST_SCALE_REQUEST], is_archive=True)
+            result = [req async for req in obj._read_scale_requests()]
+            cursor = obj._create_cursor()
+            payload_count = cursor.execute(f"SELECT COUNT(*) FROM {file._SQLITE_PAYLOAD_TABLE_NAME};").fetchone()[0]
+            stored_payloads = cursor.execute(
+                f"SELECT {file._SQLITE_PAYLOAD_COLUMN} FROM {obj._current_table_name()};"
+            ).fetchall()
+            cursor.close()
+        # Then
+        assert result == value
+        assert payload_count == 1
+        assert all(row[0] is None for row in stored_payloads)
+
+    @pytest.mark.asyncio
+    async def test__read_scale_requests_ok_fetch_many_off_event_loop(self, monkeypatch):
+        # Given
+        value = [common.create_scale_request(timestamp_utc=ts) for ts in range(1, 6)]
+        self._create_file_with_content(False, *value)
+        monkeypatch.setattr(file, "_SQLITE_FETCH_SIZE", 2)
+        fetched = []
+        fetch_scale_requests = self.instance._fetch_scale_requests
+
+        def counting_fetch(cursor, payloads):
+            result = fetch_scale_requests(cursor, payloads)
+            fetched.append((threading.get_ident(), len(result)))
+            return result
+
+        monkeypatch.setattr(self.instance, "_fetch_scale_requests", counting_fetch)
+        # When
+        async with self.instance as obj:
+            result = [req async for req in obj._read_scale_requests()]
+        # Then
+        assert result == value
+        assert [amount for _, amount in fetched] == [2, 2, 1, 0]
+        assert threading.get_ident() not in {ident for ident, _ in fetched}
+
+    @pytest.mark.asyncio
+    async def test__read_scale_requests_ok_event_loop_not_blocked(self, monkeypatch):
+        # Given
+        self._create_file_with_content(False, _TEST_SCALE_REQUEST)
+        fetch_scale_requests = self.instance._fetch_scale_requests
+        ticks = []
+
+        def slow_fetch(cursor, payloads):
+            time.sleep(0.1)
+            return fetch_scale_requests(cursor, payloads)
+
+        async def read_all():
+            return [req async for req in self.instance._read_scale_requests()]
+
+        async def tick():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        monkeypatch.setattr(self.instance, "_fetch_scale_requests", slow_fetch)
+        # When
+        async with self.instance:
+            result, _ = await asyncio.gather(read_all(), tick())
+        # Then: all ticks happened while the first batch was being fetched
+        assert result == [_TEST_SCALE_REQUEST]
+        assert ticks[-1] - ticks[0] < 0.1
+
+    @pytest.mark.asyncio
+    async def test_remove_ok_deletes_orphan_payloads(self):
+        # Given
+        kept = common.create_scale_request(timestamp_utc=10, original_json_event="KEPT")
+        removed = common.create_scale_request(timestamp_utc=1, original_json_event="REMOVED")
+        self._create_file_with_content(False, kept, removed)
+        self._create_file_with_content(True, removed.clone(timestamp_utc=2))
+        async with self.instance as obj:
+            # When
+            await obj.remove(start_ts_utc=1, end_ts_utc=1)
+            # Then: still referenced by the archive
+            assert obj._read_payload(file._sqlite_payload_hash("REMOVED")) == "REMOVED"
+            # When
+            await obj.remove(start_ts_utc=1, end_ts_utc=2, is_archive=True)
+            # Then
+            with pytest.raises(file.base.StoreError):
+                obj._read_payload(file._sqlite_payload_hash("REMOVED"))
+            assert obj._read_payload(file._sqlite_payload_hash("KEPT")) == "KEPT"
+
+    @pytest.mark.asyncio
+    async def test_write_ok_ignores_existing_without_reading(self, monkeypatch):
+        # Given
+        value = common.create_event_snapshot("test", [1, 2, 3])
+
+        async def no_read(**kwargs):
+            raise RuntimeError(kwargs)
+
+        # When
+        async with self.instance as obj:
+            await obj.write(value)
+            monkeypatch.setattr(obj, obj._read_scale_requests_in_range.__name__, no_read)
+            await obj.write(value)
+            await obj.write(value.clone(source="other"))
+            monkeypatch.undo()
+            result = await obj.read(start_ts_utc=1, end_ts_utc=3)
+        # Then
+        assert result.all_requests() == value.all_requests()
+
+    @pytest.mark.asyncio
+    async def test__open_ok_migrate_removes_duplicates(self):
+        # Given: schema version 3, without unique key
+        connection = file._sqlite_connection(self.instance.sqlite_file)
+        cursor = connection.cursor()
+        cursor.execute("BEGIN;")
+        for stmt_tmpl_lst in file._SQLITE_SCHEMA_MIGRATIONS[:3]:
+            for stmt_tmpl in stmt_tmpl_lst:
+                cursor.execute(stmt_tmpl.replace(file._SQLITE_SCHEMA_NAME_TOKEN, file._SQLITE_CURRENT_SCHEMA_NAME))
+                cursor.execute(stmt_tmpl.replace(file._SQLITE_SCHEMA_NAME_TOKEN, file._SQLITE_ARCHIVE_SCHEMA_NAME))
+        cursor.execute("PRAGMA user_version = 3;")
+        cursor.executemany(
+            f"INSERT INTO {self.instance._current_table_name()} ({', '.join(self.instance._column_names())}) "
+            f"VALUES({', '.join(['?'] * len(self.instance._column_names()))})",
+            [self.instance._to_row(_TEST_SCALE_REQUEST)] * 3,
+        )
+        connection.commit()
+        connection.close()
+        # When
+        async with self.instance as obj:
+            await obj._write_scale_requests([_TEST_SCALE_REQUEST, _TEST_SCALE_REQUEST_AFTER])
+            result = [req.timestamp_utc async for req in obj._read_scale_requests()]
+        # Then
+        assert result == [_TEST_SCALE_REQUEST.timestamp_utc, _TEST_SCALE_REQUEST_AFTER.timestamp_utc]
+
+    @pytest.mark.asyncio
+    async def test__open_nok_newer_schema(self):
+        # Given
+        connection = file._sqlite_connection(self.instance.sqlite_file)
+        connection.execute(f"PRAGMA user_version = {file.SQLITE_SCHEMA_VERSION + 1};")
+        connection.close()
+        # When/Then
+        with pytest.raises(file.base.StoreError):
+            async with self.instance:
+                pass
+
+    @pytest.mark.parametrize("is_archive", [True, False])
+    @pytest.mark.asyncio
+    async def test_range_stmt_ok_uses_index(self, is_archive: bool):
+        # Given
+        amount = 10_000
+        self._create_file_with_content(
+            is_archive,
+            *[common.create_scale_request(timestamp_utc=ts) for ts in range(1, amount + 1)],
+        )
+        start_ts_utc, end_ts_utc = amount // 2, amount // 2 + 10
+        async with self.instance as obj:
+            for stmt, params in (
+                obj._select_stmt_by_timestamp_utc(start_ts_utc, end_ts_utc, is_archive),
+                obj._delete_stmt_by_timestamp_utc(start_ts_utc, end_ts_utc, is_archive),
+            ):
+                # When
+                plan = obj._connection.execute(f"EXPLAIN QUERY PLAN {stmt}", params).fetchall()
+                # Then: no full table scan
+                plan_details = " ".join(str(row[-1]) for row in plan)
+                assert "USING INDEX" in plan_details or "USING COVERING INDEX" in plan_details
+            # Then: content
+            result = await obj.read(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, is_archive=is_archive)
+            assert result.amount_requests() == end_ts_utc - start_ts_utc + 1
+
 
 ##########################
 # START: Multiprocessing #
@@ -710,14 +1166,14 @@ async def _remove(json_line_file: pathlib.Path, start: int, end: int) -> str:
 
 
 def _run_async(_async_fn: Callable, *args) -> Optional[str]:
-    loop = asyncio.get_event_loop()
-    return loop.run_until_complete(_async_fn(*args))
+    # a fresh loop, the one inherited from the parent process would submit to its (forked) default executor
+    return asyncio.run(_async_fn(*args))
 
 
 def _run_twice(
     _async_fn: Callable, args_first: List[Any], args_second: List[Any]
 ) -> Tuple[Optional[str], Optional[str]]:
-    with futures.ProcessPoolExecutor() as executor:
+    with futures.ProcessPoolExecutor(max_workers=2) as executor:
         first = executor.submit(_run_async, _async_fn, *args_first)
         second = executor.submit(_run_async, _async_fn, *args_second)
         result = first.result(), second.result()
@@ -2,20 +2,125 @@
 # pylint: disable=missing-module-docstring,missing-class-docstring,protected-access,attribute-defined-outside-init
 # type: ignore
 import pathlib
-from typing import Optional, Union
+import shutil
+import sqlite3
+import tempfile
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 
 import pytest
 
-from yaas_caching import gcs
+from tests import common
+from yaas_caching import delta, event, gcs
 
 _TEST_BUCKET_NAME: str = "test_bucket"
 _TEST_DB_OBJECT_PATH: str = "path/to/sql.db"
+_TEST_GENERATION: int = 123
+_TEST_START_TS_UTC: int = 1000
+
+
+class _MyBlobMetadata:
+    def __init__(self, generation: int, content_encoding: Optional[str] = None):
+        self.generation = generation
+        self.content_encoding = content_encoding
+
+
+class _MyFakeGcs:
+    """In-memory bucket, keeping the object content and generation."""
+
+    def __init__(self):
+        self.objects: Dict[str, bytes] = {}
+        self.generations: Dict[str, int] = {}
+        self.encodings: Dict[str, Optional[str]] = {}
+        self.called: Dict[str, List[Any]] = {}
+        self._next_generation = _TEST_GENERATION
+
+    def _call(self, name: str, value: Any) -> None:
+        self.called.setdefault(name, []).append(value)
+
+    def read_object_metadata(self, *, object_path: str, **kwargs) -> Optional[_MyBlobMetadata]:
+        # pylint: disable=unused-argument
+        self._call(gcs.gcs.read_object_metadata.__name__, object_path)
+        generation = self.generations.get(object_path)
+        return _MyBlobMetadata(generation, self.encodings.get(object_path)) if generation is not None else None
+
+    def read_object(  # pylint: disable=unused-argument
+        self,
+        *,
+        object_path: str,
+        filename: Optional[pathlib.Path] = None,
+        generation: Optional[int] = None,
+        **kwargs,
+    ) -> Union[bytes, bool]:
+        self._call(gcs.gcs.read_object.__name__, object_path)
+        content = self.objects.get(object_path)
+        if generation is not None and generation != self.generations.get(object_path):
+            content = None
+        if filename is not None:
+            if content is None:
+                return False
+            filename.write_bytes(content)
+            return True
+        return content
+
+    def write_object(  # pylint: disable=unused-argument
+        self,
+        *,
+        object_path: str,
+        content_source: Union[bytes, pathlib.Path],
+        if_generation_match: Optional[int] = None,
+        content_encoding: Optional[str] = None,
+        **kwargs,
+    ) -> int:
+        self._call(gcs.gcs.write_object.__name__, object_path)
+        if if_generation_match is not None and if_generation_match != self.generations.get(object_path, 0):
+            raise gcs.gcs.PreconditionFailedError(f"{object_path} does not match {if_generation_match}")
+        if isinstance(content_source, pathlib.Path):
+            content_source = content_source.read_bytes()
+        self._next_generation += 1
+        self.objects[object_path] = content_source
+        self.generations[object_path] = self._next_generation
+        self.encodings[object_path] = content_encoding
+        return self._next_generation
+
+    def list_objects(self, *, prefix: str, **kwargs) -> Iterable[Any]:  # pylint: disable=unused-argument
+        self._call(gcs.gcs.list_objects.__name__, prefix)
+        for object_path in list(self.objects):
+            if object_path.startswith(prefix):
+                yield _MyBlobName(object_path)
+
+    def delete_object(  # pylint: disable=unused-argument
+        self, *, object_path: str, if_generation_match: Optional[int] = None, **kwargs
+    ) -> bool:
+        self._call(gcs.gcs.delete_object.__name__, object_path)
+        if if_generation_match is not None and if_generation_match != self.generations.get(object_path, 0):
+            raise gcs.gcs.PreconditionFailedError(f"{object_path} does not match {if_generation_match}")
+        self.generations.pop(object_path, None)
+        return self.objects.pop(object_path, None) is not None
+
+    def patch(self, monkeypatch) -> "_MyFakeGcs":
+        for name in [
+            gcs.gcs.read_object_metadata.__name__,
+            gcs.gcs.read_object.__name__,
+            gcs.gcs.write_object.__name__,
+            gcs.gcs.list_objects.__name__,
+            gcs.gcs.delete_object.__name__,
+        ]:
+            monkeypatch.setattr(gcs.gcs, name, getattr(self, name))
+        return self
+
+
+class _MyBlobName:
+    def __init__(self, name: str):
+        self.name = name
 
 
 class TestGcsObjectStoreContextManager:
     def setup_method(self):
+        self.local_cache_dir = pathlib.Path(tempfile.mkdtemp())
         self.instance = gcs.GcsObjectStoreContextManager(
-            bucket_name=_TEST_BUCKET_NAME, db_object_path=_TEST_DB_OBJECT_PATH
+            bucket_name=_TEST_BUCKET_NAME,
+            db_object_path=_TEST_DB_OBJECT_PATH,
+            local_cache_dir=self.local_cache_dir,
         )
 
     def test_properties_ok(self):
@@ -24,6 +129,16 @@ class TestGcsObjectStoreContextManager:
         assert self.instance.bucket_name == _TEST_BUCKET_NAME
         assert self.instance.db_object_path == _TEST_DB_OBJECT_PATH
         assert self.instance.source != self.instance.sqlite_file
+        assert self.instance.local_cache_dir == self.local_cache_dir
+        assert self.instance.generation is None
+
+    def test_ctor_nok_local_cache_dir(self):
+        with pytest.raises(TypeError):
+            gcs.GcsObjectStoreContextManager(
+                bucket_name=_TEST_BUCKET_NAME,
+                db_object_path=_TEST_DB_OBJECT_PATH,
+                local_cache_dir=str(self.local_cache_dir),
+            )
 
     @pytest.mark.parametrize("has_changed", [True, False])
     @pytest.mark.asyncio
@@ -37,6 +152,8 @@ class TestGcsObjectStoreContextManager:
             project: Optional[str] = None,
             filename: Optional[pathlib.Path] = None,
             warn_read_failure: Optional[bool] = True,
+            generation: Optional[int] = None,
+            raw_download: Optional[bool] = False,
         ) -> Union[bytes, bool]:
             nonlocal called
             assert bucket_name == self.instance.bucket_name
@@ -50,14 +167,26 @@ class TestGcsObjectStoreContextManager:
             object_path: str,
             content_source: Union[bytes, pathlib.Path],
             project: Optional[str] = None,
-        ) -> None:
+            if_generation_match: Optional[int] = None,
+            content_encoding: Optional[str] = None,
+        ) -> Optional[int]:
             nonlocal called
             assert bucket_name == self.instance.bucket_name
-            assert object_path == self.instance.db_object_path
-            called[gcs.gcs.write_object.__name__] = content_source
+            if object_path == self.instance.db_object_path:
+                called[gcs.gcs.write_object.__name__] = content_source
+                return _TEST_GENERATION + 1
+            # sealed delta before uploading a new base
+            assert object_path.startswith(self.instance._delta_object_prefix(_TEST_GENERATION))
+            return 1
 
+        monkeypatch.setattr(
+            gcs.gcs,
+            gcs.gcs.read_object_metadata.__name__,
+            lambda **kwargs: _MyBlobMetadata(_TEST_GENERATION),
+        )
         monkeypatch.setattr(gcs.gcs, gcs.gcs.read_object.__name__, mocked_read_object)
         monkeypatch.setattr(gcs.gcs, gcs.gcs.write_object.__name__, mocked_write_object)
+        monkeypatch.setattr(gcs.gcs, gcs.gcs.list_objects.__name__, lambda **kwargs: [])
         self.instance._has_changed = has_changed
         # When
         async with self.instance:
@@ -66,5 +195,589 @@ class TestGcsObjectStoreContextManager:
         assert called.get(gcs.gcs.read_object.__name__) == self.instance.sqlite_file
         if has_changed:
             assert called.get(gcs.gcs.write_object.__name__) == self.instance.sqlite_file
+            assert self.instance.generation == _TEST_GENERATION + 1
+            assert not self.instance.has_changed
         else:
             assert called.get(gcs.gcs.write_object.__name__) is None
+            assert self.instance.generation == _TEST_GENERATION
+
+    def _mock_gcs(self, monkeypatch, *, generation: Optional[int]) -> Dict[str, Any]:
+        result = {}
+
+        def mocked_read_object_metadata(**kwargs) -> Optional[_MyBlobMetadata]:  # pylint: disable=unused-argument
+            return _MyBlobMetadata(generation) if generation is not None else None
+
+        def mocked_read_object(  # pylint: disable=unused-argument
+            *, filename: pathlib.Path, generation: Optional[int] = None, **kwargs
+        ) -> bool:
+            result[gcs.gcs.read_object.__name__] = generation
+            shutil.copyfile(self.remote_db, filename)
+            return True
+
+        def mocked_write_object(**kwargs) -> int:  # pylint: disable=unused-argument
+            result[gcs.gcs.write_object.__name__] = True
+            return _TEST_GENERATION + 1
+
+        monkeypatch.setattr(gcs.gcs, gcs.gcs.read_object_metadata.__name__, mocked_read_object_metadata)
+        monkeypatch.setattr(gcs.gcs, gcs.gcs.read_object.__name__, mocked_read_object)
+        monkeypatch.setattr(gcs.gcs, gcs.gcs.write_object.__name__, mocked_write_object)
+        monkeypatch.setattr(gcs.gcs, gcs.gcs.list_objects.__name__, lambda **kwargs: [])
+        return result
+
+    def _create_remote_db(self) -> None:
+        self.remote_db = self.local_cache_dir / "remote.db"
+        with sqlite3.connect(self.remote_db) as conn:
+            conn.execute("CREATE TABLE remote_marker (value TEXT);")
+
+    @pytest.mark.asyncio
+    async def test__open_ok_cache_miss_downloads_and_keeps_local_copy(self, monkeypatch):
+        # Given
+        self._create_remote_db()
+        called = self._mock_gcs(monkeypatch, generation=_TEST_GENERATION)
+        stale_file = self.instance._local_cache_file(_TEST_GENERATION - 1)
+        stale_file.parent.mkdir(parents=True)
+        stale_file.write_bytes(self.remote_db.read_bytes())
+        # When
+        async with self.instance:
+            pass
+        # Then
+        assert called.get(gcs.gcs.read_object.__name__) == _TEST_GENERATION
+        assert called.get(gcs.gcs.write_object.__name__) is None
+        assert self.instance.generation == _TEST_GENERATION
+        assert self.instance._local_cache_file(_TEST_GENERATION).exists()
+        assert not stale_file.exists()
+
+    @pytest.mark.asyncio
+    async def test__open_ok_cache_hit_does_not_download(self, monkeypatch):
+        # Given
+        self._create_remote_db()
+        called = self._mock_gcs(monkeypatch, generation=_TEST_GENERATION)
+        async with self.instance:
+            pass
+        called.clear()
+        # When
+        async with self.instance:
+            with sqlite3.connect(self.instance.sqlite_file) as conn:
+                tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table';")]
+        # Then
+        assert gcs.gcs.read_object.__name__ not in called
+        assert called.get(gcs.gcs.write_object.__name__) is None
+        assert "remote_marker" in tables
+
+    @pytest.mark.asyncio
+    async def test__open_ok_not_exists_forces_upload_and_keeps_local_copy(self, monkeypatch):
+        # Given
+        called = self._mock_gcs(monkeypatch, generation=None)
+        # When
+        async with self.instance:
+            pass
+        # Then
+        assert gcs.gcs.read_object.__name__ not in called
+        assert called.get(gcs.gcs.write_object.__name__)
+        assert self.instance.generation == _TEST_GENERATION + 1
+        assert self.instance._local_cache_file(_TEST_GENERATION + 1).exists()
+
+    def _create_instance(self, **kwargs) -> gcs.GcsObjectStoreContextManager:
+        return gcs.GcsObjectStoreContextManager(
+            bucket_name=_TEST_BUCKET_NAME,
+            db_object_path=_TEST_DB_OBJECT_PATH,
+            local_cache_dir=self.local_cache_dir,
+            **kwargs,
+        )
+
+    @pytest.mark.asyncio
+    async def test__close_ok_writes_delta_and_replays_it_on_open(self, monkeypatch):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        ts_list = [_TEST_START_TS_UTC + ndx * 60 for ndx in range(3)]
+        async with self._create_instance():
+            pass
+        base_generation = fake_gcs.generations.get(_TEST_DB_OBJECT_PATH)
+        base_content = fake_gcs.objects.get(_TEST_DB_OBJECT_PATH)
+        # When
+        async with self._create_instance() as writer:
+            await writer.write(common.create_event_snapshot("test", ts_list))
+        # Then: base is untouched, a single delta is written
+        assert fake_gcs.generations.get(_TEST_DB_OBJECT_PATH) == base_generation
+        assert fake_gcs.objects.get(_TEST_DB_OBJECT_PATH) == base_content
+        assert len(writer.delta_object_paths) == 1
+        delta_obj = delta.StoreDelta.from_json(fake_gcs.objects.get(writer.delta_object_paths[0]))
+        assert delta_obj.base_generation == base_generation
+        assert [op.type for op in delta_obj.operations] == [delta.DeltaOperationType.WRITE.value]
+        # When
+        async with self._create_instance() as reader:
+            result = await reader.read(start_ts_utc=ts_list[0], end_ts_utc=ts_list[-1])
+        # Then
+        assert result.amount_requests() == len(ts_list)
+        assert reader.delta_object_paths == writer.delta_object_paths
+        assert not reader.has_changed
+
+    @pytest.mark.asyncio
+    async def test_apply_ok_journals_removed_requests(self, monkeypatch):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        ts_list = [_TEST_START_TS_UTC + ndx * 60 for ndx in range(3)]
+        value = common.create_event_snapshot("test", ts_list)
+        async with self._create_instance() as writer:
+            await writer.write(value)
+        # When
+        async with self._create_instance() as writer:
+            await writer.apply(
+                event.EventSnapshotDiff(
+                    to_remove=common.create_event_snapshot("test", ts_list[1:2]),
+                    to_add=common.create_event_snapshot("test", [ts_list[-1] + 60]),
+                )
+            )
+        # Then
+        delta_obj = delta.StoreDelta.from_json(fake_gcs.objects.get(writer.delta_object_paths[-1]))
+        assert [op.type for op in delta_obj.operations] == [
+            delta.DeltaOperationType.REMOVE_REQUESTS.value,
+            delta.DeltaOperationType.WRITE.value,
+        ]
+        async with self._create_instance() as reader:
+            result = await reader.read(start_ts_utc=ts_list[0], end_ts_utc=ts_list[-1] + 60)
+        assert sorted(result.timestamp_to_request) == [ts_list[0], ts_list[2], ts_list[-1] + 60]
+
+    @pytest.mark.asyncio
+    async def test__close_ok_compacts_on_threshold(self, monkeypatch):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        ts_list = [_TEST_START_TS_UTC + ndx * 60 for ndx in range(4)]
+        async with self._create_instance():
+            pass
+        base_generation = fake_gcs.generations.get(_TEST_DB_OBJECT_PATH)
+        async with self._create_instance(delta_compaction_threshold=2) as writer:
+            await writer.write(common.create_event_snapshot("test", ts_list[:2]))
+        delta_object_path = writer.delta_object_paths[0]
+        # When
+        async with self._create_instance(delta_compaction_threshold=2) as writer:
+            await writer.archive(start_ts_utc=ts_list[0], end_ts_utc=ts_list[0])
+            await writer.write(common.create_event_snapshot("test", ts_list[2:]))
+        # Then
+        assert fake_gcs.generations.get(_TEST_DB_OBJECT_PATH) != base_generation
+        assert writer.generation == fake_gcs.generations.get(_TEST_DB_OBJECT_PATH)
+        assert not writer.delta_object_paths
+        assert delta_object_path not in fake_gcs.objects
+        assert delta_object_path in fake_gcs.called.get(gcs.gcs.delete_object.__name__)
+        async with self._create_instance() as reader:
+            current = await reader.read(start_ts_utc=ts_list[0], end_ts_utc=ts_list[-1])
+            archived = await reader.read(start_ts_utc=ts_list[0], end_ts_utc=ts_list[-1], is_archive=True)
+        assert current.amount_requests() == len(ts_list) - 1
+        assert archived.amount_requests() == 1
+
+    @pytest.mark.asyncio
+    async def test__close_ok_uploads_vacuumed_base(self, monkeypatch):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        ts_list = [_TEST_START_TS_UTC + ndx for ndx in range(1000)]
+        async with self._create_instance() as writer:
+            await writer._write_scale_requests(
+                [common.create_scale_request(timestamp_utc=ts, original_json_event=str(ts) * 100) for ts in ts_list]
+            )
+        size_before = len(fake_gcs.objects.get(_TEST_DB_OBJECT_PATH))
+        # When
+        async with self._create_instance(delta_compaction_threshold=1) as writer:
+            await writer.remove(start_ts_utc=ts_list[0], end_ts_utc=ts_list[-10])
+        # Then
+        content = fake_gcs.objects.get(_TEST_DB_OBJECT_PATH)
+        assert len(content) < size_before / 2
+        db_file = pathlib.Path(tempfile.mkdtemp()) / "uploaded.db"
+        db_file.write_bytes(content)
+        connection = sqlite3.connect(db_file)
+        assert connection.execute("PRAGMA freelist_count;").fetchone()[0] == 0
+        connection.close()
+        async with self._create_instance() as reader:
+            result = await reader.read(start_ts_utc=ts_list[0], end_ts_utc=ts_list[-1])
+        assert result.amount_requests() == 9
+
+    @pytest.mark.asyncio
+    async def test__open_nok_delta_from_other_base(self, monkeypatch):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        async with self._create_instance():
+            pass
+        base_generation = fake_gcs.generations.get(_TEST_DB_OBJECT_PATH)
+        object_path = f"{self.instance._delta_object_prefix(base_generation)}0-wrong.json"
+        fake_gcs.objects[object_path] = delta.StoreDelta(base_generation=base_generation + 1).as_json().encode()
+        # When/Then
+        with pytest.raises(gcs.base.StoreError):
+            async with self._create_instance():
+                pass
+
+    def test_ctor_nok_delta_compaction_threshold(self):
+        with pytest.raises(ValueError):
+            self._create_instance(delta_compaction_threshold=0)
+
+    @pytest.mark.asyncio
+    async def test__close_ok_compressed_base_is_read_back(self, monkeypatch):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        ts_list = [_TEST_START_TS_UTC + ndx * 60 for ndx in range(3)]
+        # When
+        async with self._create_instance(compression="gzip", delta_compaction_threshold=1) as writer:
+            await writer.write(common.create_event_snapshot("test", ts_list))
+        # Then
+        assert writer.compression == gcs.config.CacheCompression.GZIP
+        assert fake_gcs.encodings.get(_TEST_DB_OBJECT_PATH) == "gzip"
+        assert fake_gcs.objects.get(_TEST_DB_OBJECT_PATH).startswith(b"\x1f\x8b")
+        assert writer.bytes_uploaded >= len(fake_gcs.objects.get(_TEST_DB_OBJECT_PATH))
+        # When: read from a cold local cache, without compression configured
+        self.local_cache_dir = pathlib.Path(tempfile.mkdtemp())
+        async with self._create_instance() as reader:
+            result = await reader.read(start_ts_utc=ts_list[0], end_ts_utc=ts_list[-1])
+        # Then
+        assert result.amount_requests() == len(ts_list)
+        assert reader.bytes_downloaded == len(fake_gcs.objects.get(_TEST_DB_OBJECT_PATH))
+        assert reader.bytes_uploaded == 0
+        assert not reader._compressed_file().exists()
+
+    @pytest.mark.asyncio
+    async def test__close_ok_same_content_skips_upload(self, monkeypatch):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        ts_list = [_TEST_START_TS_UTC + ndx * 60 for ndx in range(3)]
+        async with self._create_instance() as writer:
+            await writer.write(common.create_event_snapshot("test", ts_list))
+        objects = dict(fake_gcs.objects)
+        fake_gcs.called.clear()
+        # When: remove and write back the same requests
+        async with self._create_instance() as obj:
+            removed = await obj.remove(start_ts_utc=ts_list[0], end_ts_utc=ts_list[-1])
+            await obj.write(removed, overwrite_within_range=False)
+            assert obj.has_changed
+        # Then
+        assert gcs.gcs.write_object.__name__ not in fake_gcs.called
+        assert fake_gcs.objects == objects
+        assert obj.uploads_skipped == 1
+        assert obj.bytes_uploaded == 0
+        assert not obj.has_changed
+        # When: an actual change
+        async with self._create_instance() as obj:
+            await obj.remove(start_ts_utc=ts_list[0], end_ts_utc=ts_list[0])
+        # Then
+        assert fake_gcs.called.get(gcs.gcs.write_object.__name__)
+        assert obj.uploads_skipped == 0
+
+    def test_ctor_nok_compression(self):
+        with pytest.raises(ValueError):
+            self._create_instance(compression="lz4")
+
+    async def _write_concurrently(
+        self,
+        ts_list_a: List[int],
+        ts_list_b: List[int],
+        *,
+        source_a: str = "a",
+        source_b: str = "b",
+        **kwargs,
+    ) -> None:
+        async with self._create_instance():
+            pass
+        writer_a = self._create_instance(**kwargs)
+        writer_b = self._create_instance(**kwargs)
+        # both read the same state
+        async with writer_a:
+            async with writer_b:
+                await writer_b.write(common.create_event_snapshot(source_b, ts_list_b))
+                await writer_a.write(common.create_event_snapshot(source_a, ts_list_a))
+
+    @pytest.mark.parametrize("delta_compaction_threshold", [1, 2, 10])
+    @pytest.mark.asyncio
+    async def test__close_ok_concurrent_writers_do_not_lose_updates(self, monkeypatch, delta_compaction_threshold: int):
+        # Given
+        _MyFakeGcs().patch(monkeypatch)
+        ts_list_a = [_TEST_START_TS_UTC + ndx * 60 for ndx in range(3)]
+        ts_list_b = [_TEST_START_TS_UTC + 3600 + ndx * 60 for ndx in range(2)]
+        # When
+        await self._write_concurrently(ts_list_a, ts_list_b, delta_compaction_threshold=delta_compaction_threshold)
+        # Then
+        async with self._create_instance() as reader:
+            result = await reader.read(start_ts_utc=ts_list_a[0], end_ts_utc=ts_list_b[-1])
+        assert sorted(result.timestamp_to_request) == sorted(ts_list_a + ts_list_b)
+        assert result.amount_requests() == len(ts_list_a) + len(ts_list_b)
+
+    @pytest.mark.asyncio
+    async def test__close_ok_concurrent_writers_same_requests_not_duplicated(self, monkeypatch):
+        # Given
+        _MyFakeGcs().patch(monkeypatch)
+        ts_list = [_TEST_START_TS_UTC + ndx * 60 for ndx in range(3)]
+        # When
+        await self._write_concurrently(ts_list, ts_list, source_a="same", source_b="same", delta_compaction_threshold=1)
+        # Then
+        async with self._create_instance() as reader:
+            result = await reader.read(start_ts_utc=ts_list[0], end_ts_utc=ts_list[-1])
+        assert result.amount_requests() == len(ts_list)
+
+    @pytest.mark.asyncio
+    async def test__close_ok_new_object_created_concurrently(self, monkeypatch):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        ts_list_a = [_TEST_START_TS_UTC]
+        ts_list_b = [_TEST_START_TS_UTC + 60]
+        writer_a = self._create_instance()
+        writer_b = self._create_instance()
+        # When
+        async with writer_a:
+            await writer_a.write(common.create_event_snapshot("a", ts_list_a))
+            async with writer_b:
+                await writer_b.write(common.create_event_snapshot("b", ts_list_b))
+        # Then
+        async with self._create_instance() as reader:
+            result = await reader.read(start_ts_utc=ts_list_a[0], end_ts_utc=ts_list_b[-1])
+        assert result.amount_requests() == 2
+        assert fake_gcs.objects.get(_TEST_DB_OBJECT_PATH) is not None
+
+    @pytest.mark.asyncio
+    async def test__close_nok_retries_exhausted(self, monkeypatch):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        async with self._create_instance():
+            pass
+        writer_a = self._create_instance(max_conflict_retries=0)
+        writer_b = self._create_instance()
+        # When/Then
+        with pytest.raises(gcs.base.StoreError):
+            async with writer_a:
+                async with writer_b:
+                    await writer_b.write(common.create_event_snapshot("b", [_TEST_START_TS_UTC]))
+                await writer_a.write(common.create_event_snapshot("a", [_TEST_START_TS_UTC + 60]))
+        assert len(fake_gcs.called.get(gcs.gcs.write_object.__name__)) == 3
+
+    @pytest.mark.asyncio
+    async def test_flush_ok_uploads_and_keeps_open(self, monkeypatch):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        ts_list = [_TEST_START_TS_UTC, _TEST_START_TS_UTC + 60]
+        async with self._create_instance():
+            pass
+        async with self._create_instance() as writer:
+            await writer.write(common.create_event_snapshot("test", ts_list[:1]))
+            # When
+            await writer.flush()
+            # Then
+            assert not writer.has_changed
+            assert len(writer.delta_object_paths) == 1
+            async with self._create_instance() as reader:
+                assert (await reader.read(start_ts_utc=ts_list[0], end_ts_utc=ts_list[-1])).amount_requests() == 1
+            # store remains usable
+            await writer.write(common.create_event_snapshot("test", ts_list[1:]))
+        assert len(writer.delta_object_paths) == 2
+        assert len([path for path in fake_gcs.objects if path != _TEST_DB_OBJECT_PATH]) == 2
+
+    @pytest.mark.asyncio
+    async def test_refresh_ok_no_change_only_checks_metadata(self, monkeypatch):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        async with self._create_instance():
+            pass
+        async with self._create_instance() as reader:
+            fake_gcs.called.clear()
+            # When
+            result = await reader.refresh()
+        # Then
+        assert not result
+        assert gcs.gcs.read_object.__name__ not in fake_gcs.called
+        assert gcs.gcs.write_object.__name__ not in fake_gcs.called
+        assert len(fake_gcs.called.get(gcs.gcs.read_object_metadata.__name__)) == 1
+
+    @pytest.mark.parametrize("delta_compaction_threshold", [1, 10])
+    @pytest.mark.asyncio
+    async def test_refresh_ok_sees_concurrent_changes(self, monkeypatch, delta_compaction_threshold: int):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        ts_list = [_TEST_START_TS_UTC, _TEST_START_TS_UTC + 60]
+        async with self._create_instance():
+            pass
+        async with self._create_instance() as reader:
+            assert not (await reader.read(start_ts_utc=ts_list[0], end_ts_utc=ts_list[-1])).amount_requests()
+            async with self._create_instance(delta_compaction_threshold=delta_compaction_threshold) as writer:
+                await writer.write(common.create_event_snapshot("test", ts_list))
+            fake_gcs.called.clear()
+            # When
+            result = await reader.refresh()
+            # Then
+            assert result
+            assert (await reader.read(start_ts_utc=ts_list[0], end_ts_utc=ts_list[-1])).amount_requests() == 2
+            assert reader.generation == fake_gcs.generations.get(_TEST_DB_OBJECT_PATH)
+            assert reader.delta_object_paths == writer.delta_object_paths
+            # only the new delta is read, a new base is found in the local cache
+            expected_reads = 1 if delta_compaction_threshold > 1 else 0
+            assert len(fake_gcs.called.get(gcs.gcs.read_object.__name__, [])) == expected_reads
+
+
+_TEST_OBJECT_PREFIX: str = "path/to/shards"
+_TEST_DAY_TS_UTC: int = 1672531200  # 2023-01-01T00:00:00Z
+_TEST_DAY_IN_SEC: int = 24 * 60 * 60
+
+
+class TestShardedGcsObjectStoreContextManager:
+    def setup_method(self):
+        self.local_cache_dir = pathlib.Path(tempfile.mkdtemp())
+
+    def _create_instance(self) -> gcs.ShardedGcsObjectStoreContextManager:
+        return gcs.ShardedGcsObjectStoreContextManager(
+            bucket_name=_TEST_BUCKET_NAME,
+            object_prefix=_TEST_OBJECT_PREFIX,
+            local_cache_dir=self.local_cache_dir,
+        )
+
+    def test_properties_ok(self):
+        instance = self._create_instance()
+        assert instance.source == f"gs://{_TEST_BUCKET_NAME}/{_TEST_OBJECT_PREFIX}"
+        assert instance.bucket_name == _TEST_BUCKET_NAME
+        assert instance.object_prefix == _TEST_OBJECT_PREFIX
+        assert not instance.existing_shard_keys()
+
+    @pytest.mark.parametrize(
+        "value,is_archive,expected_key,expected_range",
+        [
+            (_TEST_DAY_TS_UTC, False, "2023-01-01", (_TEST_DAY_TS_UTC, _TEST_DAY_TS_UTC + _TEST_DAY_IN_SEC - 1)),
+            (_TEST_DAY_TS_UTC - 1, False, "2022-12-31", (_TEST_DAY_TS_UTC - _TEST_DAY_IN_SEC, _TEST_DAY_TS_UTC - 1)),
+            (_TEST_DAY_TS_UTC - 1, True, "2022-12", (_TEST_DAY_TS_UTC - 31 * _TEST_DAY_IN_SEC, _TEST_DAY_TS_UTC - 1)),
+            (_TEST_DAY_TS_UTC + 40 * _TEST_DAY_IN_SEC, True, "2023-02", (1675209600, 1677628799)),
+        ],
+    )
+    def test__shard_key_and_range_ok(
+        self, value: int, is_archive: bool, expected_key: str, expected_range: Tuple[int, int]
+    ):
+        # Given/When
+        key = gcs.ShardedGcsObjectStoreContextManager._shard_key(value, is_archive)
+        result = gcs.ShardedGcsObjectStoreContextManager._shard_range(key, is_archive)
+        # Then
+        assert key == expected_key
+        assert result == expected_range
+        assert result[0] <= value <= result[1]
+
+    @pytest.mark.asyncio
+    async def test_read_ok_only_opens_overlapping_shards(self, monkeypatch):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        ts_list = [_TEST_DAY_TS_UTC + ndx * _TEST_DAY_IN_SEC for ndx in range(3)]
+        async with self._create_instance() as writer:
+            await writer.write(common.create_event_snapshot("test", ts_list))
+        fake_gcs.objects["path/to/shards/current/not-a-date.db"] = b""
+        fake_gcs.called.clear()
+        # When
+        async with self._create_instance() as reader:
+            result = await reader.read(start_ts_utc=ts_list[1], end_ts_utc=ts_list[1] + 60)
+            open_shard_keys = reader.open_shard_keys()
+        # Then
+        assert writer.existing_shard_keys() == ["2023-01-01", "2023-01-02", "2023-01-03"]
+        assert reader.existing_shard_keys() == writer.existing_shard_keys()
+        assert open_shard_keys == ["2023-01-02"]
+        assert not reader.open_shard_keys()
+        assert [req.timestamp_utc for req in result.all_requests()] == [ts_list[1]]
+        assert gcs.gcs.write_object.__name__ not in fake_gcs.called
+        assert fake_gcs.called.get(gcs.gcs.read_object_metadata.__name__) == ["path/to/shards/current/2023-01-02.db"]
+
+    @pytest.mark.asyncio
+    async def test_read_iter_ok_across_shards(self, monkeypatch):
+        # Given
+        _MyFakeGcs().patch(monkeypatch)
+        ts_list = [_TEST_DAY_TS_UTC + ndx * _TEST_DAY_IN_SEC // 2 for ndx in range(5)]
+        async with self._create_instance() as writer:
+            await writer.write(common.create_event_snapshot("test", ts_list))
+        # When
+        async with self._create_instance() as reader:
+            result = [
+                batch async for batch in reader.read_iter(start_ts_utc=ts_list[1], end_ts_utc=ts_list[-1], batch_size=3)
+            ]
+        # Then
+        assert [[req.timestamp_utc for req in batch] for batch in result] == [ts_list[1:4], ts_list[4:]]
+
+    @pytest.mark.asyncio
+    async def test_archive_ok(self, monkeypatch):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        ts_list = [_TEST_DAY_TS_UTC - _TEST_DAY_IN_SEC, _TEST_DAY_TS_UTC, _TEST_DAY_TS_UTC + 60]
+        async with self._create_instance() as writer:
+            await writer.write(common.create_event_snapshot("test", ts_list))
+        # When
+        async with self._create_instance() as archiver:
+            archived = await archiver.archive(start_ts_utc=1, end_ts_utc=_TEST_DAY_TS_UTC)
+        # Then
+        assert sorted(archived.timestamp_to_request) == ts_list[:2]
+        assert archiver.existing_shard_keys(is_archive=True) == ["2022-12", "2023-01"]
+        assert archiver.existing_shard_keys() == ["2023-01-01"]
+        assert "path/to/shards/current/2022-12-31.db" not in fake_gcs.objects
+        async with self._create_instance() as reader:
+            current = await reader.read(start_ts_utc=1, end_ts_utc=ts_list[-1])
+            archive = await reader.read(start_ts_utc=1, end_ts_utc=ts_list[-1], is_archive=True)
+        assert sorted(current.timestamp_to_request) == ts_list[2:]
+        assert sorted(archive.timestamp_to_request) == ts_list[:2]
+
+    @pytest.mark.asyncio
+    async def test_apply_ok_only_touches_shards_with_changes(self, monkeypatch):
+        # Given
+        _MyFakeGcs().patch(monkeypatch)
+        ts_list = [_TEST_DAY_TS_UTC + ndx * _TEST_DAY_IN_SEC for ndx in range(3)]
+        async with self._create_instance() as writer:
+            await writer.write(common.create_event_snapshot("test", ts_list))
+        # When
+        async with self._create_instance() as obj:
+            await obj.apply(
+                event.EventSnapshotDiff(
+                    to_remove=common.create_event_snapshot("test", ts_list[1:2] + [_TEST_DAY_TS_UTC - 60]),
+                )
+            )
+            open_shard_keys = obj.open_shard_keys()
+        # Then
+        assert open_shard_keys == ["2023-01-02"]
+        async with self._create_instance() as reader:
+            result = await reader.read(start_ts_utc=ts_list[0], end_ts_utc=ts_list[-1])
+        assert sorted(result.timestamp_to_request) == [ts_list[0], ts_list[2]]
+
+    @pytest.mark.asyncio
+    async def test_remove_ok(self, monkeypatch):
+        # Given
+        _MyFakeGcs().patch(monkeypatch)
+        ts_list = [_TEST_DAY_TS_UTC + ndx * _TEST_DAY_IN_SEC for ndx in range(3)]
+        async with self._create_instance() as writer:
+            await writer.write(common.create_event_snapshot("test", ts_list))
+        # When
+        async with self._create_instance() as remover:
+            removed = await remover.remove(start_ts_utc=ts_list[1], end_ts_utc=ts_list[-1])
+            open_shard_keys = remover.open_shard_keys()
+        # Then
+        assert sorted(removed.timestamp_to_request) == ts_list[1:]
+        assert open_shard_keys == ["2023-01-02", "2023-01-03"]
+        assert remover.existing_shard_keys() == ["2023-01-01"]
+
+    @pytest.mark.asyncio
+    async def test_remove_ok_deletes_empty_shard_and_its_deltas(self, monkeypatch):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        ts_list = [_TEST_DAY_TS_UTC, _TEST_DAY_TS_UTC + 60]
+        for ts in ts_list:
+            async with self._create_instance() as writer:
+                await writer.write(common.create_event_snapshot("test", [ts]))
+        assert any(".deltas/" in object_path for object_path in fake_gcs.objects)
+        # When
+        async with self._create_instance() as remover:
+            await remover.remove(start_ts_utc=ts_list[0], end_ts_utc=ts_list[-1])
+        # Then
+        assert not remover.existing_shard_keys()
+        assert not fake_gcs.objects
+
+    @pytest.mark.asyncio
+    async def test_remove_ok_empty_shard_kept_if_delta_written_concurrently(self, monkeypatch):
+        # Given
+        fake_gcs = _MyFakeGcs().patch(monkeypatch)
+        ts_list = [_TEST_DAY_TS_UTC, _TEST_DAY_TS_UTC + 60]
+        async with self._create_instance() as writer:
+            await writer.write(common.create_event_snapshot("test", ts_list[:1]))
+        # When
+        async with self._create_instance() as remover:
+            await remover.remove(start_ts_utc=ts_list[0], end_ts_utc=ts_list[0])
+            # appended as a delta on top of the base the remover read
+            async with self._create_instance() as writer:
+                await writer.write(common.create_event_snapshot("test", ts_list[1:]))
+        # Then
+        assert remover.existing_shard_keys() == ["2023-01-01"]
+        async with self._create_instance() as reader:
+            result = await reader.read(start_ts_utc=ts_list[0], end_ts_utc=ts_list[-1])
+        assert sorted(result.timestamp_to_request) == ts_list[1:]
+        # no orphan deltas, all are on top of the current base
+        generation = fake_gcs.generations["path/to/shards/current/2023-01-01.db"]
+        delta_prefix = f"path/to/shards/current/2023-01-01.db.deltas/{generation}-"
+        assert all(path.startswith(delta_prefix) for path in fake_gcs.objects if ".deltas/" in path)
@@ -0,0 +1,255 @@
+# vim: ai:sw=4:ts=4:sta:et:fo=croql
+# pylint: disable=missing-module-docstring,missing-class-docstring,protected-access,attribute-defined-outside-init
+# type: ignore
+import pytest
+
+from tests import common
+from yaas_caching import base, event, factory, memory
+from yaas_config import config
+
+_TEST_START_TS_UTC: int = 10
+_TEST_END_TS_UTC: int = 100
+
+
+def _create_snapshot(*ts_list: int) -> event.EventSnapshot:
+    return common.create_event_snapshot("TEST_SOURCE", list(ts_list))
+
+
+class _MyCountingMemoryStore(memory.MemoryStoreContextManager):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.counts = dict(read=0, write=0, flush=0)
+
+    async def _read(self, **kwargs) -> event.EventSnapshot:
+        self.counts["read"] += 1
+        return await super()._read(**kwargs)
+
+    async def _write(self, value: event.EventSnapshot) -> None:
+        self.counts["write"] += 1
+        await super()._write(value)
+
+    async def _flush(self) -> None:
+        self.counts["flush"] += 1
+
+
+class TestMemoryStoreContextManager:
+    def setup_method(self):
+        self.now = 0.0
+
+    def _create_instance(self, monkeypatch, **kwargs) -> memory.MemoryStoreContextManager:
+        monkeypatch.setattr(memory, memory._now.__name__, lambda: self.now)
+        return memory.MemoryStoreContextManager(**kwargs)
+
+    @pytest.mark.asyncio
+    async def test_write_ok_read_range(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch)
+        # When
+        async with instance:
+            await instance.write(_create_snapshot(20, 30, 200))
+            await instance.write(_create_snapshot(30), overwrite_within_range=False)
+            result = await instance.read(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC)
+        # Then
+        assert list(result.timestamp_to_request) == [20, 30]
+        assert result.amount_requests() == 2
+
+    @pytest.mark.asyncio
+    async def test_read_ok_ttl_eviction(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch, ttl_in_sec=10)
+        await instance.write(_create_snapshot(20))
+        self.now += 5
+        await instance.write(_create_snapshot(30))
+        # When
+        self.now += 5
+        result = await instance.read(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC)
+        # Then
+        assert list(result.timestamp_to_request) == [30]
+        # When
+        self.now += 5
+        result = await instance.read(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC)
+        # Then
+        assert not result.timestamp_to_request
+
+    @pytest.mark.asyncio
+    async def test_remove_ok(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch)
+        await instance.write(_create_snapshot(20, 30))
+        # When
+        removed = await instance.remove(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=25)
+        result = await instance.read(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC)
+        # Then
+        assert list(removed.timestamp_to_request) == [20]
+        assert list(result.timestamp_to_request) == [30]
+
+    @pytest.mark.asyncio
+    async def test_apply_ok(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch)
+        await instance.write(_create_snapshot(20, 30))
+        # When
+        await instance.apply(event.EventSnapshotDiff(to_add=_create_snapshot(40), to_remove=_create_snapshot(20)))
+        result = await instance.read(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC)
+        # Then
+        assert list(result.timestamp_to_request) == [30, 40]
+
+    @pytest.mark.asyncio
+    async def test_archive_ok(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch)
+        await instance.write(_create_snapshot(20, 30))
+        # When
+        archived = await instance.archive(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=25)
+        result = await instance.read(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC)
+        result_archive = await instance.read(
+            start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC, is_archive=True
+        )
+        # Then
+        assert list(archived.timestamp_to_request) == [20]
+        assert list(result.timestamp_to_request) == [30]
+        assert result_archive.all_requests() == archived.all_requests()
+
+    @pytest.mark.parametrize("ttl_in_sec", [0, -1, "10"])
+    def test_ctor_nok(self, ttl_in_sec):
+        with pytest.raises(ValueError):
+            memory.MemoryStoreContextManager(ttl_in_sec=ttl_in_sec)
+
+
+class TestTieredStoreContextManager:
+    def setup_method(self):
+        self.now = 0.0
+        self.durable = _MyCountingMemoryStore()
+
+    def _create_instance(self, monkeypatch, **kwargs) -> memory.TieredStoreContextManager:
+        monkeypatch.setattr(memory, memory._now.__name__, lambda: self.now)
+        return memory.TieredStoreContextManager(durable=self.durable, **kwargs)
+
+    @pytest.mark.asyncio
+    async def test_read_ok_read_through(self, monkeypatch):
+        # Given
+        await self.durable.write(_create_snapshot(20, 30))
+        instance = self._create_instance(monkeypatch, ttl_in_sec=10)
+        # When
+        async with instance:
+            first = await instance.read(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC)
+            second = await instance.read(start_ts_utc=_TEST_START_TS_UTC + 5, end_ts_utc=_TEST_END_TS_UTC)
+            # Then: second comes from memory
+            assert self.durable.counts.get("read") == 1
+            assert list(first.timestamp_to_request) == [20, 30]
+            assert first.source == self.durable.source
+            assert second == first
+            # When: TTL expired
+            self.now += 10
+            await instance.read(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC)
+        # Then
+        assert self.durable.counts.get("read") == 2
+
+    @pytest.mark.asyncio
+    async def test_write_ok_write_behind(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch)
+        # When
+        async with instance:
+            await instance.read(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC)
+            await instance.write(_create_snapshot(20), overwrite_within_range=False)
+            await instance.apply(event.EventSnapshotDiff(to_add=_create_snapshot(30)))
+            result = await instance.read(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC)
+            # Then: only in memory
+            assert list(result.timestamp_to_request) == [20, 30]
+            assert self.durable.counts.get("write") == 0
+            assert instance.has_changed
+            # When
+            await instance.flush()
+            # Then
+            assert self.durable.counts.get("write") == 2
+            assert self.durable.counts.get("flush") == 1
+            assert not instance.has_changed
+        durable = await self.durable.read(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC)
+        assert durable == result
+
+    @pytest.mark.asyncio
+    async def test_apply_ok_remove_is_replayed(self, monkeypatch):
+        # Given
+        await self.durable.write(_create_snapshot(20, 30))
+        instance = self._create_instance(monkeypatch)
+        # When
+        async with instance:
+            await instance.apply(event.EventSnapshotDiff(to_remove=_create_snapshot(20)))
+        # Then: replayed on close
+        result = await self.durable.read(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC)
+        assert list(result.timestamp_to_request) == [30]
+
+    @pytest.mark.asyncio
+    async def test_read_ok_pending_replayed_before_loading(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch)
+        # When
+        async with instance:
+            await instance.write(_create_snapshot(20), overwrite_within_range=False)
+            result = await instance.read(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC)
+        # Then
+        assert list(result.timestamp_to_request) == [20]
+        assert self.durable.counts.get("write") == 1
+
+    @pytest.mark.asyncio
+    async def test_remove_ok(self, monkeypatch):
+        # Given
+        await self.durable.write(_create_snapshot(20, 30))
+        instance = self._create_instance(monkeypatch)
+        # When
+        async with instance:
+            await instance.read(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC)
+            removed = await instance.remove(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=25)
+            result = await instance.read(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC)
+        # Then
+        assert list(removed.timestamp_to_request) == [20]
+        assert list(result.timestamp_to_request) == [30]
+
+    @pytest.mark.asyncio
+    async def test_archive_ok(self, monkeypatch):
+        # Given
+        await self.durable.write(_create_snapshot(20, 30))
+        instance = self._create_instance(monkeypatch)
+        # When
+        async with instance:
+            await instance.read(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC)
+            archived = await instance.archive(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=25)
+            result = await instance.read(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC)
+            result_archive = await instance.read(
+                start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC, is_archive=True
+            )
+        # Then
+        assert list(result.timestamp_to_request) == [30]
+        assert result_archive.all_requests() == archived.all_requests()
+
+    def test_ctor_nok(self):
+        with pytest.raises(TypeError):
+            memory.TieredStoreContextManager(durable=None)
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        (
+            config.MemoryCacheConfig(type=config.CacheType.MEMORY.value, ttl_in_sec=10),
+            memory.MemoryStoreContextManager,
+        ),
+        (
+            config.TieredCacheConfig(
+                type=config.CacheType.TIERED.value,
+                durable_cache_config=config.LocalSqliteCacheConfig(
+                    type=config.CacheType.LOCAL_SQLITE.value, sqlite_file=str(common.tmpfile())
+                ),
+            ),
+            memory.TieredStoreContextManager,
+        ),
+    ],
+)
+def test_store_from_cache_config_ok(value: config.CacheConfig, expected: type):
+    # Given/When
+    result = factory.store_from_cache_config(value)
+    # Then
+    assert isinstance(result, expected)
+    assert isinstance(result, base.StoreContextManager)
+    assert result.ttl_in_sec == value.ttl_in_sec
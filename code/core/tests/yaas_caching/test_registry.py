@@ -0,0 +1,310 @@
+# vim: ai:sw=4:ts=4:sta:et:fo=croql
+# pylint: disable=missing-module-docstring,missing-class-docstring,protected-access,attribute-defined-outside-init
+# type: ignore
+import asyncio
+import pathlib
+import subprocess
+import sys
+import time
+from typing import List
+
+import pytest
+
+from tests import common
+from yaas_caching import file, registry
+from yaas_config import config
+
+_TEST_CACHE_CONFIG: config.CacheConfig = config.LocalSqliteCacheConfig(
+    type=config.CacheType.LOCAL_SQLITE.value, sqlite_file="test.db"
+)
+_TEST_OTHER_CACHE_CONFIG: config.CacheConfig = config.LocalSqliteCacheConfig(
+    type=config.CacheType.LOCAL_SQLITE.value, sqlite_file="other.db"
+)
+
+
+class _MyCountingStore(common.MyStoreContextManager):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.counts = dict(open=0, close=0, flush=0, refresh=0)
+        self.is_open = False
+        self.flush_error = None
+
+    async def _open(self) -> None:
+        self.counts["open"] += 1
+        self.is_open = True
+
+    async def _close(self) -> None:
+        self.counts["close"] += 1
+        self.is_open = False
+
+    async def _flush(self) -> None:
+        self.counts["flush"] += 1
+        if self.flush_error is not None:
+            raise self.flush_error
+
+    async def _refresh(self) -> bool:
+        self.counts["refresh"] += 1
+        return False
+
+
+class TestStoreRegistry:
+    def setup_method(self):
+        self.stores: List[_MyCountingStore] = []
+        self.now = 0.0
+
+    def _store_factory(self, value: config.CacheConfig) -> _MyCountingStore:
+        result = _MyCountingStore(source=value.sqlite_file)
+        self.stores.append(result)
+        return result
+
+    def _create_instance(self, monkeypatch, **kwargs) -> registry.StoreRegistry:
+        monkeypatch.setattr(registry, registry._now.__name__, lambda: self.now)
+        return registry.StoreRegistry(store_factory=self._store_factory, **kwargs)
+
+    @pytest.mark.asyncio
+    async def test_lease_ok_reuses_opened_store(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch)
+        # When
+        async with instance.lease(_TEST_CACHE_CONFIG) as first:
+            await first.read(start_ts_utc=0, end_ts_utc=1)
+        async with instance.lease(_TEST_CACHE_CONFIG) as second:
+            await second.read(start_ts_utc=0, end_ts_utc=1)
+        # Then
+        assert first is second
+        assert len(self.stores) == 1
+        assert first.is_open
+        assert first.counts == dict(open=1, close=0, flush=0, refresh=1)
+        assert instance.open_stores() == [first]
+
+    @pytest.mark.asyncio
+    async def test_lease_ok_one_store_per_config(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch)
+        # When
+        async with instance.lease(_TEST_CACHE_CONFIG) as first:
+            async with instance.lease(_TEST_OTHER_CACHE_CONFIG) as second:
+                pass
+        # Then
+        assert first is not second
+        assert first.source == _TEST_CACHE_CONFIG.sqlite_file
+        assert second.source == _TEST_OTHER_CACHE_CONFIG.sqlite_file
+
+    @pytest.mark.asyncio
+    async def test_lease_ok_flushes_changes_on_release(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch)
+        # When
+        async with instance.lease(_TEST_CACHE_CONFIG) as store:
+            await store.write(common.create_event_snapshot("test", [1]))
+            assert store.has_changed
+        # Then
+        assert store.counts.get("flush") == 1
+        assert not store.has_changed
+        assert store.is_open
+
+    @pytest.mark.asyncio
+    async def test_lease_ok_flush_interval(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch, flush_interval_in_sec=30)
+        # When
+        async with instance.lease(_TEST_CACHE_CONFIG) as store:
+            await store.write(common.create_event_snapshot("test", [1]))
+        # Then: not yet
+        assert store.counts.get("flush") == 0
+        assert store.has_changed
+        # When
+        await instance.flush()
+        # Then
+        assert store.counts.get("flush") == 1
+        assert not store.has_changed
+        await instance.close()
+
+    @pytest.mark.asyncio
+    async def test_lease_ok_reopens_after_ttl(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch, ttl_in_sec=10)
+        async with instance.lease(_TEST_CACHE_CONFIG) as first:
+            pass
+        # When
+        self.now += 10
+        async with instance.lease(_TEST_CACHE_CONFIG) as second:
+            pass
+        # Then
+        assert first is not second
+        assert not first.is_open
+        assert first.counts.get("close") == 1
+        assert second.is_open
+
+    @pytest.mark.asyncio
+    async def test_lease_ok_failure_closes_store(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch)
+        # When
+        with pytest.raises(RuntimeError):
+            async with instance.lease(_TEST_CACHE_CONFIG) as first:
+                raise RuntimeError
+        async with instance.lease(_TEST_CACHE_CONFIG) as second:
+            pass
+        # Then
+        assert not first.is_open
+        assert first is not second
+
+    @pytest.mark.asyncio
+    async def test_lease_ok_is_exclusive(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch)
+        in_use = []
+        overlapped = False
+
+        async def use_store() -> None:
+            nonlocal overlapped
+            async with instance.lease(_TEST_CACHE_CONFIG):
+                overlapped = overlapped or bool(in_use)
+                in_use.append(True)
+                await asyncio.sleep(0.01)
+                in_use.pop()
+
+        # When
+        await asyncio.gather(*[use_store() for _ in range(3)])
+        # Then
+        assert not overlapped
+        assert len(self.stores) == 1
+
+    @pytest.mark.asyncio
+    async def test_lease_nok_timeout(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch, lease_timeout_in_sec=1)
+        # When/Then
+        async with instance.lease(_TEST_CACHE_CONFIG):
+            with pytest.raises(registry.base.StoreLockTimeoutError):
+                async with instance.lease(_TEST_CACHE_CONFIG):
+                    pass
+
+    @pytest.mark.asyncio
+    async def test_lease_ok_after_cancelled_wait(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch, lease_timeout_in_sec=1)
+        async with instance.lease(_TEST_CACHE_CONFIG):
+            waiting = asyncio.create_task(instance.lease(_TEST_CACHE_CONFIG).__aenter__())
+            await asyncio.sleep(0.1)
+            # When
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+        # Then: the abandoned wait does not keep the lock
+        await asyncio.sleep(0.1)
+        async with instance.lease(_TEST_CACHE_CONFIG) as store:
+            assert store.is_open
+
+    @pytest.mark.asyncio
+    async def test_lease_nok_flush_failure_closes_store(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch)
+        # When
+        with pytest.raises(registry.base.StoreError):
+            async with instance.lease(_TEST_CACHE_CONFIG) as first:
+                await first.write(common.create_event_snapshot("test", [1]))
+                first.flush_error = RuntimeError("TEST_FLUSH_ERROR")
+        async with instance.lease(_TEST_CACHE_CONFIG) as second:
+            pass
+        # Then
+        assert not first.is_open
+        assert first.counts.get("close") == 1
+        assert first is not second
+
+    def test_flush_ok_periodically_after_store_loop_closed(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch, flush_interval_in_sec=1)
+
+        async def write() -> _MyCountingStore:
+            async with instance.lease(_TEST_CACHE_CONFIG) as result:
+                await result.write(common.create_event_snapshot("test", [1]))
+            return result
+
+        # the store is opened on a loop closed right after, like a request's loop
+        store = asyncio.run(write())
+        assert store.counts.get("flush") == 0
+        # When
+        for _ in range(30):
+            if store.counts.get("flush"):
+                break
+            time.sleep(0.1)
+        # Then
+        assert store.counts.get("flush") == 1
+        assert not store.has_changed
+        asyncio.run(instance.close())
+
+    @pytest.mark.asyncio
+    async def test_close_ok(self, monkeypatch):
+        # Given
+        instance = self._create_instance(monkeypatch)
+        async with instance.lease(_TEST_CACHE_CONFIG) as store:
+            pass
+        # When
+        await instance.close()
+        # Then
+        assert not store.is_open
+        assert not instance.open_stores()
+
+    def test_lease_nok_wrong_type(self, monkeypatch):
+        with pytest.raises(TypeError):
+            self._create_instance(monkeypatch).lease(_TEST_CACHE_CONFIG.as_dict())
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            dict(ttl_in_sec=0),
+            dict(flush_interval_in_sec=-1),
+            dict(lease_timeout_in_sec=0),
+            dict(ttl_in_sec="10"),
+        ],
+    )
+    def test_ctor_nok(self, kwargs):
+        with pytest.raises(ValueError):
+            registry.StoreRegistry(**kwargs)
+
+
+def test_default_ok():
+    assert registry.default() is registry.default()
+
+
+_TEST_EXIT_SCRIPT: str = """
+import asyncio
+import sys
+
+from tests import common
+from yaas_caching import file, registry
+from yaas_config import config
+
+
+async def write():
+    cache_config = config.LocalSqliteCacheConfig(type=config.CacheType.LOCAL_SQLITE.value, sqlite_file=sys.argv[1])
+    async with registry.default().lease(cache_config) as store:
+        await store.write(common.create_event_snapshot(store.source, [1]))
+
+
+# changes are only flushed at exit
+registry.DEFAULT_FLUSH_INTERVAL_IN_SEC = 600
+asyncio.run(write())
+"""
+
+
+@pytest.mark.asyncio
+async def test_default_ok_flushes_at_exit(tmpdir):
+    # Given
+    sqlite_file = pathlib.Path(tmpdir) / "test.db"
+    # When
+    result = subprocess.run(
+        [sys.executable, "-c", _TEST_EXIT_SCRIPT, str(sqlite_file)],
+        capture_output=True,
+        check=True,
+        env=dict(PYTHONPATH=":".join(sys.path)),
+        text=True,
+    )
+    # Then
+    assert "Could not close" not in result.stderr
+    assert not sqlite_file.with_name(f"{sqlite_file.name}-wal").exists()
+    async with file.SQLiteStoreContextManager(sqlite_file=sqlite_file) as store:
+        snapshot = await store.read(start_ts_utc=0, end_ts_utc=2)
+    assert snapshot.amount_requests() == 1
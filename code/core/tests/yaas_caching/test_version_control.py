@@ -267,6 +267,51 @@ def test_compare_ok_only_conflict():
     assert result.are_different()
 
 
+def test_compare_ok_identical():
+    # Given
+    snapshot_a = common.create_event_snapshot("A", [1, 2, 3])
+    snapshot_b = event.EventSnapshot.from_list_requests(
+        source="B", request_lst=list(reversed(snapshot_a.all_requests()))
+    )
+    # When
+    result = version_control.compare(snapshot_a=snapshot_a, snapshot_b=snapshot_b)
+    # Then
+    assert result.only_in_a is None
+    assert result.only_in_b is None
+    assert result.overlapping is None
+    assert not result.are_different()
+
+
+def test_compare_ok_only_differing_timestamps_overlap():
+    # Given
+    snapshot_a = common.create_event_snapshot("A", [1, 2])
+    snapshot_b = event.EventSnapshot.from_list_requests(
+        source="B",
+        request_lst=snapshot_a.timestamp_to_request.get(1) + common.create_event_snapshot("B", [2]).all_requests(),
+    )
+    # When
+    result = version_control.compare(snapshot_a=snapshot_a, snapshot_b=snapshot_b)
+    # Then
+    overlapping_a, overlapping_b = result.overlapping
+    assert list(overlapping_a.timestamp_to_request) == [2]
+    assert list(overlapping_b.timestamp_to_request) == [2]
+    assert result.are_different()
+
+
+def test_compare_ok_duplicated_request():
+    # Given
+    snapshot_a = common.create_event_snapshot("A", [1])
+    req = snapshot_a.timestamp_to_request.get(1)[0]
+    snapshot_b = event.EventSnapshot(source="B", timestamp_to_request={1: [req, req]})
+    # When
+    result = version_control.compare(snapshot_a=snapshot_a, snapshot_b=snapshot_b)
+    # Then
+    overlapping_a, overlapping_b = result.overlapping
+    assert overlapping_a.timestamp_to_request.get(1) == [req]
+    assert overlapping_b.timestamp_to_request.get(1) == [req, req]
+    assert result.are_different()
+
+
 def test_compare_ok_with_conflict():
     """different commands, always conflicting. 1  2  3  4  5.
 
@@ -303,3 +348,44 @@ def test_compare_ok_with_conflict():
         assert overlap_b.timestamp_to_request.get(ts)
     # Then: sources
     _validate_comparison_source(snapshot_a, snapshot_b, result)
+
+
+def test_diff_ok():
+    # Given
+    current = common.create_event_snapshot("A", [1, 2, 3, 10])
+    target = event.EventSnapshot.from_list_requests(
+        source="B",
+        request_lst=current.timestamp_to_request.get(2) + common.create_event_snapshot("B", [3, 4]).all_requests(),
+    )
+    # When
+    result = version_control.diff(current=current, target=target)
+    # Then: 1 and 10 are outside the target range
+    assert isinstance(result, event.EventSnapshotDiff)
+    assert sorted(result.to_add.timestamp_to_request) == [3, 4]
+    assert result.to_add.source == target.source
+    assert result.requests_to_remove() == current.timestamp_to_request.get(3)
+    assert result.to_remove.source == current.source
+
+
+@pytest.mark.parametrize(
+    "current,target",
+    [
+        (common.create_event_snapshot("A", [1, 2]), common.create_event_snapshot("A", [1, 2])),
+        (common.create_event_snapshot("A", [1, 2]), common.create_event_snapshot("B")),
+        (common.create_event_snapshot("A"), common.create_event_snapshot("B")),
+    ],
+)
+def test_diff_ok_empty(current: event.EventSnapshot, target: event.EventSnapshot):
+    assert version_control.diff(current=current, target=target).is_empty()
+
+
+@pytest.mark.parametrize(
+    "current,target",
+    [
+        (None, common.TEST_CALENDAR_SNAPSHOT),
+        (common.TEST_CACHE_SNAPSHOT, None),
+    ],
+)
+def test_diff_nok(current: event.EventSnapshot, target: event.EventSnapshot):
+    with pytest.raises(TypeError):
+        version_control.diff(current=current, target=target)
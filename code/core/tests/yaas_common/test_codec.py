@@ -0,0 +1,107 @@
+# vim: ai:sw=4:ts=4:sta:et:fo=croql
+# pylint: disable=missing-module-docstring,missing-class-docstring,protected-access
+# type: ignore
+import json
+from typing import List
+
+import pytest
+
+from tests import common
+from yaas_common import codec, request
+
+
+def _create_request_lst(amount: int) -> List[request.ScaleRequest]:
+    return [
+        common.create_scale_request(
+            topic=f"topic_{ndx % 3}",
+            resource=f"projects/my-project/locations/my-location/services/service_{ndx % 5}",
+            command=f"min_instances {ndx}",
+            timestamp_utc=1_700_000_000 + ndx * 60,
+            original_json_event=json.dumps({"ndx": ndx}) if ndx % 2 else None,
+        )
+        for ndx in range(amount)
+    ]
+
+
+@pytest.mark.parametrize(
+    "value,extra",
+    [
+        ([], ()),
+        (_create_request_lst(1), ()),
+        (_create_request_lst(100), ("TEST_SOURCE", None)),
+        ([request.ScaleRequest(topic="", resource="ção")], ("",)),
+    ],
+)
+def test_encode_requests_ok(value: List[request.ScaleRequest], extra: tuple):
+    # Given/When
+    result = codec.decode_requests(codec.encode_requests(value, *extra))
+    # Then
+    assert result == (value, list(extra))
+
+
+def test_encode_ok_groups_keep_order():
+    # Given
+    req_lst = _create_request_lst(4)
+    value = {300: req_lst[:1], 0: [], 2**40: req_lst[1:]}
+    # When
+    result, extra = codec.decode(codec.encode(value))
+    # Then
+    assert result == value
+    assert list(result) == list(value)
+    assert not extra
+
+
+def test_encode_ok_interns_strings():
+    # Given
+    req_lst = _create_request_lst(1)
+    # When
+    once = codec.encode_requests(req_lst)
+    twice = codec.encode_requests(req_lst * 2)
+    # Then: only indexes are repeated
+    assert len(twice) - len(once) < 16
+
+
+def test_encode_ok_smaller_than_json():
+    # Given
+    value = _create_request_lst(1_000)
+    collection = request.ScaleRequestCollection.from_lst(value)
+    # When
+    as_bytes = codec.encode_requests(value)
+    as_json = collection.as_json()
+    # Then
+    assert len(as_bytes) * 2 < len(as_json)
+    assert codec.decode_requests(as_bytes) == (value, [])
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        b"",
+        b"YAAS",
+        b"JSON\x01\x00\x00\x00",
+        b"YAAS\x02\x00\x00\x00",
+        b"YAAS\x01\x01\x05ab",
+        b"YAAS\x01\x00\x01\x00\x01\x01",
+        b"YAAS\x01\x00\x00\x00\x00",
+    ],
+)
+def test_decode_nok(value: bytes):
+    with pytest.raises(codec.CodecError):
+        codec.decode(value)
+
+
+@pytest.mark.parametrize("value", [None, "YAAS", [1]])
+def test_decode_nok_type(value):
+    with pytest.raises(TypeError):
+        codec.decode(value)
+
+
+@pytest.mark.parametrize("value", [None, {"a": []}, {1: [None]}, {-1: []}])
+def test_encode_nok(value):
+    with pytest.raises((TypeError, ValueError)):
+        codec.encode(value)
+
+
+def test_encode_requests_nok():
+    with pytest.raises(TypeError):
+        codec.encode_requests(tuple(_create_request_lst(1)))
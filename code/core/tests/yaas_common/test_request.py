@@ -9,6 +9,17 @@ from yaas_common import request
 _TEST_SCALE_REQUEST: request.ScaleRequest = common.create_scale_request(original_json_event="TEST_ORIGINAL_JSON_EVENT")
 
 
+class TestScaleRequest:
+    def test_content_hash_ok(self):
+        # Given
+        same = request.ScaleRequest.from_json(_TEST_SCALE_REQUEST.as_json())
+        other = _TEST_SCALE_REQUEST.clone(original_json_event=None)
+        # When/Then
+        assert _TEST_SCALE_REQUEST.content_hash() == same.content_hash()
+        assert _TEST_SCALE_REQUEST.content_hash() != other.content_hash()
+        assert len(_TEST_SCALE_REQUEST.content_hash()) == 64
+
+
 class TestScaleRequestCollection:
     @pytest.mark.parametrize("remove_original_json_event", [True, False])
     def test_from_lst_ok(self, remove_original_json_event: bool):
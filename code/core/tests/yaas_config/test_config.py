@@ -20,10 +20,23 @@ _TEST_CACHE_LOCAL_JSON: config.LocalJsonLineCacheConfig = config.LocalJsonLineCa
 _TEST_CACHE_LOCAL_SQLITE: config.LocalSqliteCacheConfig = config.LocalSqliteCacheConfig(
     type=config.CacheType.LOCAL_SQLITE.value,
     sqlite_file=tempfile.NamedTemporaryFile().name,
+    performance_config=config.SqlitePerformanceConfig(journal_mode="delete", page_size=8192),
 )
 _TEST_CACHE_GCS_SQLITE: config.GcsCacheConfig = config.GcsCacheConfig(
     type=config.CacheType.GCS_SQLITE.value, bucket_name="test-bucket-name"
 )
+_TEST_CACHE_GCS_SQLITE_SHARDED: config.GcsShardedCacheConfig = config.GcsShardedCacheConfig(
+    type=config.CacheType.GCS_SQLITE_SHARDED.value, bucket_name="test-bucket-name"
+)
+_TEST_CACHE_MEMORY: config.MemoryCacheConfig = config.MemoryCacheConfig(type=config.CacheType.MEMORY.value)
+_TEST_CACHE_TIERED: config.TieredCacheConfig = config.TieredCacheConfig(
+    type=config.CacheType.TIERED.value, durable_cache_config=_TEST_CACHE_GCS_SQLITE, ttl_in_sec=10
+)
+_TEST_CACHE_COLD_ARCHIVE: config.ColdArchiveCacheConfig = config.ColdArchiveCacheConfig(
+    type=config.CacheType.COLD_ARCHIVE.value,
+    hot_cache_config=_TEST_CACHE_GCS_SQLITE,
+    archive_location="gs://test-bucket-name/cache/event_cache_archive",
+)
 # pylint: enable=consider-using-with
 
 
@@ -46,6 +59,10 @@ class TestCacheConfig:
             _TEST_CACHE_LOCAL_JSON,
             _TEST_CACHE_LOCAL_SQLITE,
             _TEST_CACHE_GCS_SQLITE,
+            _TEST_CACHE_GCS_SQLITE_SHARDED,
+            _TEST_CACHE_MEMORY,
+            _TEST_CACHE_TIERED,
+            _TEST_CACHE_COLD_ARCHIVE,
         ],
     )
     def test_from_json_ok(self, value: config.CacheConfig):
@@ -60,6 +77,10 @@ class TestCacheConfig:
             (_TEST_CACHE_LOCAL_JSON, _TEST_CACHE_LOCAL_SQLITE.type),
             (_TEST_CACHE_LOCAL_SQLITE, _TEST_CACHE_LOCAL_JSON.type),
             (_TEST_CACHE_GCS_SQLITE, _TEST_CACHE_LOCAL_SQLITE.type),
+            (_TEST_CACHE_GCS_SQLITE_SHARDED, _TEST_CACHE_LOCAL_SQLITE.type),
+            (_TEST_CACHE_MEMORY, _TEST_CACHE_LOCAL_SQLITE.type),
+            (_TEST_CACHE_TIERED, _TEST_CACHE_LOCAL_SQLITE.type),
+            (_TEST_CACHE_COLD_ARCHIVE, _TEST_CACHE_LOCAL_SQLITE.type),
         ],
     )
     def test_from_json_nok_value_error(self, value: config.CacheConfig, type_arg: str):
@@ -72,6 +93,10 @@ class TestCacheConfig:
             _TEST_CACHE_LOCAL_JSON,
             _TEST_CACHE_LOCAL_SQLITE,
             _TEST_CACHE_GCS_SQLITE,
+            _TEST_CACHE_GCS_SQLITE_SHARDED,
+            _TEST_CACHE_MEMORY,
+            _TEST_CACHE_TIERED,
+            _TEST_CACHE_COLD_ARCHIVE,
         ],
     )
     def test_from_json_nok_non_existent_type(self, value: config.CacheConfig):
@@ -79,6 +104,85 @@ class TestCacheConfig:
             config.CacheConfig.from_json(value.as_json().replace(value.type, value.type + "_NOT"))
 
 
+class TestTieredCacheConfig:
+    @pytest.mark.parametrize(
+        "durable_cache_config",
+        [_TEST_CACHE_MEMORY, _TEST_CACHE_TIERED, common.TEST_CONFIG_LOCAL_JSON.calendar_config, None],
+    )
+    def test_ctor_nok(self, durable_cache_config: config.CacheConfig):
+        with pytest.raises((TypeError, ValueError)):
+            config.TieredCacheConfig(type=config.CacheType.TIERED.value, durable_cache_config=durable_cache_config)
+
+
+class TestColdArchiveCacheConfig:
+    @pytest.mark.parametrize(
+        "hot_cache_config,archive_location",
+        [
+            (_TEST_CACHE_MEMORY, "/tmp/archive"),
+            (_TEST_CACHE_COLD_ARCHIVE, "/tmp/archive"),
+            (common.TEST_CONFIG_LOCAL_JSON.calendar_config, "/tmp/archive"),
+            (None, "/tmp/archive"),
+            (_TEST_CACHE_GCS_SQLITE, ""),
+            (_TEST_CACHE_GCS_SQLITE, "gs://test-bucket-name"),
+            (_TEST_CACHE_GCS_SQLITE, None),
+        ],
+    )
+    def test_ctor_nok(self, hot_cache_config: config.CacheConfig, archive_location: str):
+        with pytest.raises((TypeError, ValueError)):
+            config.ColdArchiveCacheConfig(
+                type=config.CacheType.COLD_ARCHIVE.value,
+                hot_cache_config=hot_cache_config,
+                archive_location=archive_location,
+            )
+
+
+class TestSqlitePerformanceConfig:
+    def test_ctor_ok_defaults(self):
+        # Given/When
+        obj = config.SqlitePerformanceConfig(journal_mode=None, synchronous="full")
+        # Then
+        assert obj.journal_mode == config.DEFAULT_SQLITE_JOURNAL_MODE
+        assert obj.synchronous == "FULL"
+        assert obj.page_size == config.DEFAULT_SQLITE_PAGE_SIZE
+        assert obj.vacuum_free_page_ratio == config.DEFAULT_SQLITE_VACUUM_FREE_PAGE_RATIO
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            dict(journal_mode="NOT_A_MODE"),
+            dict(synchronous="NOT_A_LEVEL"),
+            dict(page_size=256),
+            dict(page_size=5000),
+            dict(page_size=131072),
+            dict(cache_size_in_kib=-1),
+            dict(vacuum_free_page_ratio=0),
+            dict(vacuum_free_page_ratio=1.5),
+        ],
+    )
+    def test_ctor_nok(self, kwargs):
+        with pytest.raises((TypeError, ValueError)):
+            config.SqlitePerformanceConfig(**kwargs)
+
+
+@pytest.mark.parametrize(
+    "config_cls,type_arg",
+    [
+        (config.GcsCacheConfig, config.CacheType.GCS_SQLITE.value),
+        (config.GcsShardedCacheConfig, config.CacheType.GCS_SQLITE_SHARDED.value),
+    ],
+)
+class TestGcsCacheConfigCompression:
+    def test_ctor_ok(self, config_cls: type, type_arg: str):
+        # Given/When
+        obj = config_cls(type=type_arg, bucket_name="test-bucket-name", compression=None)
+        # Then
+        assert obj.compression == config.CacheCompression.default().value
+
+    def test_ctor_nok(self, config_cls: type, type_arg: str):
+        with pytest.raises(ValueError):
+            config_cls(type=type_arg, bucket_name="test-bucket-name", compression="NOT_A_COMPRESSION")
+
+
 class TestConfig:
     def test_from_json_ok(self):
         # Given
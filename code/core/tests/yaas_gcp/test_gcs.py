@@ -4,6 +4,7 @@
 from typing import Any, Iterable, List, Optional
 
 import pytest
+from google.api_core import exceptions
 
 from yaas_common import const
 from yaas_gcp import gcs
@@ -11,6 +12,8 @@ from yaas_gcp import gcs
 _TEST_BUCKET_NAME: str = "test_bucket_name"
 _TEST_PATH: str = "path/to/object"
 _TEST_CONTENT: bytes = bytes("EXPECTED", encoding=const.ENCODING_UTF8)
+_TEST_GENERATION: int = 1234567890
+_TEST_MISMATCHED_GENERATION: int = 987654321
 
 
 @pytest.mark.parametrize(
@@ -98,23 +101,29 @@ class _MyBlob:
         content: Optional[bytes] = _TEST_CONTENT,
         exists: Optional[bool] = True,
         name: Optional[str] = None,
+        generation: Optional[int] = None,
     ):
         self._content = content
         self._exists = exists
         self.called = {}
         self.name = name
+        self.generation = generation
+        self.content_encoding = None
 
-    def download_as_bytes(self) -> bytes:
-        self.called[_MyBlob.download_as_bytes.__name__] = True
+    def download_as_bytes(self, raw_download: bool = False) -> bytes:
+        self.called[_MyBlob.download_as_bytes.__name__] = dict(raw_download=raw_download)
         return self._content
 
     def exists(self) -> bool:
         self.called[_MyBlob.exists.__name__] = True
         return self._exists
 
-    def open(self, mode: str) -> _MyBlobWriter:
+    def open(self, mode: str, **kwargs) -> _MyBlobWriter:
         result = _MyBlobWriter()
         self.called[_MyBlob.open.__name__] = mode, result
+        self.called[_MyBlobWriter.__name__] = kwargs
+        if kwargs.get("if_generation_match") == _TEST_MISMATCHED_GENERATION:
+            raise exceptions.PreconditionFailed("mismatched generation")
         return result
 
 
@@ -123,18 +132,35 @@ class _MyBucket:
         self._content = content
         self.called = {}
 
-    def blob(self, path: str) -> _MyBlob:
-        result = _MyBlob(self._content, self._content is not None)
+    def blob(self, path: str, generation: Optional[int] = None) -> _MyBlob:
+        result = _MyBlob(self._content, self._content is not None, generation=generation)
         self.called[_MyBucket.blob.__name__] = path, result
         return result
 
+    def delete_blob(self, path: str, if_generation_match: Optional[int] = None) -> None:
+        self.called[_MyBucket.delete_blob.__name__] = path
+        if if_generation_match == _TEST_MISMATCHED_GENERATION:
+            raise exceptions.PreconditionFailed(path)
+        if self._content is None:
+            raise exceptions.NotFound(path)
+
+    def get_blob(self, path: str) -> Optional[_MyBlob]:
+        result = _MyBlob(self._content, generation=_TEST_GENERATION) if self._content is not None else None
+        self.called[_MyBucket.get_blob.__name__] = path, result
+        return result
+
 
 class _MyClient:
-    def __init__(self, project: Optional[str] = None, content: List[str] = None):
+    def __init__(self, project: Optional[str] = None, content: List[str] = None, bucket: Optional[_MyBucket] = None):
         self.project = project
         self._content = content if content else []
+        self._bucket = bucket
         self.called = {}
 
+    def bucket(self, bucket_name: str) -> _MyBucket:
+        self.called[_MyClient.bucket.__name__] = bucket_name
+        return self._bucket
+
     def list_blobs(  # pylint: disable=unused-argument
         self, bucket_name: str, *, prefix: Optional[str] = None
     ) -> Iterable[_MyBlob]:
@@ -188,17 +214,23 @@ def test_read_object_ok(monkeypatch, expected: bytes):
 
     monkeypatch.setattr(gcs, gcs._bucket.__name__, mocked_bucket)
     # When
-    result = gcs.read_object(bucket_name=_TEST_BUCKET_NAME, object_path=_TEST_PATH)
+    result = gcs.read_object(
+        bucket_name=_TEST_BUCKET_NAME, object_path=_TEST_PATH, generation=_TEST_GENERATION, raw_download=True
+    )
     # Then
     assert result == expected
     assert called.get(gcs._bucket.__name__) == _TEST_BUCKET_NAME
     path, blob = bucket.called.get(_MyBucket.blob.__name__)
     assert path == _TEST_PATH
+    assert blob.generation == _TEST_GENERATION
     assert blob.called.get(_MyBlob.exists.__name__)
     assert bool(blob.called.get(_MyBlob.download_as_bytes.__name__)) == bool(expected is not None)
+    if expected is not None:
+        assert blob.called.get(_MyBlob.download_as_bytes.__name__).get("raw_download")
 
 
-def test_write_object_ok(monkeypatch):
+@pytest.mark.parametrize("if_generation_match,content_encoding", [(None, None), (0, "gzip"), (_TEST_GENERATION, None)])
+def test_write_object_ok(monkeypatch, if_generation_match: Optional[int], content_encoding: Optional[str]):
     # Given
     bucket = _MyBucket()
     called = {}
@@ -210,17 +242,101 @@ def test_write_object_ok(monkeypatch):
 
     monkeypatch.setattr(gcs, gcs._bucket.__name__, mocked_bucket)
     # When
-    gcs.write_object(
+    result = gcs.write_object(
         bucket_name=_TEST_BUCKET_NAME,
         object_path=_TEST_PATH,
         content_source=_TEST_CONTENT,
+        if_generation_match=if_generation_match,
+        content_encoding=content_encoding,
     )
     # Then
+    assert result is None
     assert called.get(gcs._bucket.__name__) == _TEST_BUCKET_NAME
     path, blob = bucket.called.get(_MyBucket.blob.__name__)
     assert path == _TEST_PATH
+    assert blob.content_encoding == content_encoding
     mode, writer = blob.called.get(_MyBlob.open.__name__)
     assert mode == "wb"
     assert writer.called.get(_MyBlobWriter.write.__name__) == _TEST_CONTENT
     assert writer.called.get(_MyBlobWriter.__enter__.__name__)
     assert writer.called.get(_MyBlobWriter.__exit__.__name__)
+    assert blob.called.get(_MyBlobWriter.__name__).get("if_generation_match") == if_generation_match
+
+
+def test_write_object_nok_precondition_failed(monkeypatch):
+    # Given
+    bucket = _MyBucket()
+    monkeypatch.setattr(gcs, gcs._bucket.__name__, lambda *args, **kwargs: bucket)
+    # When/Then
+    with pytest.raises(gcs.PreconditionFailedError):
+        gcs.write_object(
+            bucket_name=_TEST_BUCKET_NAME,
+            object_path=_TEST_PATH,
+            content_source=_TEST_CONTENT,
+            if_generation_match=_TEST_MISMATCHED_GENERATION,
+        )
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        None,
+        _TEST_CONTENT,
+    ],
+)
+def test_read_object_metadata_ok(monkeypatch, content: bytes):
+    # Given
+    bucket = _MyBucket(content)
+    client = _MyClient(bucket=bucket)
+
+    def mocked_client(project: Optional[str] = None) -> _MyClient:  # pylint: disable=unused-argument
+        return client
+
+    monkeypatch.setattr(gcs, gcs._client.__name__, mocked_client)
+    # When
+    result = gcs.read_object_metadata(bucket_name=_TEST_BUCKET_NAME, object_path=_TEST_PATH)
+    # Then
+    assert client.called.get(_MyClient.bucket.__name__) == _TEST_BUCKET_NAME
+    path, blob = bucket.called.get(_MyBucket.get_blob.__name__)
+    assert path == _TEST_PATH
+    assert result == blob
+    if content is None:
+        assert result is None
+    else:
+        assert result.generation == _TEST_GENERATION
+        assert not result.called.get(_MyBlob.download_as_bytes.__name__)
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        None,
+        _TEST_CONTENT,
+    ],
+)
+def test_delete_object_ok(monkeypatch, content: bytes):
+    # Given
+    bucket = _MyBucket(content)
+    client = _MyClient(bucket=bucket)
+
+    def mocked_client(project: Optional[str] = None) -> _MyClient:  # pylint: disable=unused-argument
+        return client
+
+    monkeypatch.setattr(gcs, gcs._client.__name__, mocked_client)
+    # When
+    result = gcs.delete_object(bucket_name=_TEST_BUCKET_NAME, object_path=_TEST_PATH)
+    # Then
+    assert result == (content is not None)
+    assert client.called.get(_MyClient.bucket.__name__) == _TEST_BUCKET_NAME
+    assert bucket.called.get(_MyBucket.delete_blob.__name__) == _TEST_PATH
+
+
+def test_delete_object_nok_precondition_failed(monkeypatch):
+    # Given
+    client = _MyClient(bucket=_MyBucket())
+    monkeypatch.setattr(gcs, gcs._client.__name__, lambda *args, **kwargs: client)
+    # When/Then
+    with pytest.raises(gcs.PreconditionFailedError):
+        gcs.delete_object(
+            bucket_name=_TEST_BUCKET_NAME, object_path=_TEST_PATH, if_generation_match=_TEST_MISMATCHED_GENERATION
+        )
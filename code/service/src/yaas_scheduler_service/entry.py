@@ -1,12 +1,12 @@
 # vim: ai:sw=4:ts=4:sta:et:fo=croql
 """Main entry-points."""
 from datetime import datetime
-from typing import Callable, Optional, Tuple
+from typing import AsyncIterator, Callable, List, Optional
 
-from yaas_caching import base, event, factory, version_control
+from yaas_caching import base, dispatch, event, factory, registry, version_control
 from yaas_calendar import google_cal
 from yaas_command import pubsub_dispatcher
-from yaas_common import command, logger
+from yaas_common import command, logger, request
 from yaas_config import config
 
 _LOGGER = logger.get(__name__)
@@ -85,6 +85,8 @@ async def update_cache(
     specified and store in the cache, also specified in ``configuration``. On
     merge, calendar snapshot is always snapshot ``A``.
 
+    The cache is read, merged into, and cleaned-up within a single store session.
+
     Args:
         start_ts_utc: start
         end_ts_utc: end
@@ -97,43 +99,80 @@ async def update_cache(
     _validate_configuration(configuration)
     if merge_strategy is None:
         merge_strategy = _merge_strategy_always_a
-    # logic: snapshots
+    # logic: calendar snapshot
     calendar_snapshot = await _calendar_snapshot(
         calendar_config=configuration.calendar_config,
         start_ts_utc=start_ts_utc,
         end_ts_utc=end_ts_utc,
     )
-    cache_store, cache_snapshot = await _cache_store_and_snapshot(
-        cache_config=configuration.cache_config,
-        start_ts_utc=start_ts_utc,
-        end_ts_utc=end_ts_utc,
-    )
-    # logic: merge
-    is_required, merged_snapshot = version_control.merge(
-        snapshot_a=calendar_snapshot,
-        snapshot_b=cache_snapshot,
-        merge_strategy=merge_strategy,
-    )
-    _LOGGER.info(
-        "Merged snapshots using '%s'. Merge required: %s. Range '%s' and amount of requests: '%s'",
-        merge_strategy,
-        is_required,
-        str(merged_snapshot.range() if merged_snapshot else None),
-        str(merged_snapshot.amount_requests() if merged_snapshot else None),
-    )
-    async with cache_store as obj:
-        # logic: overwrite cache
+    # logic: read, merge, write, and clean-up within a single store session
+    async with _cache_store(configuration.cache_config) as obj:
+        cache_snapshot = await _cache_snapshot(
+            cache_store=obj,
+            start_ts_utc=start_ts_utc,
+            end_ts_utc=end_ts_utc,
+        )
+        # logic: merge
+        is_required, merged_snapshot = version_control.merge(
+            snapshot_a=calendar_snapshot,
+            snapshot_b=cache_snapshot,
+            merge_strategy=merge_strategy,
+        )
+        _LOGGER.info(
+            "Merged snapshots using '%s'. Merge required: %s. Range '%s' and amount of requests: '%s'",
+            merge_strategy,
+            is_required,
+            str(merged_snapshot.range() if merged_snapshot else None),
+            str(merged_snapshot.amount_requests() if merged_snapshot else None),
+        )
+        # logic: apply only what changed
         if is_required:
-            await obj.write(merged_snapshot, overwrite_within_range=True)
-            _LOGGER.info("Wrote merged snapshot with overwrite. Store: %s", cache_store.source)
+            snapshot_diff = version_control.diff(current=cache_snapshot, target=merged_snapshot)
+            await obj.apply(snapshot_diff)
+            _LOGGER.info(
+                "Applied merged snapshot, added '%d' and removed '%d' requests. Store: %s",
+                len(snapshot_diff.requests_to_add()),
+                len(snapshot_diff.requests_to_remove()),
+                obj.source,
+            )
         # logic: clean-up
         archived, removed = await obj.clean_up(configuration.retention_config)
         _LOGGER.info(
             "Clean-up on %s archived '%s' and removed '%s'",
-            cache_store.source,
+            obj.source,
             archived,
             removed,
         )
+        # logic: dispatch index
+        await _update_dispatch_index(cache_store=obj, cache_config=configuration.cache_config)
+
+
+async def _update_dispatch_index(*, cache_store: base.StoreContextManager, cache_config: config.CacheConfig) -> None:
+    """Writes the requests for the next :py:data:`dispatch.DEFAULT_DISPATCH_INDEX_PERIOD_IN_SEC` into the index,
+    see :py:func:`send_requests`. On failure the index is removed, so an outdated one is never used."""
+    if dispatch.index_location(cache_config) is None:
+        return
+    # a single reading of the clock, for both the range and the creation
+    start_ts_utc = int(datetime.utcnow().timestamp())
+    end_ts_utc = start_ts_utc + dispatch.DEFAULT_DISPATCH_INDEX_PERIOD_IN_SEC
+    try:
+        # changes are flushed before reading the version, so they are part of it,
+        # and the store is re-synchronized after, so the version can only be older than the content, never newer
+        await cache_store.flush()
+        cache_version = await dispatch.cache_version(cache_config)
+        await cache_store.refresh()
+        snapshot = await cache_store.read(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc)
+        index = dispatch.DispatchIndex.from_snapshot(
+            snapshot,
+            start_ts_utc=start_ts_utc,
+            end_ts_utc=end_ts_utc,
+            created_ts_utc=start_ts_utc,
+            cache_version=cache_version,
+        )
+        await dispatch.write_index(index, cache_config=cache_config)
+    except Exception as err:  # pylint: disable=broad-except
+        _LOGGER.warning("Could not update dispatch index for '%s', removing it. Error: %s", cache_config, err)
+        await dispatch.remove_index(cache_config)
 
 
 def _validate_configuration(value: config.Config) -> None:
@@ -156,30 +195,33 @@ async def _calendar_snapshot(
     return result
 
 
-async def _cache_store_and_snapshot(
+def _cache_store(cache_config: config.CacheConfig) -> registry.StoreLease:
+    """The store is leased from :py:func:`registry.default`, so it is kept opened across requests."""
+    return registry.default().lease(cache_config)
+
+
+async def _cache_snapshot(
     *,
-    cache_config: config.CacheConfig,
+    cache_store: base.StoreContextManager,
     start_ts_utc: int,
     end_ts_utc: int,
-) -> Tuple[base.StoreContextManager, event.EventSnapshot]:
+) -> event.EventSnapshot:
     _LOGGER.info(
         "Reading range [%d, %d] (%s, %s) from cache '%s'",
         start_ts_utc,
         end_ts_utc,
         datetime.fromtimestamp(start_ts_utc),
         datetime.fromtimestamp(end_ts_utc),
-        cache_config,
+        cache_store.source,
     )
-    cache_store = factory.store_from_cache_config(cache_config)
-    async with cache_store as obj:
-        result = await obj.read(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc)
+    result = await cache_store.read(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc)
     _LOGGER.info(
         "Got snapshot from '%s'. Retrieved range '%s' and amount of requests retrieved: '%d'",
-        cache_config,
+        cache_store.source,
         result.range(),
         result.amount_requests(),
     )
-    return cache_store, result
+    return result
 
 
 async def send_requests(
@@ -203,18 +245,43 @@ async def send_requests(
     _LOGGER.debug("Starting %s with %s", send_requests.__name__, locals())
     # validate input
     _validate_configuration(configuration)
-    # logic: snapshot
-    _, cache_snapshot = await _cache_store_and_snapshot(
-        cache_config=configuration.cache_config,
-        start_ts_utc=start_ts_utc,
-        end_ts_utc=end_ts_utc,
-    )
-    if cache_snapshot.amount_requests():
-        # logic: send
+    # logic: send, from the dispatch index, if up-to-date, else in batches from the cache store
+    amount_requests = 0
+    async for batch in _requests_to_send(
+        start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, cache_config=configuration.cache_config
+    ):
+        amount_requests += len(batch)
         await pubsub_dispatcher.dispatch(
             configuration.topic_to_pubsub,
-            *cache_snapshot.all_requests(),
+            *batch,
             raise_if_invalid_request=raise_if_invalid_request,
         )
+    if amount_requests:
+        _LOGGER.info("Dispatched %d requests from '%s'", amount_requests, configuration.cache_config)
+    else:
+        _LOGGER.debug("There are no requests to dispatch in range [%d, %d]", start_ts_utc, end_ts_utc)
+
+
+async def _requests_to_send(
+    *, start_ts_utc: int, end_ts_utc: int, cache_config: config.CacheConfig
+) -> AsyncIterator[List[request.ScaleRequest]]:
+    index = None
+    try:
+        index = await dispatch.read_index(cache_config)
+        if index is not None and index.is_stale(
+            start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc, cache_version=await dispatch.cache_version(cache_config)
+        ):
+            index = None
+    except Exception as err:  # pylint: disable=broad-except
+        _LOGGER.warning("Could not read dispatch index for '%s', using the cache. Error: %s", cache_config, err)
+        index = None
+    if index is not None:
+        request_lst = index.requests(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc)
+        _LOGGER.debug("Got %d requests from the dispatch index for '%s'", len(request_lst), cache_config)
+        for ndx in range(0, len(request_lst), base.DEFAULT_READ_BATCH_SIZE):
+            yield request_lst[ndx : ndx + base.DEFAULT_READ_BATCH_SIZE]
     else:
-        _LOGGER.debug("There are no requests to dispatch in snapshot: %s", cache_snapshot)
+        # without reading the whole range at once
+        async with _cache_store(cache_config) as obj:
+            async for batch in obj.read_iter(start_ts_utc=start_ts_utc, end_ts_utc=end_ts_utc):
+                yield batch
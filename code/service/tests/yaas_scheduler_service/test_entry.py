@@ -2,11 +2,15 @@
 # pylint: disable=missing-module-docstring,protected-access,invalid-name,duplicate-code
 # type: ignore
 import pathlib
+import tempfile
+import types
+from datetime import datetime
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
+import attrs
 import flask
 import pytest
-from yaas_caching import base, event
+from yaas_caching import base, dispatch, event, gcs, registry
 from yaas_common import request
 from yaas_config import config
 
@@ -17,6 +21,7 @@ _TEST_REQUEST: request.ScaleRequest = common.create_scale_request()
 _TEST_TOPIC_TO_PUBSUB: Dict[str, str] = {_TEST_REQUEST.topic: "test_pubsub_topic"}
 _TEST_START_TS_UTC: int = 100
 _TEST_END_TS_UTC: int = _TEST_START_TS_UTC + 1000
+_TEST_DISPATCH_NAME: str = entry.pubsub_dispatcher.dispatch.__name__
 
 
 @pytest.mark.asyncio
@@ -165,17 +170,24 @@ def _mock_entry(  # pylint: disable=too-complex
         called[entry._calendar_snapshot.__name__] = locals()
         return calendar_snapshot
 
-    async def mocked_cache_store_and_snapshot(  # pylint: disable=unused-argument
-        *,
+    def mocked_cache_store(
         cache_config: config.CacheConfig,
+    ) -> base.StoreContextManager:  # pylint: disable=unused-argument
+        nonlocal called, cache_store
+        called[entry._cache_store.__name__] = locals()
+        return cache_store
+
+    async def mocked_cache_snapshot(  # pylint: disable=unused-argument
+        *,
+        cache_store: base.StoreContextManager,
         start_ts_utc: int,
         end_ts_utc: int,
-    ) -> Tuple[base.StoreContextManager, event.EventSnapshot]:
-        nonlocal called, cache_snapshot, cache_store
+    ) -> event.EventSnapshot:
+        nonlocal called, cache_snapshot
         if cache_snapshot is None:
             cache_snapshot = common.create_event_snapshot("cache")
-        called[entry._cache_store_and_snapshot.__name__] = locals()
-        return cache_store, cache_snapshot
+        called[entry._cache_snapshot.__name__] = locals()
+        return cache_snapshot
 
     async def mocked_dispatch(  # pylint: disable=unused-argument
         topic_to_pubsub: Dict[str, str],
@@ -203,7 +215,8 @@ def _mock_entry(  # pylint: disable=too-complex
     )
     monkeypatch.setattr(cache_store, cache_store.clean_up.__name__, mocked_clean_up)
     monkeypatch.setattr(entry, entry._calendar_snapshot.__name__, mocked_calendar_snapshot)
-    monkeypatch.setattr(entry, entry._cache_store_and_snapshot.__name__, mocked_cache_store_and_snapshot)
+    monkeypatch.setattr(entry, entry._cache_store.__name__, mocked_cache_store)
+    monkeypatch.setattr(entry, entry._cache_snapshot.__name__, mocked_cache_snapshot)
     monkeypatch.setattr(
         entry.pubsub_dispatcher,
         entry.pubsub_dispatcher.dispatch.__name__,
@@ -246,17 +259,18 @@ async def _verify_update_cal_cache_called(
 ) -> None:
     # Then: calendar
     _verify_calendar_snapshot_called(called.get(entry._calendar_snapshot.__name__), kwargs)
-    # Then: cache
-    called_cache_snapshot = called.get(entry._cache_store_and_snapshot.__name__)
-    _verify_cache_snapshot_called(called_cache_snapshot, kwargs)
-    assert bool(called_cache_snapshot.get("cache_store").called.get(base.StoreContextManager.write.__name__)) == bool(
-        expected_cache_store is not None
-    )
-    assert called_cache_snapshot.get("cache_store").called.get(base.StoreContextManager.clean_up.__name__)
+    # Then: cache, single session
+    assert called.get(entry._cache_store.__name__).get("cache_config") == kwargs["configuration"].cache_config
+    called_cache_snapshot = called.get(entry._cache_snapshot.__name__)
+    assert called_cache_snapshot.get("start_ts_utc") == kwargs["start_ts_utc"]
+    assert called_cache_snapshot.get("end_ts_utc") == kwargs["end_ts_utc"]
+    store_called = called_cache_snapshot.get("cache_store").called
+    assert store_called.get(base.StoreContextManager._open.__name__)
+    assert store_called.get(base.StoreContextManager._close.__name__)
+    assert bool(store_called.get(base.StoreContextManager.write.__name__)) == bool(expected_cache_store is not None)
+    assert store_called.get(base.StoreContextManager.clean_up.__name__)
     if expected_cache_store is not None:
         # Then: store
-        store_called = called_cache_snapshot.get("cache_store").called
-        assert isinstance(store_called, dict)
         assert store_called.get(base.StoreContextManager.write.__name__).get("value") == expected_cache_store
         assert (
             store_called.get(base.StoreContextManager.clean_up.__name__).get("value")
@@ -298,6 +312,31 @@ async def test_update_cache_ok(monkeypatch):
     await _verify_update_cal_cache_called(called, kwargs, expected)
 
 
+@pytest.mark.asyncio
+async def test_update_cache_ok_applies_only_changes(monkeypatch):
+    # Given
+    calendar_snapshot = common.create_event_snapshot("calendar", [_TEST_START_TS_UTC + 1, _TEST_START_TS_UTC + 3])
+    kept = calendar_snapshot.timestamp_to_request.get(_TEST_START_TS_UTC + 1)
+    removed = common.create_event_snapshot("cache", [_TEST_START_TS_UTC + 2]).all_requests()
+    cache_snapshot = event.EventSnapshot.from_list_requests(source="cache", request_lst=kept + removed)
+    cache_store = common.MyStoreContextManager()
+    _mock_entry(
+        monkeypatch, calendar_snapshot=calendar_snapshot, cache_store=cache_store, cache_snapshot=cache_snapshot
+    )
+    kwargs = dict(
+        start_ts_utc=_TEST_START_TS_UTC,
+        end_ts_utc=_TEST_END_TS_UTC,
+        configuration=common.TEST_CONFIG_LOCAL_JSON,
+    )
+    # When
+    await entry.update_cache(**kwargs)
+    # Then
+    assert cache_store.called.get(base.StoreContextManager.apply.__name__).get("value") == removed
+    written = cache_store.called.get(base.StoreContextManager.write.__name__).get("value")
+    assert written.all_requests() == calendar_snapshot.timestamp_to_request.get(_TEST_START_TS_UTC + 3)
+    assert base.StoreContextManager.remove.__name__ not in cache_store.called
+
+
 @pytest.mark.asyncio
 async def test_send_requests_ok_empty(monkeypatch):
     # Given
@@ -310,30 +349,265 @@ async def test_send_requests_ok_empty(monkeypatch):
     # When
     await entry.send_requests(**kwargs)
     # Then: cache
-    called_calendar_snapshot = called.get(entry._cache_store_and_snapshot.__name__)
-    _verify_cache_snapshot_called(called_calendar_snapshot, kwargs)
-    assert not called_calendar_snapshot.get("cache_store").called
+    _verify_send_requests_cache_called(called, kwargs)
     # Then: dispatch
     called_dispatch = called.get(entry.pubsub_dispatcher.dispatch.__name__)
     assert not called_dispatch
 
 
+def _verify_send_requests_cache_called(called: Dict[str, Any], kwargs: Dict[str, Any]) -> None:
+    called_cache_store = called.get(entry._cache_store.__name__)
+    assert called_cache_store.get("cache_config") == kwargs["configuration"].cache_config
+    store_called = called_cache_store.get("cache_store").called
+    assert store_called.get(base.StoreContextManager.read.__name__).get("start_ts_utc") == kwargs["start_ts_utc"]
+    assert store_called.get(base.StoreContextManager.read.__name__).get("end_ts_utc") == kwargs["end_ts_utc"]
+    assert not store_called.get(base.StoreContextManager.write.__name__)
+    assert not store_called.get(base.StoreContextManager.clean_up.__name__)
+
+
+@pytest.mark.parametrize("amount", [1, entry.base.DEFAULT_READ_BATCH_SIZE + 1])
 @pytest.mark.asyncio
-async def test_send_requests_ok(monkeypatch):
+async def test_send_requests_ok(monkeypatch, amount: int):
     # Given
-    expected = common.create_event_snapshot("calendar", [_TEST_START_TS_UTC + 1])
-    called = _mock_entry(monkeypatch, cache_snapshot=expected)
+    expected = common.create_event_snapshot("calendar", [_TEST_START_TS_UTC + 1 + ndx for ndx in range(amount)])
+    cache_store = common.MyStoreContextManager(result_snapshot=expected)
+    dispatched = []
+    called = _mock_entry(monkeypatch, cache_store=cache_store)
+
+    async def mocked_dispatch(  # pylint: disable=unused-argument
+        topic_to_pubsub: Dict[str, str],
+        *value: request.ScaleRequest,
+        raise_if_invalid_request: Optional[bool] = True,
+    ) -> None:
+        assert len(value) <= entry.base.DEFAULT_READ_BATCH_SIZE
+        dispatched.extend(value)
+
+    monkeypatch.setattr(entry.pubsub_dispatcher, _TEST_DISPATCH_NAME, mocked_dispatch)
     kwargs = dict(
         start_ts_utc=_TEST_START_TS_UTC,
-        end_ts_utc=_TEST_END_TS_UTC,
+        end_ts_utc=_TEST_END_TS_UTC + amount,
         configuration=common.TEST_CONFIG_LOCAL_JSON,
     )
     # When
     await entry.send_requests(**kwargs)
     # Then: cache
-    called_calendar_snapshot = called.get(entry._cache_store_and_snapshot.__name__)
-    _verify_cache_snapshot_called(called_calendar_snapshot, kwargs)
-    assert not called_calendar_snapshot.get("cache_store").called
+    _verify_send_requests_cache_called(called, kwargs)
     # Then: dispatch
-    called_dispatch = called.get(entry.pubsub_dispatcher.dispatch.__name__)
-    assert list(called_dispatch.get("value")) == expected.all_requests()
+    assert dispatched == expected.all_requests()
+
+
+def _create_config_with_tmp_cache() -> config.Config:
+    return attrs.evolve(
+        common.TEST_CONFIG_LOCAL_JSON,
+        cache_config=config.LocalJsonLineCacheConfig(
+            type=config.CacheType.LOCAL_JSON_LINE.value,
+            json_line_file=tempfile.NamedTemporaryFile().name,  # pylint: disable=consider-using-with
+            archive_json_line_file=tempfile.NamedTemporaryFile().name,  # pylint: disable=consider-using-with
+        ),
+    )
+
+
+@pytest.mark.asyncio
+async def test_update_cache_ok_writes_dispatch_index(monkeypatch):
+    # Given
+    now = int(datetime.utcnow().timestamp())
+    configuration = _create_config_with_tmp_cache()
+    cached = common.create_event_snapshot("cache", [now + 60, now + dispatch.DEFAULT_DISPATCH_INDEX_PERIOD_IN_SEC * 2])
+    _mock_entry(monkeypatch, cache_store=common.MyStoreContextManager(result_snapshot=cached))
+    # When
+    await entry.update_cache(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC, configuration=configuration)
+    # Then
+    result = await dispatch.read_index(configuration.cache_config)
+    assert not result.is_stale(
+        start_ts_utc=now + 60,
+        end_ts_utc=now + 120,
+        cache_version=await dispatch.cache_version(configuration.cache_config),
+    )
+    assert result.created_ts_utc == result.start_ts_utc
+    assert result.requests(start_ts_utc=now, end_ts_utc=now + 120) == cached.timestamp_to_request.get(now + 60)
+    assert result.bucket_to_request.amount_requests() == 1
+
+
+@pytest.mark.asyncio
+async def test_update_cache_ok_removes_dispatch_index_on_failure(monkeypatch):
+    # Given
+    configuration = _create_config_with_tmp_cache()
+    _mock_entry(monkeypatch)
+    location = dispatch.index_location(configuration.cache_config)
+    location.write_bytes(b"outdated")
+
+    async def mocked_write_index(*args, **kwargs) -> bool:  # pylint: disable=unused-argument
+        raise RuntimeError
+
+    monkeypatch.setattr(entry.dispatch, dispatch.write_index.__name__, mocked_write_index)
+    # When
+    await entry.update_cache(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC, configuration=configuration)
+    # Then
+    assert not location.exists()
+
+
+@pytest.mark.asyncio
+async def test_send_requests_ok_dispatch_index(monkeypatch):
+    # Given
+    configuration = _create_config_with_tmp_cache()
+    expected = common.create_event_snapshot("cache", [_TEST_START_TS_UTC + 1, _TEST_END_TS_UTC + 1])
+    index = dispatch.DispatchIndex.from_snapshot(
+        expected,
+        start_ts_utc=_TEST_START_TS_UTC,
+        end_ts_utc=_TEST_END_TS_UTC * 2,
+        cache_version=await dispatch.cache_version(configuration.cache_config),
+    )
+    await dispatch.write_index(index, cache_config=configuration.cache_config)
+    called = _mock_entry(monkeypatch)
+    dispatched = []
+
+    async def mocked_dispatch(  # pylint: disable=unused-argument
+        topic_to_pubsub: Dict[str, str],
+        *value: request.ScaleRequest,
+        raise_if_invalid_request: Optional[bool] = True,
+    ) -> None:
+        dispatched.extend(value)
+
+    monkeypatch.setattr(entry.pubsub_dispatcher, _TEST_DISPATCH_NAME, mocked_dispatch)
+    # When
+    await entry.send_requests(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC, configuration=configuration)
+    # Then: no store
+    assert entry._cache_store.__name__ not in called
+    assert dispatched == expected.timestamp_to_request.get(_TEST_START_TS_UTC + 1)
+    # When: stale
+    await entry.send_requests(
+        start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC * 3, configuration=configuration
+    )
+    # Then: store
+    assert entry._cache_store.__name__ in called
+
+
+@pytest.mark.asyncio
+async def test_send_requests_ok_dispatch_index_stale_once_cache_changes(monkeypatch):
+    # Given
+    configuration = _create_config_with_tmp_cache()
+    index = dispatch.DispatchIndex.from_snapshot(
+        common.create_event_snapshot("cache", [_TEST_START_TS_UTC + 1]),
+        start_ts_utc=_TEST_START_TS_UTC,
+        end_ts_utc=_TEST_END_TS_UTC,
+        cache_version=await dispatch.cache_version(configuration.cache_config),
+    )
+    await dispatch.write_index(index, cache_config=configuration.cache_config)
+    called = _mock_entry(monkeypatch)
+    # When: written outside update_cache
+    pathlib.Path(configuration.cache_config.json_line_file).write_text("\n", encoding="utf-8")
+    await entry.send_requests(start_ts_utc=_TEST_START_TS_UTC, end_ts_utc=_TEST_END_TS_UTC, configuration=configuration)
+    # Then: store
+    assert entry._cache_store.__name__ in called
+
+
+_DOWNLOAD: str = "download"
+
+
+class _MyCountingGcs:
+    """In-memory bucket counting the calls per function."""
+
+    def __init__(self):
+        self.objects: Dict[str, bytes] = {}
+        self.generations: Dict[str, int] = {}
+        self.counts: Dict[str, int] = {}
+
+    def _count(self, name: str) -> None:
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def read_object_metadata(self, *, object_path: str, **kwargs) -> Any:  # pylint: disable=unused-argument
+        self._count(gcs.gcs.read_object_metadata.__name__)
+        generation = self.generations.get(object_path)
+        return types.SimpleNamespace(generation=generation) if generation is not None else None
+
+    def read_object(  # pylint: disable=unused-argument
+        self, *, object_path: str, filename: Optional[pathlib.Path] = None, **kwargs
+    ) -> Union[bytes, bool]:
+        self._count(gcs.gcs.read_object.__name__)
+        content = self.objects.get(object_path)
+        if filename is not None:
+            self._count(_DOWNLOAD)
+            if content is not None:
+                filename.write_bytes(content)
+            return content is not None
+        return content
+
+    def write_object(  # pylint: disable=unused-argument
+        self, *, object_path: str, content_source: Union[bytes, pathlib.Path], **kwargs
+    ) -> int:
+        self._count(gcs.gcs.write_object.__name__)
+        if isinstance(content_source, pathlib.Path):
+            content_source = content_source.read_bytes()
+        self.objects[object_path] = content_source
+        self.generations[object_path] = self.generations.get(object_path, 0) + 1
+        return self.generations[object_path]
+
+    def list_objects(self, *, prefix: str, **kwargs) -> List[Any]:  # pylint: disable=unused-argument
+        self._count(gcs.gcs.list_objects.__name__)
+        return [
+            types.SimpleNamespace(name=name, generation=self.generations.get(name))
+            for name in self.objects
+            if name.startswith(prefix)
+        ]
+
+    def delete_object(self, *, object_path: str, **kwargs) -> bool:  # pylint: disable=unused-argument
+        self._count(gcs.gcs.delete_object.__name__)
+        self.generations.pop(object_path, None)
+        return self.objects.pop(object_path, None) is not None
+
+    def patch(self, monkeypatch) -> "_MyCountingGcs":
+        for name in [
+            gcs.gcs.read_object_metadata.__name__,
+            gcs.gcs.read_object.__name__,
+            gcs.gcs.write_object.__name__,
+            gcs.gcs.list_objects.__name__,
+            gcs.gcs.delete_object.__name__,
+        ]:
+            monkeypatch.setattr(gcs.gcs, name, getattr(self, name))
+        return self
+
+
+@pytest.mark.parametrize("is_registry", [True, False])
+@pytest.mark.asyncio
+async def test_update_cache_ok_gcs_calls_per_invocation(monkeypatch, is_registry: bool):
+    # Given
+    fake_gcs = _MyCountingGcs().patch(monkeypatch)
+    local_cache_dir = pathlib.Path(tempfile.mkdtemp())
+    now = int(datetime.utcnow().timestamp())
+    ts_list = [now + 60 * ndx for ndx in range(1, 4)]
+    calendar_snapshot = None
+
+    def store_factory(cache_config: config.CacheConfig) -> base.StoreContextManager:  # pylint: disable=unused-argument
+        return gcs.GcsObjectStoreContextManager(
+            bucket_name="test_bucket", db_object_path="test/cache.db", local_cache_dir=local_cache_dir
+        )
+
+    async def mocked_calendar_snapshot(**kwargs) -> event.EventSnapshot:  # pylint: disable=unused-argument
+        return calendar_snapshot
+
+    store_registry = registry.StoreRegistry(store_factory=store_factory)
+    if is_registry:
+        monkeypatch.setattr(entry, entry._cache_store.__name__, store_registry.lease)
+    else:
+        monkeypatch.setattr(entry, entry._cache_store.__name__, store_factory)
+    monkeypatch.setattr(entry, entry._calendar_snapshot.__name__, mocked_calendar_snapshot)
+    kwargs = dict(start_ts_utc=now, end_ts_utc=ts_list[-1], configuration=common.TEST_CONFIG_LOCAL_JSON)
+    for ndx in range(len(ts_list)):
+        calendar_snapshot = common.create_event_snapshot("calendar", ts_list[: ndx + 1])
+        fake_gcs.counts.clear()
+        # When
+        await entry.update_cache(**kwargs)
+        # Then: a single upload, never a download, the local copy is used
+        # and a metadata read when leasing plus one to re-synchronize before building the dispatch index
+        assert fake_gcs.counts.get(gcs.gcs.read_object_metadata.__name__) == 2
+        assert fake_gcs.counts.get(_DOWNLOAD, 0) == 0
+        assert fake_gcs.counts.get(gcs.gcs.write_object.__name__) == 1
+        # Then: only a kept store does not read its own deltas again
+        if is_registry:
+            assert fake_gcs.counts.get(gcs.gcs.read_object.__name__, 0) == 0
+        else:
+            assert fake_gcs.counts.get(gcs.gcs.read_object.__name__, 0) == max(0, ndx - 1)
+    await store_registry.close()
+    async with store_factory(None) as reader:
+        result = await reader.read(start_ts_utc=ts_list[0], end_ts_utc=ts_list[-1])
+    assert sorted(result.timestamp_to_request) == ts_list